@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+""" Tests for PdPatch and PdObject in pd.py """
+
+import threading
+import pd
+import pdtest
+import pdtree
+from pdexceptions import *
+
+PATCH_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 10 10 osc~ 440;
+#N canvas 0 0 450 300 sub 0;
+#X obj 10 10 inlet;
+#N canvas 0 0 450 300 inner 0;
+#X obj 10 10 f;
+#X restore 10 40 pd inner;
+#X restore 100 100 pd sub;
+#N canvas 0 0 450 300 other 0;
+#X obj 10 10 f;
+#X restore 10 40 pd inner;
+#X connect 0 0 1 0;
+"""
+
+def patch(text = PATCH_TEXT):
+    return pd.PdPatch(text.splitlines(True))
+
+def canvases(p):
+    return [node for (node, obj_id, level) in p.select(element = pd.CANVAS)]
+
+@pdtest.passfail
+def testDigest():
+    (one, two) = (patch(), patch())
+    if one.digest() != two.digest() or one != two:
+        raise pdtest.Unexpected('digest', one.digest(), two.digest())
+
+    # The two "inner" sub-patches have the same content
+    (top, sub, inner, other) = canvases(one)
+    if one.digest(inner) == one.digest(other):
+        raise pdtest.Unexpected('inner', 'differs', 'same')
+
+    before = [one.digest(c) for c in (top, sub, inner, other)]
+    # Changing an object changes the digest of its canvas and those above it
+    f = [n for (n, i, l) in one.select(type = 'f')][0]
+    f.value['type'] = 'i'
+    after = [one.digest(c) for c in (top, sub, inner, other)]
+    changed = [b != a for (b, a) in zip(before, after)]
+    if changed != [True, True, True, False]:
+        raise pdtest.Unexpected('changed', [True, True, True, False], changed)
+    if one == two:
+        raise pdtest.Unexpected('equal', False, True)
+
+    # The digest is of the content, so changing it back restores it
+    f.value['type'] = 'f'
+    if one.digest() != two.digest():
+        raise pdtest.Unexpected('restored', two.digest(), one.digest())
+
+    # Adding to the tree changes the digest too
+    sub.add(pd.PdObject('#X obj 1 1 bang', 0, None))
+    if one.digest(sub) == two.digest(canvases(two)[1]):
+        raise pdtest.Unexpected('added', 'differs', 'same')
+
+@pdtest.passfail
+def testInterner():
+    interner = pd.PdInterner()
+    (one, two) = [pd.PdPatch(PATCH_TEXT.splitlines(True),
+                             interner = interner) for i in range(2)]
+
+    # The two "f" objects in the first patch and those in the second all
+    # share their attributes
+    fs = [n.value for p in (one, two) for (n, i, l) in p.select(type = 'f')]
+    shared = [f.attrs is fs[0].attrs for f in fs]
+    if shared != [True] * 4:
+        raise pdtest.Unexpected('shared', [True] * 4, shared)
+    if interner.hits != 14 or len(interner) != 10:
+        raise pdtest.Unexpected('hits', (14, 10), (interner.hits,
+                                                   len(interner)))
+
+    # Changing a shared object copies it first
+    fs[0]['type'] = 'i'
+    types = [f['type'] for f in fs]
+    if types != ['i', 'f', 'f', 'f'] or fs[1].attrs is not fs[2].attrs:
+        raise pdtest.Unexpected('types', ['i', 'f', 'f', 'f'], types)
+    if one == two or str(two) != PATCH_TEXT:
+        raise pdtest.Unexpected('patches', 'differ', 'same')
+
+@pdtest.passfail
+def testRoundTrip():
+    text = str(patch())
+    if text != PATCH_TEXT:
+        raise pdtest.Unexpected('str', PATCH_TEXT, text)
+
+@pdtest.passfail
+def testLazy():
+    lazy = pd.PdPatch.lazy(PATCH_TEXT)
+    # Only the top level is parsed until a sub-patch is looked at
+    subs = [n for n in lazy.root()[:] if isinstance(n, pdtree.LazyTree)]
+    loaded = [n.loaded() for n in subs]
+    if loaded != [False, False]:
+        raise pdtest.Unexpected('loaded', [False, False], loaded)
+    if len(subs[0]) != 3 or not subs[0].loaded():
+        raise pdtest.Unexpected('sub', 3, len(subs[0]))
+
+    eager = patch()
+    if str(lazy) != PATCH_TEXT or lazy.digest() != eager.digest():
+        raise pdtest.Unexpected('str', PATCH_TEXT, str(lazy))
+    lines = [n.value.line_num for (n, l) in lazy.root()]
+    expected = [n.value.line_num for (n, l) in eager.root()]
+    if lines != expected:
+        raise pdtest.Unexpected('lines', expected, lines)
+
+    # Text whose canvases and restores don't match is parsed as usual
+    text = PATCH_TEXT.replace('#X restore 10 40 pd inner;\n', '', 1)
+    lazy = pd.PdPatch.lazy(text)
+    if str(lazy) != str(patch(text)):
+        raise pdtest.Unexpected('unbalanced', str(patch(text)), str(lazy))
+
+@pdtest.passfail
+def testFreeze():
+    p = pd.PdPatch.lazy(PATCH_TEXT)
+    p.freeze()
+    # Lazy sub-patches are loaded when the patch is frozen
+    if not p.frozen() or str(p) != PATCH_TEXT or \
+       p.digest() != patch().digest():
+        raise pdtest.Unexpected('frozen', PATCH_TEXT, str(p))
+
+    obj = p.root()[0].value
+    try:
+        obj['type'] = 'f'
+        raise pdtest.Unexpected('set', 'PdFrozen', 'no exception')
+    except PdFrozen:
+        pass
+    try:
+        p.root().add(obj)
+        raise pdtest.Unexpected('add', 'TypeError', 'no exception')
+    except TypeError:
+        pass
+
+    # Many threads can read the same frozen patch
+    results = []
+    def read():
+        for i in range(20):
+            results.append((str(p), p.digest()))
+    threads = [threading.Thread(target = read) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if set(results) != set([(PATCH_TEXT, p.digest())]) or len(results) != 80:
+        raise pdtest.Unexpected('threads', 80, len(results))
+
+@pdtest.passfail
+def testClone():
+    p = patch()
+    p.digest()
+    copy = p.clone()
+    if str(copy) != PATCH_TEXT or copy.digest() != p.digest():
+        raise pdtest.Unexpected('clone', PATCH_TEXT, str(copy))
+    nodes = [n for (n, l) in copy.root() if n.value.node is not n]
+    if nodes:
+        raise pdtest.Unexpected('nodes', [], nodes)
+
+    # Changing the copy doesn't change the patch
+    obj = copy.root()[0].value
+    if obj.attrs is not p.root()[0].value.attrs:
+        raise pdtest.Unexpected('shared attrs', True, False)
+    obj['type'] = 'phasor~'
+    if str(p) != PATCH_TEXT or copy.digest() == p.digest():
+        raise pdtest.Unexpected('patch', PATCH_TEXT, str(p))
+    copy.root().add(pd.PdObject('#X obj 10 70 f', 9, None))
+    if len(copy) == len(p):
+        raise pdtest.Unexpected('len', len(p) + 1, len(copy))
+
+    # Frozen and lazy patches give copies which can be changed
+    p.freeze()
+    for q in (p, pd.PdPatch.lazy(PATCH_TEXT)):
+        copy = q.clone()
+        copy.root()[0].value['type'] = 'f'
+        if copy.frozen() or 'obj 10 10 f;' not in str(copy):
+            raise pdtest.Unexpected('copy', 'changed', str(copy))
+
+BAD_TEXT = """#X obj 10 10 f;
+#N canvas 0 0 450 300 10;
+#X obj 10 10 osc~ 440;
+#Q obj 10 40 f;
+#X restore 10 40 pd nothing;
+#N canvas 0 0 450 300 sub 0;
+#X obj 10 10 inlet;
+#X obj 10 40 f
+"""
+
+@pdtest.passfail
+def testTolerant():
+    # Each error is found, and the rest of the patch is read
+    p = pd.PdPatch(BAD_TEXT.splitlines(True), tolerant = True)
+    got = [(d.line_num, d.kind) for d in p.diagnostics]
+    expected = [(0, pd.BEFORE_CANVAS), (3, pd.BAD_LINE),
+                (4, pd.EXTRA_RESTORE), (7, pd.UNTERMINATED),
+                (5, pd.UNCLOSED_CANVAS)]
+    if got != expected:
+        raise pdtest.Unexpected('diagnostics', expected, got)
+    got = [(n.value.name(), obj_id, level) for (n, obj_id, level) in p]
+    expected = [('canvas None', -1, 0), ('osc~', 0, 1), ('canvas sub', 1, 1),
+                ('inlet', 0, 2)]
+    if got != expected:
+        raise pdtest.Unexpected('objects', expected, got)
+
+    try:
+        pd.PdPatch(BAD_TEXT.splitlines(True))
+    except InvalidPdLine:
+        pass
+    else:
+        raise pdtest.Unexpected('strict', 'InvalidPdLine', 'no exception')
+
+def test():
+    testDigest()
+    testInterner()
+    testLazy()
+    testFreeze()
+    testClone()
+    testTolerant()
+    testRoundTrip()
+
+if __name__ == '__main__':
+    test()
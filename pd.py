@@ -4,14 +4,17 @@
 
     PdFile: opens and read Pd patch files
     PdPatch: parsed representation of a Pd patch file
-    PdObject: parsed representation of each Pd element/object"""
+    PdObject: parsed representation of each Pd element/object
+    PdDiagnostic: an error found parsing a patch in tolerant mode
+    PdInterner: shares the parsed objects of identical lines across patches"""
 
+import os
 import sys
+import gc
 import collections
 import pdelement
 import pdtree
 from pdexceptions import *
-import pdtest
 
 __author__ = "Louis A. Dunne"
 __copyright__ = "Copyright 2011, Louis A. Dunne"
@@ -34,12 +37,61 @@ CONNECT = 'connect'
 STRUCT = 'struct'
 OBJ = 'obj'
 ARRAY_DATA = 'array-data'
+DECLARE = 'declare'
+IMPORT = 'import'
+# Both declare and import can be an element (#X declare) or an object
+# (#X obj x y declare)
+DECLARE_ELEMENTS = (DECLARE, IMPORT)
+# declare flags
+(PATH, STDPATH, LIB, STDLIB) = ('-path', '-stdpath', '-lib', '-stdlib')
+LIB_FLAGS = (LIB, STDLIB)
+# The kinds of error a tolerant PdPatch records, see PdDiagnostic
+BAD_LINE = 'bad-line'
+BEFORE_CANVAS = 'before-canvas'
+EXTRA_RESTORE = 'extra-restore'
+UNCLOSED_CANVAS = 'unclosed-canvas'
+UNTERMINATED = 'unterminated-line'
+
+
+class PdDiagnostic(object):
+    """An error found in the patch text at "line_num" (counted from zero)
+       by a tolerant PdPatch. "kind" is one of the kinds above, "text" is
+       the text of the line, which isn't in the patch, and "message"
+       describes the error."""
+
+    def __init__(self, line_num, kind, text, message):
+        (self.line_num, self.kind) = (line_num, kind)
+        (self.text, self.message) = (text, message)
+
+    def __str__(self):
+        return '%d: %s: %s: "%s"' % (self.line_num + 1, self.kind,
+                                     self.message, self.text)
+
+    def __repr__(self):
+        return '<PdDiagnostic %s>' % str(self)
 
 
 class PdObject(object):
-    def __init__(self, text, line_num, includes):
+    # There can be millions of these when a whole library is loaded, so
+    # there's no per-object __dict__
+    __slots__ = ('text', 'line_num', 'node', 'chunk', 'element', 'attr_names',
+                 'attrs', 'extra_params', 'vanilla', 'library', 'include',
+                 '_shared')
+
+    def __init__(self, text, line_num, includes, profile = None):
+        """Parses "text", the line "line_num" of a patch, and looks the
+           object up in "includes" if it isn't vanilla. If a
+           pdprofile.PdProfile is given as "profile" the time spent in the
+           lookups is recorded in it."""
+
         self.text = text
         self.line_num = line_num
+        # The pdtree node holding this object, set when it's added to a
+        # PdPatch. It's told when the object changes, see changed().
+        self.node = None
+        # True while the attrs and extra_params are shared with other
+        # objects by a PdInterner. They're copied before they're changed.
+        self._shared = False
         params = text.split(' ')
         try:
             self.chunk = params[0]
@@ -72,30 +124,113 @@ class PdObject(object):
         except IndexError, ex:
             raise ValueError('Too few values to parse in "%s"' % text)
 
-        (self.attr_names, self.attrs, self.extra_params, self.vanilla) = \
+        if profile is None:
+            (self.attr_names, self.attrs, self.extra_params, self.vanilla) = \
                                     pdelement.get(self.element, params)
+        else:
+            with profile.phase('lookup'):
+                (self.attr_names, self.attrs, self.extra_params,
+                 self.vanilla) = pdelement.get(self.element, params)
+
+        self.lookup(includes, profile)
 
+    def lookup(self, includes, profile = None):
+        """Finds where an object which isn't vanilla comes from. Objects may
+           be defined in an external library's pack. If so its attribute
+           names are used, and there's no need to look for it in the include
+           dirs. The include lookups are recorded in "profile" if one is
+           given."""
+
+        (self.library, self.include) = (None, [])
         if not self.vanilla:
             typ = self.attrs.get('type')
             if typ and includes:
-                self.include = includes.get(typ)
-            else:
-                self.include = []
-        else:
-            self.include = []
+                lib = includes.library(typ)
+                if lib:
+                    self.set_library(*lib)
+                elif profile is None:
+                    self.include = includes.get(typ)
+                else:
+                    with profile.phase('includes'):
+                        self.include = includes.get(typ)
+                    profile.count(self.include and 'includes.hit' or \
+                                  'includes.miss')
+
+    def is_declare(self):
+        """Returns True for "declare" and "import", as elements or
+           objects."""
+
+        return self.element in DECLARE_ELEMENTS or \
+               (self.element == OBJ and self.attrs.get('type') in \
+                DECLARE_ELEMENTS)
 
     def known(self):
-        return self.vanilla or bool(self.include)
+        return self.vanilla or bool(self.library) or bool(self.include)
+
+    def set_library(self, library, lib_attrs = None):
+        """Marks this object as provided by the external "library". If the
+           library's attribute names for the object are known they're given
+           in "lib_attrs" and the attributes are renamed to match."""
+
+        self.library = library
+        if lib_attrs is not None:
+            # decode() makes new attrs, so they're no longer shared
+            self._shared = False
+            params = [self.attrs[k] for k in self.attr_names] + \
+                     self.extra_params
+            (self.attr_names, self.attrs, self.extra_params, vanilla) = \
+                pdelement.decode(pdelement.OBJ_ATTRS + lib_attrs, params,
+                                 False)
+
+    def args(self):
+        """Returns the parameter values in the order they appear in the
+           patch file, after the element name. For 'obj' elements the x, y
+           and type values are not included."""
+
+        vals = [self.attrs[k] for k in self.attr_names \
+                              if self.attrs[k] is not None]
+        if self.extra_params:
+            vals += self.extra_params
+        if self.element == OBJ:
+            vals = vals[pdelement.OBJ_NUM_ATTRS:]
+        return vals
+
+    def share(self, line_num):
+        """Returns a new PdObject for the same text as this one, found at
+           "line_num", which shares this object's parsed attributes. They're
+           copied if either object is changed with __setitem__."""
+
+        obj = PdObject.__new__(PdObject)
+        (obj.text, obj.chunk, obj.element, obj.attr_names, obj.attrs,
+         obj.extra_params, obj.vanilla, obj.library, obj.include) = \
+            (self.text, self.chunk, self.element, self.attr_names, self.attrs,
+             self.extra_params, self.vanilla, self.library, self.include)
+        (obj.line_num, obj.node, obj._shared) = (line_num, None, True)
+        self._shared = True
+        return obj
 
     @staticmethod
-    def factory(lines, includes):
+    def factory(lines, includes, interner = None, first_line = 0,
+                errors = None, profile = None):
         """This is a generator which takes lines of text from a patch file
            and assembles multiple lines into a single logical line. Each
-           line is used to create a PdObject and then yielded to the caller."""
+           line is used to create a PdObject and then yielded to the caller.
+           If a PdInterner is given, objects are made by it. "first_line" is
+           the line number of the first of "lines" in the file. The lookups
+           made for each object are recorded in "profile" if it's given.
+
+           If a list is given as "errors", lines which can't be parsed are
+           skipped and a PdDiagnostic for each is added to it, as is one for
+           any text left at the end without a ';'."""
+
+        if interner is not None:
+            make = interner.get
+        else:
+            make = PdObject
 
         (text, start_line_num) = ('', None)
 
-        for line_num, line in enumerate(lines):
+        for line_num, line in enumerate(lines, first_line):
             line = line.rstrip('\n')
             if line and not line.isspace():
                 if start_line_num is None:
@@ -113,12 +248,28 @@ class PdObject(object):
                 if len(text) > 1 and text[-1] == ';' and text[-2] != '\\':
 
                     # Now we have a full logical Pd object (drop the ";" char)
-                    yield PdObject(text[:-1], start_line_num, includes)
+                    if errors is None:
+                        yield make(text[:-1], start_line_num, includes,
+                                   profile)
+                    else:
+                        try:
+                            obj = make(text[:-1], start_line_num, includes,
+                                       profile)
+                        except ValueError, ex:
+                            errors.append(PdDiagnostic(start_line_num,
+                                                       BAD_LINE, text[:-1],
+                                                       str(ex)))
+                        else:
+                            yield obj
 
                     # When we come back into the generator we need start a new
                     # object
                     start_line_num = None
 
+        if errors is not None and start_line_num is not None:
+            errors.append(PdDiagnostic(start_line_num, UNTERMINATED, text,
+                                       'No ";" at the end of the line'))
+
     def __getitem__(self, attr_name):
         """Access Pd attributes by name. Raises exception if not found."""
         if attr_name == 'element':
@@ -139,8 +290,12 @@ class PdObject(object):
            May also allow the constaints to be relaxed, perhaps in a
            transaction for bundling up a bunch of changes that would otherwise
            result in an invalid patch during the intermediate changes, but
-           would be valid once all changes are complete."""
+           would be valid once all changes are complete.
 
+           Raises PdFrozen if the object is in a frozen PdPatch."""
+
+        if self.node is not None and self.node.frozen:
+            raise PdFrozen('The patch')
         if attr_name == 'element':
             self.element = attr_value
         elif attr_name == 'chunk':
@@ -149,9 +304,22 @@ class PdObject(object):
             raise AttributeError('Cannot set PdObject.vanilla. It is a ' \
                                  'read-only value')
         else:
+            if self._shared:
+                (self.attrs, self.extra_params) = (dict(self.attrs),
+                                                   list(self.extra_params))
+                self._shared = False
             self.attrs[attr_name] = attr_value
+        self.changed()
         return self
 
+    def changed(self):
+        """Drops the content digests of the canvases holding this object.
+           This is done by __setitem__, and must be called after changing
+           the object any other way."""
+
+        if self.node is not None:
+            self.node.invalidate()
+
     def get(self, attr_name):
         """Access Pd attributes by name. Returns None if not found."""
         if attr_name == 'element':
@@ -230,26 +398,98 @@ class PdPatch(object):
        filter built-in can be used with any callable to select objects.  See
        example in the documentation for the select() method."""
 
-    def __init__(self, patch_text, includes = None):
+    def __init__(self, patch_text, includes = None, profile = None,
+                 dirname = None, interner = None, tolerant = False):
         """Create a PdPatch object from the textual description given in
-           "patch_text"."""
+           "patch_text". If a pdprofile.PdProfile is given as "profile" the
+           time spent parsing and building the tree is recorded in it. If a
+           PdInterner is given, objects are shared with the other patches
+           loaded with it.
+
+           "dirname" is the directory of the patch file, used to find the
+           directories it declares. The current directory is used if it is
+           not given.
+
+           If the patch declares its own search path, "includes" is replaced
+           by a view of the given includes with those directories first.
+
+           With "tolerant", lines which can't be parsed or which don't fit
+           in the patch are left out, rather than raising an exception, and
+           a PdDiagnostic for each is added to the "diagnostics" list.
+           Sub-patches without a restore end at the end of the patch.
+           PdInvalidPatch is still raised if there's no canvas at all."""
 
         self.patch_text = patch_text
         self.includes = includes
-
-        factory = PdObject.factory(patch_text, includes)
+        self.dirname = dirname
+        self.diagnostics = []
+        errors = None
+        if tolerant:
+            errors = self.diagnostics
+
+        factory = PdObject.factory(patch_text, includes, interner,
+                                   errors = errors, profile = profile)
+
+        if profile is None:
+            self._build(factory, errors)
+            self._resolve_declares()
+        else:
+            # Parse everything up front so that parsing and tree building
+            # can be timed separately.
+            with profile.phase('parse'):
+                objects = list(factory)
+            profile.count('objects', len(objects))
+            with profile.phase('tree'):
+                self._build(iter(objects), errors)
+            with profile.phase('declares'):
+                self._resolve_declares()
+
+    @classmethod
+    def from_objects(cls, objects, includes = None, dirname = None):
+        """Makes a PdPatch from PdObjects which have already been made, in
+           the order they appear in a patch file. See PdPatch() for
+           "includes" and "dirname"."""
+
+        patch = cls.__new__(cls)
+        (patch.patch_text, patch.includes, patch.dirname) = (None, includes,
+                                                             dirname)
+        patch.diagnostics = []
+        patch._build(iter(objects))
+        patch._resolve_declares()
+        return patch
+
+    def _build(self, factory, errors = None):
+        """Builds the tree from the PdObjects yielded by "factory". If a
+           list is given as "errors", objects which don't fit in the tree
+           are left out and a PdDiagnostic for each is added to it."""
 
         # First line should be a canvas or we can have one or more struct
         # definitions then the canvas.
         self.structs = []
         self.canvas = None
+        # The declare and import objects, and objects which aren't vanilla,
+        # which may need to be looked up again with the declared search path
+        # and libraries.
+        self.declares = []
+        self._externals = []
+        # The objects which may send to or receive from symbols, for
+        # pdsymbols
+        self._symbols = []
+        self._lazy = False
 
         while not self.canvas:
-            o = factory.next()
+            try:
+                o = factory.next()
+            except StopIteration:
+                raise PdInvalidPatch('No starting canvas definition found')
             if o.element == CANVAS:
                 self.canvas = o
             elif o.element == STRUCT:
                 self.structs.append(o)
+            elif errors is not None:
+                errors.append(PdDiagnostic(o.line_num, BEFORE_CANVAS, o.text,
+                                           'Only structs can come before ' \
+                                           'the first canvas'))
             else:
                 raise InvalidPdLine(o.text, o.line_num)
 
@@ -259,12 +499,14 @@ class PdPatch(object):
         # We need to store each object in a tree so that we can keep track
         # of sub-patches
         self._tree = pdtree.SimpleTree(self.canvas)
+        self.canvas.node = self._tree
 
         cur_node = self._tree
         for obj in factory:
             if obj.element == CANVAS:
                 # Add a branch when a encounter a canvas
                 branch = pdtree.SimpleTree(obj)
+                obj.node = branch
                 cur_node.addBranch(branch)
                 cur_node = branch
             elif obj.element == RESTORE and obj.name() != RESTORE:
@@ -273,10 +515,238 @@ class PdPatch(object):
                 # they don't have a name. These are "#C restore;" lines
                 # which don't seem to serve any real purpose, so we ignore
                 # them
-                cur_node.add(obj)
+                if cur_node.parent is None and errors is not None:
+                    # The top level canvas has no restore
+                    errors.append(PdDiagnostic(obj.line_num, EXTRA_RESTORE,
+                                               obj.text, 'Restore with no ' \
+                                               'sub-patch to end'))
+                    continue
+                obj.node = cur_node.add(obj)
                 cur_node = cur_node.parent
             else:
-                cur_node.add(obj)
+                self._add(cur_node, obj)
+
+        if errors is not None:
+            while cur_node is not self._tree:
+                obj = cur_node.value
+                errors.append(PdDiagnostic(obj.line_num, UNCLOSED_CANVAS,
+                                           obj.text, 'Sub-patch has no ' \
+                                           'restore'))
+                cur_node = cur_node.parent
+
+    def _add(self, node, obj):
+        """Adds "obj" to the canvas "node", and to the lists of objects
+           the patch keeps."""
+
+        obj.node = node.add(obj)
+        self._index(obj)
+
+    def _index(self, obj):
+        # Adds "obj" to the lists of objects the patch keeps. Canvases and
+        # restores are in none of them.
+        if obj.element == OBJ and not obj.vanilla:
+            self._externals.append(obj)
+        elif obj.is_declare():
+            self.declares.append(obj)
+        # Checking the attribute names finds the objects which may use
+        # symbols without decoding objects which are decoded lazily
+        if obj.attr_names in pdelement.SYMBOL_ATTR_NAMES or \
+           obj.element in pdelement.SYMBOL_ELEMENTS:
+            self._symbols.append(obj)
+
+    @classmethod
+    def lazy(cls, data, includes = None, dirname = None, interner = None):
+        """Makes a PdPatch from "data", the text of a patch file, parsing
+           only the objects of the top level canvas. The objects of each
+           sub-patch are parsed the first time they're used, through the
+           tree, select() or iterating over the patch. See PdPatch() for the
+           other arguments.
+
+           The sub-patches are found by a quick scan of the text for the
+           lines which start and end them. If they don't balance the whole
+           patch is parsed, so that the usual errors are raised."""
+
+        # The top level canvas is the first, and isn't restored
+        root = data.find(CANVAS_START)
+        while root > 0 and data[root - 1] != '\n':
+            root = data.find(CANVAS_START, root + 1)
+        subs = None
+        if root != -1:
+            line_num = data.count('\n', 0, root)
+            (inner, lines) = _record_end(data, root)
+            root = _CanvasRange(root, line_num, inner, line_num + lines)
+            subs = _scan_canvases(data, inner, len(data), line_num + lines)
+        if subs is None:
+            return cls(data.splitlines(True), includes, dirname = dirname,
+                       interner = interner)
+
+        patch = cls.__new__(cls)
+        (patch.patch_text, patch.includes, patch.dirname) = (None, includes,
+                                                             dirname)
+        (patch._data, patch._interner) = (data, interner)
+        patch.diagnostics = []
+        (patch.structs, patch.declares) = ([], [])
+        (patch._externals, patch._symbols) = ([], [])
+        patch._lazy = True
+
+        for obj in patch._parse(0, root.start, 0):
+            if obj.element != STRUCT:
+                raise InvalidPdLine(obj.text, obj.line_num)
+            patch.structs.append(obj)
+        patch.canvas = patch._parse(root.start, root.inner, root.line).next()
+        patch._tree = pdtree.SimpleTree(patch.canvas)
+        patch.canvas.node = patch._tree
+        patch._add_range(patch._tree, root.inner, root.inner_line, len(data),
+                         subs)
+        patch._resolve_declares()
+        return patch
+
+    def _parse(self, start, end, line_num):
+        # Yields the objects of the text from "start" to "end" of the data
+        # of a lazy patch
+        return PdObject.factory(self._data[start:end].splitlines(True),
+                                self.includes, self._interner, line_num)
+
+    def _add_range(self, node, start, line_num, end, subs):
+        """Adds the objects of the text from "start" to "end" to the canvas
+           "node", with the sub-patches in it, the _CanvasRanges "subs", as
+           LazyTree nodes which are parsed when they're used."""
+
+        for sub in subs:
+            for obj in self._parse(start, sub.start, line_num):
+                self._add(node, obj)
+            canvas = self._parse(sub.start, sub.inner, sub.line).next()
+            canvas.node = pdtree.LazyTree(canvas, lambda n, sub = sub: \
+                                          self._load(n, sub))
+            node.addBranch(canvas.node)
+            (start, line_num) = (sub.end, sub.end_line)
+
+        for obj in self._parse(start, end, line_num):
+            self._add(node, obj)
+
+    def _load(self, node, sub):
+        # Called the first time the objects of the sub-patch "node" are used
+        first = len(self._externals)
+        # The whole patch was checked to balance before
+        subs = _scan_canvases(self._data, sub.inner, sub.restore,
+                              sub.inner_line)
+        self._add_range(node, sub.inner, sub.inner_line, sub.restore, subs)
+        restore = self._parse(sub.restore, sub.end, sub.restore_line).next()
+        restore.node = node.add(restore)
+        if self.declares and self.includes:
+            # The objects were made with the patch's own search path, but may
+            # be in the libraries it loads
+            self._resolve_libraries(self._externals[first:])
+
+    def declarations(self):
+        """Returns a list of (flag, value) tuples for each "declare" in the
+           patch, in the order they appear, e.g. ('-path', 'lib/abs'). Each
+           library loaded with "import" is given as a "-lib" declaration."""
+
+        decls = []
+        for obj in self.declares:
+            args = obj.args()
+            if obj.element == IMPORT or obj.get('type') == IMPORT:
+                decls.extend([(LIB, lib) for lib in args])
+            else:
+                # declare takes pairs of flag and value
+                decls.extend(zip(args[::2], args[1::2]))
+        return decls
+
+    def libraries(self):
+        """Returns a list of the libraries loaded by the patch with
+           "declare -lib", "declare -stdlib" or "import", in the order they
+           appear in the patch."""
+
+        return [value for (flag, value) in self.declarations() \
+                if flag in LIB_FLAGS]
+
+    def search_path(self):
+        """Returns the list of directories added to the search path by the
+           patch's declarations, in the order they appear. "-path" and "-lib"
+           are relative to the patch's directory, "-stdpath" and "-stdlib"
+           are relative to the Pd install dir (or its "extra" dir), which is
+           taken from the patch's PdIncludes."""
+
+        pd_root = self.includes and self.includes.pd_root
+        dirs = []
+        for (flag, value) in self.declarations():
+            if flag in LIB_FLAGS:
+                # Libraries given with a path add their directory, so that
+                # the library can be found
+                value = os.path.dirname(value)
+                if not value:
+                    continue
+            if flag in (PATH, LIB):
+                path = os.path.join(self.dirname or os.getcwd(), value)
+            elif flag in (STDPATH, STDLIB) and pd_root:
+                path = os.path.join(pd_root, value)
+                if not os.path.isdir(path):
+                    path = os.path.join(pd_root, 'extra', value)
+            else:
+                continue
+
+            path = os.path.normpath(path)
+            if path not in dirs:
+                dirs.append(path)
+        return dirs
+
+    def _resolve_declares(self):
+        """Resolves objects against the patch's own search path and the
+           libraries it loads.
+
+           Directories added by "declare" are searched before the rest of the
+           search path, so all objects which aren't vanilla are looked up
+           again in a view of the includes with those directories first.
+           Objects still not found may be provided by the libraries loaded by
+           the patch. These are looked up first in the object definition
+           packs, then in the symbols of the compiled externals."""
+
+        # The objects of a lazy patch not parsed yet are made with the
+        # patch's includes, so those are set up even if there are no
+        # objects to resolve now
+        if not (self.declares and self.includes) or \
+           not (self._externals or self._lazy):
+            return
+
+        paths = self.search_path()
+        if paths:
+            self.includes = self.includes.layer(paths)
+            for obj in self._externals:
+                typ = obj.attrs.get('type')
+                if typ and not obj.library:
+                    obj.include = self.includes.get(typ)
+
+        self._resolve_libraries(self._externals)
+
+    def _resolve_libraries(self, externals):
+        """Looks up the objects "externals" not found in the includes in
+           the libraries the patch loads."""
+
+        libs = self.libraries()
+        provided = None
+        for obj in externals:
+            typ = obj.attrs.get('type')
+            if not typ or obj.library or obj.include:
+                continue
+
+            lib = libs and self.includes.library(typ, libs)
+            if lib:
+                obj.set_library(*lib)
+                continue
+
+            if provided is None:
+                # Only read the externals when there's something to find.
+                # Where more than one library provides an object, the first
+                # library loaded wins.
+                provided = {}
+                for lib in libs:
+                    for name in self.includes.library_objects(lib):
+                        provided.setdefault(name, lib)
+
+            lib = provided.get(typ)
+            if lib:
+                obj.set_library(lib)
 
     def __len__(self):
         return len(self._tree)
@@ -328,7 +798,12 @@ class PdPatch(object):
         return False
 
     def __str__(self):
-        return ';\r\n'.join(str(node.value) for node in self)
+        """Returns the patch in the Pd file format. Every line, including
+           the last, is terminated with ';' so the text can be written
+           straight to a patch file."""
+
+        objs = self.structs + [node.value for (node, obj_id, level) in self]
+        return ''.join(['%s;\n' % str(obj) for obj in objs])
 
     def __iter__(self):
         # The object ids must be generated dynamically, as they change when
@@ -368,6 +843,115 @@ class PdPatch(object):
     def apply(self, fn):
         return self._tree.apply(fn)
 
+    def clone(self, replace = None):
+        """Returns a copy of the patch which can be changed without changing
+           this one. The objects of the copy share their parsed attributes
+           with the objects of this patch, and are copied as they're changed
+           (see PdObject.share()), so only the tree is made again. This is
+           much cheaper than parsing the patch again or copy.deepcopy().
+           Lazy sub-patches are loaded first. The copy isn't frozen, even if
+           this patch is.
+
+           "replace" is an optional dict of objects in the tree of this
+           patch to new PdObjects, made with the patch's includes, to use in
+           their place in the copy. Objects which start or end a canvas must
+           be replaced by objects which do the same, and replacing a declare
+           doesn't change the directories the objects are found in."""
+
+        patch = self.__class__.__new__(self.__class__)
+        (patch.patch_text, patch.includes, patch.dirname) = \
+            (self.patch_text, self.includes, self.dirname)
+        patch.diagnostics = list(self.diagnostics)
+        patch.structs = [obj.share(obj.line_num) for obj in self.structs]
+        (patch.declares, patch._externals, patch._symbols) = ([], [], [])
+        patch._lazy = False
+
+        replaced = []
+        def copy(obj, node):
+            new = None
+            if replace:
+                new = replace.get(obj)
+            if new is None:
+                new = obj.share(obj.line_num)
+            else:
+                replaced.append(new)
+            new.node = node
+            # The objects are copied in the order they're added by _build(),
+            # so the lists are the same as this patch's
+            patch._index(new)
+            return new
+
+        # Every object made is kept, so the garbage collector's passes over
+        # them would only take time, as when loading a binary patch
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            patch._tree = self._tree.copy(copy)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        patch.canvas = patch._tree.value
+        for obj in replaced:
+            obj.changed()
+        if replaced and patch.declares and patch.includes:
+            patch._resolve_libraries([obj for obj in replaced \
+                                      if obj.element == OBJ and \
+                                         not obj.vanilla])
+        return patch
+
+    def freeze(self):
+        """Stops the patch being changed, so that it can be used by many
+           threads at once. Any sub-patches of a lazy patch not yet parsed
+           are parsed, and the digests are worked out, so using the patch
+           never changes it. Changing an object with __setitem__ or changing
+           the tree then raises PdFrozen or TypeError. Objects changed any
+           other way, such as through their attrs, aren't caught.
+
+           clone() makes copies of a frozen patch which can be changed. The
+           patch's PdIncludes has its own freeze()."""
+
+        self._tree.freeze()
+
+    def frozen(self):
+        return self._tree.frozen
+
+    def digest(self, node = None):
+        """Returns a hex digest of the content of the patch, or of the canvas
+           "node" in the patch's tree and everything in it. Digests are kept
+           in the tree until something in the canvas changes, so they're a
+           cheap way to see whether a patch or sub-patch has changed, or to
+           key cached results. Patches with the same content have the same
+           digest."""
+
+        if node is None:
+            node = self._tree
+        return node.digest().encode('hex')
+
+    def __eq__(self, other):
+        """Patches are equal if their content is the same, as given by
+           digest(). The struct definitions are compared too."""
+
+        if not isinstance(other, PdPatch):
+            return NotImplemented
+        return self._tree.digest() == other._tree.digest() and \
+               [str(s) for s in self.structs] == \
+               [str(s) for s in other.structs]
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    # Patches can change, so they can't be hashed
+    __hash__ = None
+
+    def root(self):
+        """Returns the root node of the patch's tree. Its value is the top
+           level canvas and each sub-patch is a branch below it."""
+
+        return self._tree
+
     def add(self, key, value):
         raise NotImplementedError('Not implemented yet')
 
@@ -387,36 +971,273 @@ class PdPatch(object):
 
         return selected
 
+class _CanvasRange(object):
+    """The position of a sub-patch in the text of a patch file, found by
+       _scan_canvases(). "start", "inner", "restore" and "end" are the
+       offsets of its canvas line, its first object, its restore line and
+       the end of the restore line, each with its line number."""
+
+    __slots__ = ('start', 'line', 'inner', 'inner_line', 'restore',
+                 'restore_line', 'end', 'end_line')
+
+    def __init__(self, start, line, inner, inner_line):
+        (self.start, self.line, self.inner, self.inner_line) = (start, line,
+                                                               inner,
+                                                               inner_line)
+
+def _record_end(data, pos):
+    """Returns the offset of the end of the Pd line starting at "pos" in
+       "data", after its newline, and the number of newlines in it."""
+
+    lines = 0
+    while True:
+        nl = data.find('\n', pos)
+        if nl == -1:
+            return (len(data), lines)
+        lines += 1
+        # The same test for the end of a line as PdObject.factory()
+        if nl - pos > 1 and data[nl - 1] == ';' and data[nl - 2] != '\\':
+            return (nl + 1, lines)
+        pos = nl + 1
+
+CANVAS_START = '%s %s ' % (NCHUNK, CANVAS)
+CANVAS_END = '%s %s ' % (XCHUNK, RESTORE)
+
+def _scan_canvases(data, start, end, line_num):
+    """Returns the _CanvasRanges of the sub-patches in the text of a patch
+       file "data" from "start" to "end", which starts at line "line_num".
+       Sub-patches inside these aren't returned. Returns None if the canvas
+       and restore lines don't balance.
+
+       Only the lines which start and end canvases are looked at, found with
+       str.find(), so this is much quicker than parsing the text."""
+
+    events = []
+    for (tag, opens) in ((CANVAS_START, True), (CANVAS_END, False)):
+        pos = data.find(tag, start, end)
+        while pos != -1:
+            if pos == 0 or data[pos - 1] == '\n':
+                events.append((pos, opens))
+            pos = data.find(tag, pos + 1, end)
+    events.sort()
+
+    (found, depth, last) = ([], 0, start)
+    for (pos, opens) in events:
+        if opens:
+            depth += 1
+            if depth > 1:
+                continue
+            line_num += data.count('\n', last, pos)
+            last = pos
+            (inner, lines) = _record_end(data, pos)
+            found.append(_CanvasRange(pos, line_num, inner, line_num + lines))
+        else:
+            depth -= 1
+            if depth < 0:
+                return None
+            elif depth > 0:
+                continue
+            line_num += data.count('\n', last, pos)
+            last = pos
+            r = found[-1]
+            (end, lines) = _record_end(data, pos)
+            (r.restore, r.restore_line, r.end, r.end_line) = \
+                (pos, line_num, end, line_num + lines)
+
+    if depth != 0:
+        return None
+    return found
+
+def read_lines(filename):
+    """Returns the lines of the patch file "filename"."""
+
+    fd = None
+    try:
+        # It's easier and quicker to read the whole file at one and then
+        # parse it, but here we use readlines() for the convenience of
+        # knowing the original line numbers in the file in case we need to
+        # report errors.
+
+        # We use the universal file reader to cope with unix and dos
+        # line endings. This means we'll look for lines ending in ';\n'
+        # to mark the end of logical Pd lines.
+        fd = open(filename, 'U')
+        return fd.readlines()
+    finally:
+        if fd:
+            fd.close()
+        # let exceptions propagate up
+
+
 class PdFile(object):
     """Abstraction for a Pd format patch file."""
 
-    def __init__(self, filename, includes = None):
+    def __init__(self, filename, includes = None, profile = None,
+                 lines = None, interner = None, lazy = False,
+                 tolerant = False):
+        """Reads and parses "filename". If a pdprofile.PdProfile is given as
+           "profile" the time spent reading and parsing the file, and the
+           number of bytes read, are recorded against the file name.
+
+           If the "lines" of the file have already been read they can be
+           given, and the file isn't read again. "interner" is an optional
+           PdInterner, see PdPatch.
+
+           With "lazy" only the top level canvas is parsed when the file is
+           read, see PdPatch.lazy(). "lines" and "profile" aren't used, and
+           "lines" is None.
+
+           With "tolerant" errors in the file are recorded in the patch's
+           diagnostics rather than raised, see PdPatch. "lazy" isn't used
+           then, as errors in sub-patches would only be found when they're
+           used."""
+
         self.filename = filename
         self.includes = includes
 
-        fd = None
+        if lazy and not tolerant:
+            self.lines = None
+            fd = open(filename, 'U')
+            try:
+                data = fd.read()
+            finally:
+                fd.close()
+            self.patch = PdPatch.lazy(data, includes,
+                    os.path.dirname(os.path.abspath(filename)), interner)
+            return
+
+        # The caller may already be recording this file, e.g. to include
+        # its own output time. Otherwise record it here.
+        own_record = profile is not None and not profile.recording()
+        if own_record:
+            profile.begin(filename)
+
         try:
-            # It's easier and quicker to read the whole file at one and then
-            # parse it, but here we use readlines() for the convenience of
-            # knowing the original line numbers in the file in case we need to
-            # report errors.
-
-            # We use the universal file reader to cope with unix and dos
-            # line endings. This means we'll look for lines ending in ';\n'
-            # to mark the end of logical Pd lines.
-            fd = open(self.filename, 'U')
-            self.lines = fd.readlines()
+            if lines is not None:
+                self.lines = lines
+            elif profile is None:
+                self.lines = self._read()
+            else:
+                with profile.phase('read'):
+                    self.lines = self._read()
+                profile.count('bytes', sum([len(l) for l in self.lines]))
+
+            # Parse all lines creating a patch object.
+            self.patch = PdPatch(self.lines, self.includes, profile,
+                    os.path.dirname(os.path.abspath(filename)), interner,
+                    tolerant)
         finally:
-            if fd:
-                fd.close()
-            # let exceptions propagate up
+            if own_record:
+                profile.end()
 
-        # Parse all lines creating a patch object.
-        self.patch = PdPatch(self.lines, self.includes)
+    def _read(self):
+        return read_lines(self.filename)
 
     def __str__(self):
         return str(self.patch)
 
+    def abstractions(self):
+        """Returns a dict of the abstractions used by the patch, from the
+           object type to the path of the abstraction's patch file. Only
+           abstractions found in the patch's includes are returned. Where an
+           abstraction is found in more than one directory, the first in
+           sorted order is used."""
+
+        found = {}
+        for obj in self.patch._externals:
+            typ = obj.attrs.get('type')
+            if typ in found or not obj.include:
+                continue
+            name = os.path.basename(typ) + '.pd'
+            for d in sorted(obj.include):
+                path = os.path.join(d, name)
+                if os.path.isfile(path):
+                    found[typ] = path
+                    break
+        return found
+
+
+class PdInterner(object):
+    """Shares the parsed content of identical lines across all the patches
+       loaded with it. Copy-pasted sub-patches and the same abstractions
+       loaded many times then cost little more memory than one copy.
+
+       Each PdObject is still a separate object in its own patch, but
+       objects parsed from the same text share their attributes, and the
+       attribute values of different objects (object types, send and
+       receive names etc) are interned. A shared object is copied before
+       it's changed, so changing an object in one patch never changes
+       another. Lines are only parsed the first time they're seen, so
+       loading repeated content is faster too.
+
+       Objects are looked up by their text and the PdIncludes used to
+       resolve them, as objects of the same type can be found in different
+       places by different patches."""
+
+    def __init__(self):
+        self._objects = {}
+        (self.hits, self.misses) = (0, 0)
+
+    def __len__(self):
+        return len(self._objects)
+
+    def get(self, text, line_num, includes, profile = None):
+        """Returns a PdObject for "text" at "line_num", sharing the parsed
+           attributes of any earlier object with the same text. See
+           PdObject() for "profile"."""
+
+        key = (text, includes)
+        proto = self._objects.get(key)
+        if proto is None:
+            # Most lines in a patch are unique, so misses are common
+            proto = PdObject(intern(text), line_num, includes, profile)
+            self._intern(proto)
+            self._objects[key] = proto
+            self.misses += 1
+        else:
+            self.hits += 1
+        return proto.share(line_num)
+
+    def _intern(self, obj):
+        if obj.element == ARRAY_DATA:
+            # Array values are rarely repeated
+            return
+        obj.element = intern(obj.element)
+        attrs = obj.attrs
+        for k in obj.attr_names:
+            v = attrs[k]
+            if v is not None:
+                attrs[k] = intern(v)
+        if obj.extra_params:
+            obj.extra_params = map(intern, obj.extra_params)
+
+    def clear(self):
+        """Forgets the objects seen so far. Objects already made keep
+           sharing their attributes."""
+
+        self._objects.clear()
+
+
+def load_recursive(filename, includes = None, profile = None,
+                   interner = None):
+    """Loads the patch "filename", every abstraction it uses, the
+       abstractions those use and so on. Returns a dict of the absolute path
+       of each patch file loaded to its PdFile. Each file is loaded once
+       however many times it is used. "interner" is an optional PdInterner
+       used for every file loaded."""
+
+    loaded = {}
+    pending = [os.path.abspath(filename)]
+    while pending:
+        path = pending.pop()
+        if path in loaded:
+            continue
+        f = PdFile(path, includes, profile, interner = interner)
+        loaded[path] = f
+        pending.extend([os.path.abspath(p) for p in \
+                        f.abstractions().itervalues()])
+    return loaded
+
 
 
 ##### MAIN #####
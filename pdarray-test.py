@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+""" Tests for pdarray.py """
+
+import os
+import array
+import tempfile
+import pd
+import pdarray
+import pdbin
+import pdtest
+
+PATCH_TEXT = """#N canvas 0 0 450 300 10;
+#N canvas 0 0 450 300 (subpatch) 0;
+#X array tab 6 float 3;
+#A 0 0 0.5 -0.5;
+#A 3 1 -1 0.25;
+#X coords 0 1 5 -1 200 140 1;
+#X restore 10 10 graph;
+#N canvas 0 0 450 300 (subpatch) 0;
+#X array gap 4 float 3;
+#A 1 0.75;
+#X coords 0 1 3 -1 200 140 1;
+#X restore 10 200 graph;
+"""
+
+VALUES = array.array('f', [0, 0.5, -0.5, 1, -1, 0.25])
+
+def patch():
+    return pd.PdPatch(PATCH_TEXT.splitlines(True))
+
+@pdtest.passfail
+def testFloats():
+    (tab, gap) = pdarray.arrays(patch())
+    if (tab.name, len(tab), tab.floats()) != ('tab', 6, VALUES):
+        raise pdtest.Unexpected('tab', ('tab', 6, VALUES),
+                                (tab.name, len(tab), tab.floats()))
+    # Values not saved are 0
+    expected = array.array('f', [0, 0.75, 0, 0])
+    if gap.floats() != expected:
+        raise pdtest.Unexpected('gap', expected, gap.floats())
+
+    if str(tab.buffer()) != VALUES.tostring() or \
+       tab.memoryview().tobytes() != VALUES.tostring():
+        raise pdtest.Unexpected('buffer', VALUES.tostring(),
+                                str(tab.buffer()))
+
+@pdtest.passfail
+def testLoadedViews():
+    # The values of a patch loaded from the binary format are viewed, not
+    # copied
+    data = pdbin.dumps(patch())
+    tab = pdarray.arrays(pdbin.loads(data))[0]
+    loaded = tab._loaded()
+    if loaded is None or loaded[0] is not data:
+        raise pdtest.Unexpected('loaded', 'view of the data', loaded)
+    if tab.memoryview().tobytes() != VALUES.tostring():
+        raise pdtest.Unexpected('view', VALUES.tostring(),
+                                tab.memoryview().tobytes())
+    if tab.floats() != VALUES:
+        raise pdtest.Unexpected('floats', VALUES, tab.floats())
+
+@pdtest.passfail
+def testWav():
+    (fd, filename) = tempfile.mkstemp(suffix = '.wav')
+    os.close(fd)
+    try:
+        for (arr, expected) in zip(pdarray.arrays(patch()),
+                                   (VALUES, array.array('f', [0, .75, 0, 0]))):
+            arr.write_wav(filename, rate = 22050)
+            (floats, rate) = pdarray.read_wav(filename)
+            got = [round(f, 4) for f in floats]
+            if (got, rate) != ([round(f, 4) for f in expected], 22050):
+                raise pdtest.Unexpected('wav', list(expected), got)
+    finally:
+        os.remove(filename)
+
+@pdtest.passfail
+def testSetValues():
+    p = patch()
+    tab = pdarray.arrays(p)[0]
+    values = array.array('f', [0.125 * i for i in range(9)])
+    tab.set_values(values, chunk_size = 4)
+
+    got = [o.text for o in tab.chunks()]
+    expected = ['#A 0 0 0.125 0.25 0.375', '#A 4 0.5 0.625 0.75 0.875',
+                '#A 8 1']
+    if got != expected:
+        raise pdtest.Unexpected('chunks', expected, got)
+    if (len(tab), tab.floats()) != (9, values):
+        raise pdtest.Unexpected('values', (9, values),
+                                (len(tab), tab.floats()))
+    # The new values are written out with the patch
+    text = str(pd.PdPatch(str(p).splitlines(True)))
+    if text != str(p) or '#X array tab 9 float 3' not in text:
+        raise pdtest.Unexpected('patch', str(p), text)
+
+@pdtest.passfail
+def testSelect():
+    # The element type of an array isn't taken for an object's type
+    p = pd.PdPatch((PATCH_TEXT + '#X obj 10 50 float;\n').splitlines(True))
+    got = [n.value.element for (n, i, l) in p.select(type = 'float')]
+    if got != [pd.OBJ]:
+        raise pdtest.Unexpected('select', [pd.OBJ], got)
+    got = [n.value['elem_type'] for (n, i, l) in p.select(element = 'array')]
+    if got != ['float', 'float']:
+        raise pdtest.Unexpected('elem_type', ['float', 'float'], got)
+
+def test():
+    testFloats()
+    testLoadedViews()
+    testWav()
+    testSetValues()
+    testSelect()
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+
+""" Reads and writes the values of the arrays saved in Pd patches.
+
+    PdArray: an array ("#X array") and the values saved with it ("#A")
+    arrays(): returns the PdArrays of a patch
+    read_wav(): reads the samples of a WAV file
+
+The values of an array are saved in the patch as "#A" lines following the
+array, each with the index of its first value. PdArray turns these into 32
+bit floats one line at a time, so a list of python floats for the whole
+array is never made:
+
+    for arr in pdarray.arrays(patch):
+        samples = arr.numpy()
+        arr.write_wav(arr.name + '.wav')
+
+For patches loaded with pdbin the values are already floats. Where all of an
+array's values are stored together in the loaded data, which they are unless
+they've been changed, buffer(), memoryview() and numpy() return views of the
+loaded data and nothing is copied.
+
+set_values() replaces the values saved with an array, from any sequence of
+numbers, including the arrays returned by read_wav() and numpy().
+
+NumPy is only needed for numpy()."""
+
+import sys
+import array
+import wave
+from itertools import imap
+import pd
+import pdbin
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+ARRAY = 'array'
+
+# Pd saves this many values on each "#A" line
+CHUNK_SIZE = 1000
+
+# The bit of the save flag which saves the array's values with the patch
+SAVE_VALUES = 1
+
+# The array type codes and largest values of each WAV sample width
+WAV_FORMATS = {1: ('B', 127), 2: ('h', 32767), 4: ('i', 2147483647)}
+WAV_RATE = 44100
+
+
+def _to_int(value, default = 0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def _chunk_floats(obj):
+    """Returns the values of the array data "obj" as an array of 32 bit
+       floats."""
+
+    if isinstance(obj, pdbin.PdArrayData):
+        return obj.floats()
+    values = obj.extra_params
+    if obj.attrs.get('values') is not None:
+        values = [obj.attrs['values']] + values
+    return array.array('f', imap(float, values))
+
+def _start(obj):
+    # The index of the first value of the array data "obj"
+    if isinstance(obj, pdbin.PdArrayData):
+        loaded = obj.loaded()
+        if loaded is not None:
+            return _to_int(loaded[0], -1)
+    return _to_int(obj.attrs.get('start_idx'), -1)
+
+def _count(obj):
+    # The number of values of the array data "obj"
+    if isinstance(obj, pdbin.PdArrayData):
+        return len(obj)
+    return len(obj.extra_params) + (obj.attrs.get('values') is not None)
+
+
+class PdArray(object):
+    """The array defined by the tree node "node" of a PdPatch, whose value is
+       the "#X array" object."""
+
+    def __init__(self, node):
+        self.node = node
+        self.obj = node.value
+
+    @property
+    def name(self):
+        return self.obj.attrs.get('name')
+
+    def __len__(self):
+        return _to_int(self.obj.attrs.get('size'))
+
+    def chunks(self):
+        """Returns the array data ("#A") objects of the array, in the order
+           they're saved."""
+
+        parent = self.node.parent
+        found = []
+        for i in range(parent[:].index(self.node) + 1, len(parent)):
+            obj = parent[i].value
+            if obj.element != pd.ARRAY_DATA:
+                break
+            found.append(obj)
+        return found
+
+    def _runs(self):
+        # Yields (start, floats) for each chunk
+        for obj in self.chunks():
+            yield (_start(obj), _chunk_floats(obj))
+
+    def _ordered(self):
+        # Returns True if the chunks can be streamed in order
+        pos = 0
+        for obj in self.chunks():
+            start = _start(obj)
+            if start < pos:
+                return False
+            pos = start + _count(obj)
+        return pos <= len(self)
+
+    def floats(self):
+        """Returns the values as an array of 32 bit floats, of the array's
+           size. Values not saved in the patch are 0."""
+
+        size = len(self)
+        floats = array.array('f', '\0' * (4 * size))
+        for (start, values) in self._runs():
+            end = min(start + len(values), size)
+            if 0 <= start < end:
+                floats[start:end] = values[:end - start]
+        return floats
+
+    def _loaded(self):
+        # Returns the (data, offset) of the values in the data loaded by
+        # pdbin if they're all there in order, otherwise None
+        chunks = self.chunks()
+        (pos, data, offset) = (0, None, None)
+        for obj in chunks:
+            if not isinstance(obj, pdbin.PdArrayData):
+                return None
+            loaded = obj.loaded()
+            if loaded is None or _to_int(loaded[0], -1) != pos:
+                return None
+            if data is None:
+                (data, offset) = loaded[1:]
+            elif loaded[1:] != (data, offset + pos * 4):
+                return None
+            pos += _count(obj)
+        if data is None or pos != len(self):
+            return None
+        return (data, offset)
+
+    def buffer(self):
+        """Returns the values as a buffer of 32 bit little endian floats."""
+
+        loaded = self._loaded()
+        if loaded is not None:
+            return buffer(loaded[0], loaded[1], len(self) * 4)
+        floats = self.floats()
+        if sys.byteorder == 'big':
+            floats.byteswap()
+        return buffer(floats.tostring())
+
+    def memoryview(self):
+        """Returns a read-only memoryview of the bytes of buffer()."""
+
+        loaded = self._loaded()
+        if loaded is not None:
+            (data, offset) = loaded
+            return memoryview(data)[offset:offset + len(self) * 4]
+        return memoryview(str(self.buffer()))
+
+    def numpy(self):
+        """Returns the values as a NumPy array of 32 bit floats. This is
+           read-only when it's a view of the loaded data."""
+
+        import numpy
+        return numpy.frombuffer(self.buffer(), dtype = '<f4')
+
+    def write_wav(self, f, rate = WAV_RATE, width = 2):
+        """Writes the values to the file or filename "f" as a mono WAV file
+           of "width" byte samples (1, 2 or 4). Values outside -1 to 1 are
+           clipped."""
+
+        if width not in WAV_FORMATS:
+            raise ValueError('Unsupported WAV sample width: %d' % width)
+        (typecode, scale) = WAV_FORMATS[width]
+        offset = typecode == 'B' and 128 or 0
+
+        def sample(v):
+            return int(round(max(-1.0, min(1.0, v)) * scale)) + offset
+
+        def write(values):
+            samples = array.array(typecode, imap(sample, values))
+            if sys.byteorder == 'big':
+                samples.byteswap()
+            out.writeframesraw(samples.tostring())
+
+        out = wave.open(f, 'wb')
+        try:
+            out.setnchannels(1)
+            out.setsampwidth(width)
+            out.setframerate(rate)
+            out.setnframes(len(self))
+            if self._ordered():
+                # Stream each chunk, with zeros for any values not saved
+                pos = 0
+                for (start, values) in self._runs():
+                    write(array.array('f', '\0' * (4 * (start - pos))))
+                    write(values)
+                    pos = start + len(values)
+                write(array.array('f', '\0' * (4 * (len(self) - pos))))
+            else:
+                write(self.floats())
+        finally:
+            out.close()
+
+    def set_values(self, values, chunk_size = CHUNK_SIZE):
+        """Replaces the values saved with the array with "values", any
+           sequence of numbers, and sets the array's size to match. The
+           array is set to save its values with the patch."""
+
+        parent = self.node.parent
+        i = parent[:].index(self.node) + 1
+        while i < len(parent) and parent[i].value.element == pd.ARRAY_DATA:
+            parent.remove(i)
+
+        size = len(values)
+        for start in range(0, size, chunk_size):
+            chunk = values[start:start + chunk_size]
+            text = ' '.join(['%g' % v for v in chunk])
+            obj = pd.PdObject('%s %d %s' % (pd.ACHUNK, start, text), None,
+                              None)
+            obj.node = parent.insert(i, obj)
+            i += 1
+
+        self.obj['size'] = str(size)
+        self.obj['save_flag'] = str(_to_int(self.obj.attrs.get('save_flag')) |
+                                    SAVE_VALUES)
+
+
+def arrays(patch):
+    """Returns a PdArray for each array in the PdPatch "patch", in the order
+       they're defined."""
+
+    return [PdArray(node) for (node, level) in patch.root() \
+            if node.value.element == ARRAY]
+
+def read_wav(f):
+    """Returns the samples of the first channel of the WAV file or filename
+       "f" as an array of 32 bit floats from -1 to 1, and the sample
+       rate."""
+
+    wav = wave.open(f, 'rb')
+    try:
+        (channels, width, rate, frames) = wav.getparams()[:4]
+        if width not in WAV_FORMATS:
+            raise ValueError('Unsupported WAV sample width: %d' % width)
+        (typecode, scale) = WAV_FORMATS[width]
+        samples = array.array(typecode, wav.readframes(frames))
+    finally:
+        wav.close()
+
+    if sys.byteorder == 'big' and width > 1:
+        samples.byteswap()
+    offset = typecode == 'B' and 128 or 0
+    scale = float(scale)
+    floats = array.array('f', imap(lambda s: (s - offset) / scale,
+                                   samples[::channels]))
+    return (floats, rate)
+
+
+if __name__ == '__main__':
+    # Writes each array of the patch given to a WAV file
+    if len(sys.argv) != 2:
+        print 'Usage: %s FILE' % sys.argv[0]
+        print 'Writes each array saved in the Pd patch FILE to NAME.wav'
+        sys.exit(2)
+
+    for arr in arrays(pd.PdFile(sys.argv[1]).patch):
+        print '%s.wav: %d values' % (arr.name, len(arr))
+        arr.write_wav(arr.name + '.wav')
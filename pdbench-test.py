@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+""" Tests for the measurements and baseline comparison in pdbench.py """
+
+import os
+import tempfile
+import pdbench
+import pdtest
+
+def result(times, peak_kb = 10240, case = 'parse', size = 1000):
+    return {'case': case, 'size': size, 'times': times, 'peak_kb': peak_kb}
+
+@pdtest.passfail
+def testNoise():
+    # Noisy baseline runs allow for more than the relative tolerance
+    base = result([1.0, 1.3, 0.8, 1.2, 0.9])
+    new = result([1.15, 1.2, 1.1, 1.25, 1.05])
+    got = pdbench.compare_result(base, new)
+    if got:
+        raise pdtest.Unexpected('noisy', [], got)
+
+    # Steady runs are held to the relative tolerance
+    base = result([1.0, 1.01, 0.99, 1.0, 1.0])
+    new = result([1.15, 1.16, 1.14, 1.15, 1.15])
+    got = pdbench.compare_result(base, new)
+    if len(got) != 1 or not got[0].startswith('time +15.0%'):
+        raise pdtest.Unexpected('steady', 'time +15.0%', got)
+
+    # Faster is never a regression
+    got = pdbench.compare_result(new, base)
+    if got:
+        raise pdtest.Unexpected('faster', [], got)
+
+@pdtest.passfail
+def testMemory():
+    base = result([1.0] * 3, peak_kb = 100 * 1024)
+    for (peak, regressed) in [(105 * 1024, False), (120 * 1024, True),
+                              (None, False)]:
+        got = pdbench.compare_result(base, result([1.0] * 3, peak_kb = peak))
+        if bool(got) != regressed:
+            raise pdtest.Unexpected('peak %s' % peak, regressed, got)
+
+    # Small cases are allowed the memory slack
+    got = pdbench.compare_result(result([1.0] * 3, peak_kb = 100),
+                                 result([1.0] * 3, peak_kb = 900))
+    if got:
+        raise pdtest.Unexpected('slack', [], got)
+
+@pdtest.passfail
+def testMeasure():
+    MB = 1024 * 1024
+    # Loading more than the runs use, as the setup of a case does, mustn't
+    # hide the memory used by the runs
+    loaded = ' ' * (64 * MB)
+    loaded = None
+    base = pdbench.measure(lambda: ' ' * MB, 3)
+    new = pdbench.measure(lambda: ' ' * (32 * MB), 3)
+    if len(new['times']) != 3:
+        raise pdtest.Unexpected('times', 3, len(new['times']))
+    if new['peak_kb'] is None:
+        # No fork() or resource module to measure memory with
+        return
+
+    if new['peak_kb'] < 32 * 1024:
+        raise pdtest.Unexpected('peak_kb', '>= %d' % (32 * 1024),
+                                new['peak_kb'])
+    # The runs with more memory are slower too, only the memory is checked
+    got = [r for r in pdbench.compare_result(base, new) \
+           if r.startswith('peak memory')]
+    if len(got) != 1:
+        raise pdtest.Unexpected('more memory', 'peak memory', got)
+    got = pdbench.compare_result(new, base)
+    if got:
+        raise pdtest.Unexpected('less memory', [], got)
+
+@pdtest.passfail
+def testBaseline():
+    results = [result([1.0, 1.1, 1.0]),
+               result([0.1, 0.1, 0.1], case = 'iterate')]
+    (fd, filename) = tempfile.mkstemp(suffix = '.json')
+    os.close(fd)
+    try:
+        pdbench.save_baseline(filename, results)
+        baseline = pdbench.load_baseline(filename)
+    finally:
+        os.remove(filename)
+
+    new = [result([2.0, 2.0, 2.1]), result([0.1, 0.1, 0.1], size = 10)]
+    compared = pdbench.compare(baseline, new)
+    got = [(base is not None, bool(regressions)) \
+           for (base, n, regressions) in compared]
+    if got != [(True, True), (False, False)]:
+        raise pdtest.Unexpected('compare', [(True, True), (False, False)], got)
+
+def test():
+    testNoise()
+    testMemory()
+    testMeasure()
+    testBaseline()
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,453 @@
+#!/usr/bin/env python
+
+""" Benchmarks for parsing and working with Pd patches at scale.
+
+Patches are generated with pdgen for each size. Each case is set up in a
+fresh python process, and its runs are made in a process forked from that,
+so that peak memory can be measured for the case on its own. The cases are:
+
+    parse       PdFile() reading and parsing the main patch
+    iterate     iterating over every object in the PdPatch
+    select      PdPatch.select() of all 'obj' elements
+    serialize   str() of the PdPatch
+    populate    PdIncludes scanning a directory of abstractions
+    recursive   pd.load_recursive() of the main patch and its abstractions
+
+For each case and size the time of every run is recorded, along with the
+peak memory used by the case (on systems with the resource module).
+
+Results can be saved as a baseline and later runs compared against it, to
+catch performance regressions:
+
+    pdbench.py -s 1000,10000 -r 7 -b baseline.json
+    pdbench.py -s 1000,10000 -r 7 -C baseline.json
+
+A case has regressed when its median time is slower than the baseline by
+more than both the relative tolerance and the noise in the runs (a number of
+median absolute deviations), or when its peak memory grows by more than the
+memory tolerance. The comparison prints a table of the differences and exits
+with status 1 if anything regressed."""
+
+import os
+import sys
+import gc
+import getopt
+import shutil
+import tempfile
+import timeit
+import json
+import pd
+import pdgen
+import pdincludes
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+CASES = ['parse', 'iterate', 'select', 'serialize', 'populate', 'recursive']
+SIZES = [1000, 10000, 100000, 1000000]
+REPEAT = 3
+
+# The shape of the generated patches. Abstractions are scaled with the size
+# of the main patch.
+GEN_ARGS = {'depth': 2, 'connections': 1.0, 'arrays': 1, 'array_size': 1000,
+            'fanout': 3, 'abstraction_objects': 20}
+OBJECTS_PER_ABSTRACTION = 100
+
+# Baseline file layout. Bump this if it changes.
+BASELINE_VERSION = 1
+
+# Regression thresholds. A case is slower when its median time exceeds the
+# baseline median by more than TIME_TOLERANCE (relative) and by more than
+# MAD_FACTOR scaled median absolute deviations of the two sets of runs. Peak
+# memory regresses when it grows by more than MEMORY_TOLERANCE (relative)
+# and MEMORY_SLACK_KB, so small cases aren't failed by allocator noise.
+TIME_TOLERANCE = 0.10
+MAD_FACTOR = 3.0
+MEMORY_TOLERANCE = 0.10
+MEMORY_SLACK_KB = 1024
+# Scales the MAD to estimate the standard deviation of normal noise
+MAD_SCALE = 1.4826
+
+timer = timeit.default_timer
+
+
+def peak_memory():
+    """Returns the peak resident memory of this process in KB, or None if it
+       can't be found on this system."""
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Bytes on Mac OS X, KB elsewhere
+        peak //= 1024
+    return peak
+
+def generate(dirname, size):
+    """Generates the patches for "size" objects in "dirname". Returns the
+       path of the main patch."""
+
+    return pdgen.generate_files(dirname, size,
+                        abstractions = max(1, size // OBJECTS_PER_ABSTRACTION),
+                        **GEN_ARGS)
+
+def setup_case(case, dirname):
+    """Returns the function to time for "case", using the patches in
+       "dirname". Anything the case needs is loaded here, so it isn't
+       timed."""
+
+    main = os.path.join(dirname, pdgen.MAIN_NAME)
+
+    if case == 'parse':
+        return lambda: pd.PdFile(main)
+    elif case == 'populate':
+        return lambda: pdincludes.PdIncludes([dirname])
+    elif case == 'recursive':
+        inc = pdincludes.PdIncludes([dirname])
+        return lambda: pd.load_recursive(main, inc)
+
+    patch = pd.PdFile(main).patch
+    if case == 'iterate':
+        def iterate():
+            for node_id_level in patch:
+                pass
+        return iterate
+    elif case == 'select':
+        return lambda: patch.select(element = 'obj')
+    elif case == 'serialize':
+        return lambda: str(patch)
+    else:
+        raise ValueError('Unknown benchmark case "%s"' % case)
+
+def time_runs(fn, repeat):
+    """Returns the time of each of "repeat" runs of "fn"."""
+
+    times = []
+    result = None
+    for i in range(repeat):
+        # Drop the last result first, so runs don't hold on to each other's
+        # memory
+        result = None
+        start = timer()
+        result = fn()
+        times.append(timer() - start)
+    return times
+
+def measure(fn, repeat = REPEAT):
+    """Runs "fn" "repeat" times. Returns a dict with the time of each run
+       and the peak memory (KB) used by the runs, over what was in use
+       before them.
+
+       The peak of this process includes whatever was loaded before, which
+       may well be more than the runs use, so the runs are made in a forked
+       process. Its peak starts at the memory in use when it's forked. The
+       peak memory is None where there's no fork() or resource module."""
+
+    gc.collect()
+    if not hasattr(os, 'fork') or peak_memory() is None:
+        return {'times': time_runs(fn, repeat), 'peak_kb': None}
+
+    (r, w) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # The child must never return to the caller
+        status = 1
+        try:
+            try:
+                os.close(r)
+                base = peak_memory()
+                times = time_runs(fn, repeat)
+                out = os.fdopen(w, 'w')
+                out.write(json.dumps({'times': times,
+                                      'peak_kb': peak_memory() - base}))
+                out.close()
+                status = 0
+            except Exception:
+                import traceback
+                traceback.print_exc()
+        finally:
+            os._exit(status)
+
+    os.close(w)
+    fd = os.fdopen(r)
+    try:
+        out = fd.read()
+    finally:
+        fd.close()
+    status = os.waitpid(pid, 0)[1]
+    if status:
+        raise RuntimeError('Benchmark runs failed with status %d' % status)
+    return json.loads(out)
+
+def run_case(case, dirname, repeat = REPEAT):
+    """Runs "case" "repeat" times. Returns a dict with the time of each run
+       and the peak memory (KB) used over the runs, see measure()."""
+
+    return measure(setup_case(case, dirname), repeat)
+
+def run_child(case, dirname, repeat):
+    """Runs "case" in a new python process and returns its results."""
+
+    import subprocess
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                             '--child', case, dirname, str(repeat)],
+                            stdout = subprocess.PIPE)
+    out = proc.communicate()[0]
+    if proc.returncode:
+        raise RuntimeError('Benchmark "%s" failed with exit code %d' % \
+                           (case, proc.returncode))
+    return json.loads(out.splitlines()[-1])
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+def mad(values):
+    """Returns the median absolute deviation of "values"."""
+
+    mid = median(values)
+    return median([abs(v - mid) for v in values])
+
+def save_baseline(filename, results):
+    """Writes "results" from run() to "filename" as a baseline."""
+
+    fd = open(filename, 'w')
+    try:
+        json.dump({'version': BASELINE_VERSION,
+                   'python': sys.version.split()[0], 'results': results},
+                  fd, indent = 1)
+    finally:
+        fd.close()
+
+def load_baseline(filename):
+    """Returns the results stored in the baseline "filename". A plain list
+       of results, as written by --json, is also accepted."""
+
+    fd = open(filename)
+    try:
+        data = json.load(fd)
+    finally:
+        fd.close()
+
+    if isinstance(data, list):
+        return data
+    if data.get('version') != BASELINE_VERSION:
+        raise ValueError('Baseline "%s" has version %s, expected %d' % \
+                         (filename, data.get('version'), BASELINE_VERSION))
+    return data['results']
+
+def compare_result(base, new, time_tolerance = TIME_TOLERANCE,
+                   mad_factor = MAD_FACTOR,
+                   memory_tolerance = MEMORY_TOLERANCE,
+                   memory_slack = MEMORY_SLACK_KB):
+    """Compares the result "new" against the result "base" for the same case
+       and size. Returns a list of strings describing each regression, which
+       is empty if there are none."""
+
+    regressions = []
+
+    (base_time, new_time) = (median(base['times']), median(new['times']))
+    noise = MAD_SCALE * max(mad(base['times']), mad(new['times']))
+    allowed = max(base_time * time_tolerance, noise * mad_factor)
+    if new_time - base_time > allowed:
+        regressions.append('time %+.1f%% (%.4fs -> %.4fs, allowed +%.4fs)' % \
+                           (100.0 * (new_time - base_time) / base_time,
+                            base_time, new_time, allowed))
+
+    (base_peak, new_peak) = (base.get('peak_kb'), new.get('peak_kb'))
+    if base_peak is not None and new_peak is not None:
+        allowed = max(base_peak * memory_tolerance, memory_slack)
+        if new_peak - base_peak > allowed:
+            regressions.append('peak memory +%.1fMB (%.1fMB -> %.1fMB)' % \
+                               ((new_peak - base_peak) / 1024.0,
+                                base_peak / 1024.0, new_peak / 1024.0))
+
+    return regressions
+
+def compare(baseline, results, **kwargs):
+    """Compares each of "results" against the matching case and size in
+       "baseline". Returns a list of (base, new, regressions) tuples, with
+       base None for results not in the baseline. Keyword arguments are
+       passed to compare_result()."""
+
+    by_key = dict([((r['case'], r['size']), r) for r in baseline])
+    compared = []
+    for new in results:
+        base = by_key.get((new['case'], new['size']))
+        if base is None:
+            compared.append((None, new, []))
+        else:
+            compared.append((base, new, compare_result(base, new, **kwargs)))
+    return compared
+
+def format_comparison(base, new, regressions):
+    if base is None:
+        return '%-10s%10d%12s%12.4fs  new' % (new['case'], new['size'], '-',
+                                             median(new['times']))
+
+    (base_time, new_time) = (median(base['times']), median(new['times']))
+    change = 100.0 * (new_time - base_time) / max(base_time, 1e-9)
+    line = '%-10s%10d%12.4fs%12.4fs%+9.1f%%' % (new['case'], new['size'],
+                                                base_time, new_time, change)
+    if regressions:
+        return line + '  REGRESSED\n' + \
+               '\n'.join(['%22s%s' % ('', r) for r in regressions])
+    return line + '  ok'
+
+COMPARE_HEADER = '%-10s%10s%13s%13s%10s' % ('case', 'objects', 'baseline',
+                                            'median', 'change')
+
+def run(cases = CASES, sizes = SIZES, repeat = REPEAT, dirname = None,
+        report = None):
+    """Runs each of "cases" for each of "sizes" and returns a list of
+       result dicts. Patches are generated in "dirname", or a temporary
+       directory which is removed afterwards. "report" is called with each
+       result as it completes."""
+
+    results = []
+    tmpdir = None
+    if dirname is None:
+        dirname = tmpdir = tempfile.mkdtemp(prefix = 'pdbench')
+
+    try:
+        for size in sizes:
+            sizedir = os.path.join(dirname, str(size))
+            if not os.path.isfile(os.path.join(sizedir, pdgen.MAIN_NAME)):
+                os.makedirs(sizedir)
+                generate(sizedir, size)
+
+            for case in cases:
+                result = run_child(case, sizedir, repeat)
+                result.update({'case': case, 'size': size,
+                               'min': min(result['times']),
+                               'median': median(result['times'])})
+                results.append(result)
+                if report:
+                    report(result)
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+    return results
+
+def format_result(result):
+    if result['peak_kb'] is None:
+        peak = '-'
+    else:
+        peak = '%.1fMB' % (result['peak_kb'] / 1024.0)
+    return '%-10s%10d%12.4fs%12.4fs%14.0f%12s' % (result['case'],
+                result['size'], result['min'], result['median'],
+                result['size'] / max(result['min'], 1e-9), peak)
+
+HEADER = '%-10s%10s%13s%13s%14s%12s' % ('case', 'objects', 'min',
+                                        'median', 'objects/s', 'peak')
+
+def usage():
+    print """
+Usage: %s [OPTION]...
+Benchmarks parsing and working with generated Pd patches.
+
+Options:
+-c, --cases C,...  Cases to run (default %s)
+-s, --sizes N,...  Number of objects in the main patch (default %s)
+-r, --repeat N     Runs of each case (default %d)
+-d, --dir DIR      Generate patches in DIR and keep them for later runs
+-j, --json FILE    Write the results to FILE as JSON
+-b, --baseline F   Write the results to F as a baseline for later runs
+-C, --compare F    Compare the results against the baseline F. Exits with
+                   status 1 if any case has regressed.
+-t, --tolerance T  Relative slow down allowed, as well as noise (default %g)
+-h, --help         Prints this help
+""" % (os.path.basename(sys.argv[0]), ','.join(CASES),
+       ','.join([str(s) for s in SIZES]), REPEAT, TIME_TOLERANCE)
+
+if __name__ == '__main__':
+    if len(sys.argv) == 5 and sys.argv[1] == '--child':
+        # Run a single case and pass the results back to the parent
+        print json.dumps(run_case(sys.argv[2], sys.argv[3], int(sys.argv[4])))
+        sys.exit(0)
+
+    try:
+        options, args = getopt.getopt(sys.argv[1:], 'c:s:r:d:j:b:C:t:h',
+                                      ['cases=', 'sizes=', 'repeat=', 'dir=',
+                                       'json=', 'baseline=', 'compare=',
+                                       'tolerance=', 'help'])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(1)
+
+    (cases, sizes, repeat, dirname, json_file) = (CASES, SIZES, REPEAT, None,
+                                                  None)
+    (baseline_file, compare_file, tolerance) = (None, None, TIME_TOLERANCE)
+    for opt, arg in options:
+        if opt in ('-c', '--cases'):
+            cases = arg.split(',')
+        elif opt in ('-s', '--sizes'):
+            sizes = [int(s) for s in arg.split(',')]
+        elif opt in ('-r', '--repeat'):
+            repeat = int(arg)
+        elif opt in ('-d', '--dir'):
+            dirname = os.path.abspath(arg)
+        elif opt in ('-j', '--json'):
+            json_file = arg
+        elif opt in ('-b', '--baseline'):
+            baseline_file = arg
+        elif opt in ('-C', '--compare'):
+            compare_file = arg
+        elif opt in ('-t', '--tolerance'):
+            tolerance = float(arg)
+        elif opt in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+
+    for case in cases:
+        if case not in CASES:
+            print 'Unknown case "%s"' % case
+            usage()
+            sys.exit(1)
+
+    baseline = None
+    if compare_file:
+        # Load it first, so a bad baseline fails before the runs
+        baseline = load_baseline(compare_file)
+
+    def report(result):
+        print format_result(result)
+        sys.stdout.flush()
+
+    print HEADER
+    results = run(cases, sizes, repeat, dirname, report)
+
+    if json_file:
+        fd = open(json_file, 'w')
+        try:
+            json.dump(results, fd, indent = 1)
+        finally:
+            fd.close()
+
+    if baseline_file:
+        save_baseline(baseline_file, results)
+
+    if baseline is not None:
+        compared = compare(baseline, results, time_tolerance = tolerance)
+        print
+        print COMPARE_HEADER
+        for (base, new, regressions) in compared:
+            print format_comparison(base, new, regressions)
+
+        regressed = len([c for c in compared if c[2]])
+        if regressed:
+            print '\n%d of %d cases regressed against %s' % \
+                  (regressed, len(compared), compare_file)
+            sys.exit(1)
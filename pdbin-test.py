@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+""" Tests for pdbin.py """
+
+import array
+import pd
+import pdbin
+import pdgen
+import pdtest
+from pdexceptions import *
+
+# The second array's values can't be stored as 32 bit floats without
+# changing their text
+PATCH_TEXT = """#N struct point float x float y;
+#N canvas 0 0 450 300 10;
+#X declare -path abs;
+#X obj 10 10 declare -lib zexy;
+#X obj 10 40 osc~ 440;
+#X obj 10 70 myabs 1 2;
+#N canvas 0 0 450 300 (subpatch) 0;
+#X array one 4 float 3;
+#A 0 0 0.5 -0.25 1e-05;
+#X array two 2 float 3;
+#A 0 0.123456789 2;
+#X coords 0 1 4 -1 200 140 1;
+#X restore 100 100 graph;
+#X connect 2 0 3 0;
+"""
+
+def patch(text = PATCH_TEXT):
+    return pd.PdPatch(text.splitlines(True))
+
+@pdtest.passfail
+def testRoundTrip():
+    for text in [PATCH_TEXT, ''.join(pdgen.generate(2000, depth = 2,
+                                                    arrays = 2,
+                                                    array_size = 2500))]:
+        p = patch(text)
+        loaded = pdbin.loads(pdbin.dumps(p))
+        if str(loaded) != str(p):
+            raise pdtest.Unexpected('text', str(p), str(loaded))
+        if loaded != p:
+            raise pdtest.Unexpected('digest', p.digest(), loaded.digest())
+        # Dumping a loaded patch gives the same data
+        if pdbin.dumps(loaded) != pdbin.dumps(p):
+            raise pdtest.Unexpected('dumps', 'same', 'differs')
+
+@pdtest.passfail
+def testObjects():
+    p = pdbin.loads(pdbin.dumps(patch()))
+    objs = dict([(n.value.line_num, n.value) for (n, l) in p.root()])
+
+    if len(p.declares) != 2 or p.declarations()[1] != ('-lib', 'zexy'):
+        raise pdtest.Unexpected('declares', 2, p.declarations())
+    if not isinstance(objs[4], pdbin.PdBinObject) or objs[4]['freq'] != '440':
+        raise pdtest.Unexpected('osc~', '440', objs[4].get('freq'))
+    # Objects which aren't vanilla are decoded as usual
+    if objs[5].vanilla or objs[5].args() != ['1', '2']:
+        raise pdtest.Unexpected('myabs', ['1', '2'], objs[5].args())
+    if [s.element for s in p.structs] != ['struct']:
+        raise pdtest.Unexpected('structs', ['struct'], p.structs)
+
+@pdtest.passfail
+def testArrays():
+    data = pdbin.dumps(patch())
+    p = pdbin.loads(data)
+    (one, two) = [n.value for (n, l) in p.root() \
+                  if n.value.element == pd.ARRAY_DATA]
+
+    if not isinstance(one, pdbin.PdArrayData) or \
+       isinstance(two, pdbin.PdArrayData):
+        raise pdtest.Unexpected('floats', (True, False), (one, two))
+
+    # The buffer is a view of the loaded data
+    buf = one.buffer()
+    if len(buf) != 16 or str(buf) not in data:
+        raise pdtest.Unexpected('buffer', 16, len(buf))
+    floats = list(one.floats())
+    if floats != list(array.array('f', [0, 0.5, -0.25, 1e-05])):
+        raise pdtest.Unexpected('floats', [0, 0.5, -0.25, 1e-05], floats)
+
+    # Changes to the text are seen by floats()
+    one['values'] = '2'
+    if list(one.floats())[:2] != [2.0, 0.5]:
+        raise pdtest.Unexpected('changed', [2.0, 0.5], list(one.floats()))
+
+    # Changing an object which hasn't been decoded keeps its values
+    p = pdbin.loads(data)
+    one = [n.value for (n, l) in p.root() \
+           if n.value.element == pd.ARRAY_DATA][0]
+    one['chunk'] = pd.ACHUNK
+    if str(one) != '#A 0 0 0.5 -0.25 1e-05':
+        raise pdtest.Unexpected('str', '#A 0 0 0.5 -0.25 1e-05', str(one))
+    one.changed()
+    if list(one.floats()) != floats:
+        raise pdtest.Unexpected('floats', floats, list(one.floats()))
+
+def flip(data, word):
+    """Returns "data" with the top bit of the word "word" flipped, which
+       puts an index in it out of range."""
+
+    (word_size, text_len) = pdbin.HEADER.unpack_from(data, 0)[2:5:2]
+    pos = pdbin.HEADER.size + text_len + (word + 1) * word_size - 1
+    return data[:pos] + chr(ord(data[pos]) ^ 0x80) + data[pos + 1:]
+
+@pdtest.passfail
+def testInvalid():
+    data = pdbin.dumps(patch())
+    # The word after the kinds is the kind of the first object
+    header = pdbin.HEADER.unpack_from(data, 0)
+    (word_size, text_len, num_kinds) = (header[2], header[4], header[5])
+    words = array.array(pdbin.WORD_TYPES[word_size])
+    words.fromstring(data[pdbin.HEADER.size + text_len:])
+    first = 0
+    for i in range(num_kinds):
+        first += 4 + words[first + 3]
+
+    # The string of the first kind's chunk, and the first object's kind
+    for bad in ['', 'XXXX' + data[4:], data[:len(data) // 2], flip(data, 0),
+                flip(data, first)]:
+        try:
+            pdbin.loads(bad)
+        except PdInvalidPatch:
+            pass
+        else:
+            raise pdtest.Unexpected('invalid', 'PdInvalidPatch', 'loaded')
+
+    # The first attribute of the first object is only decoded when it's used
+    p = pdbin.loads(flip(data, first + 3))
+    try:
+        p.structs[0].attrs
+    except PdInvalidPatch:
+        pass
+    else:
+        raise pdtest.Unexpected('invalid attrs', 'PdInvalidPatch', 'decoded')
+
+def test():
+    testRoundTrip()
+    testObjects()
+    testArrays()
+    testInvalid()
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+
+""" A compact binary format for parsed Pd patches.
+
+    dump()/dumps(): writes a PdPatch in the binary format
+    load()/loads(): rebuilds a PdPatch from the binary format
+    PdBinObject: an object loaded from the binary format
+    PdArrayData: array data loaded from the binary format
+
+Loading a patch from the binary format is several times faster than parsing
+its text. No text is split, and the attributes of each object are only
+decoded from the loaded data when they're first used. Array data ("#A") is
+stored as 32 bit floats, which can be read straight from the loaded data
+with PdArrayData.buffer(), and are only turned into text if the object's
+attributes are used.
+
+Format (version 3). Integers in the header are 32 bit little endian unless
+given otherwise.
+
+    header      "PDPB", version (16 bit), word size (16 bit), then the number
+                of strings, the length of the string table, the number of
+                kinds, the number of words, the number of floats, the number
+                of structs and the number of objects
+    strings     the strings, each followed by a 0 byte, padded with 0 bytes
+                to a multiple of 4 bytes. String 0 is None, so the first
+                string in the table is string 1.
+    words       the kinds, then the objects. Words are 16 bit if every value
+                fits in 16 bits, otherwise 32 bit, little endian.
+    floats      the values of all the arrays, as 32 bit little endian floats
+
+A kind is the part shared by many objects: the chunk, element, flags and
+attribute names. Each kind is its chunk, element, flags, number of attribute
+names and then the string number of each name. Each object is:
+
+    kind, line number, number of extra params, the string number of each
+    attribute value and then of each extra param
+
+The line number is stored as the difference from the line number of the
+object before it, modulo 2**32, so it's usually small.
+
+The attribute names are those pdelement gives each element, so the version
+changes when they do. Version 2 added the element type of "#X array", so an
+array's kind has the names "name", "size", "elem_type" and "save_flag", and
+each array object has a value for each. Version 3 added the name of
+[value], which is its first attribute rather than an extra param. Earlier
+versions can't be loaded.
+
+The objects are the struct definitions followed by every object in the
+patch's tree, depth first, which is the order they appear in a patch file.
+
+The flags are VANILLA, FLOATS and DECLARE, which is set for "declare" and
+"import" objects. Objects which aren't vanilla have no
+attribute names, all their values are extra params, and they're decoded
+again when loaded, as how they're decoded depends on the libraries
+available. Array data with FLOATS has the number of floats as its number of
+extra params and its start index as its only value. Its floats follow those
+of the array data before it. Array data is only stored as floats if the text
+of every value is the same as formatting the 32 bit float with "%g",
+otherwise the values are stored as strings."""
+
+import os
+import sys
+import gc
+import struct
+import array
+from itertools import izip
+import pd
+import pdelement
+from pdexceptions import *
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+MAGIC = 'PDPB'
+# The objects are stored using the attribute names in pdelement, so the
+# version changes when those do
+VERSION = 3
+EXT = '.pdb'
+
+# magic, version, word size, strings, string table length, kinds, words,
+# floats, structs, objects
+HEADER = struct.Struct('<4sHHIIIIIII')
+
+(VANILLA, FLOATS, DECLARE) = (1, 2, 4)
+# Array typecodes for each word size
+WORD_TYPES = {2: 'H', 4: 'I'}
+
+# The slots of PdObject which PdBinObject decodes on demand
+_ATTRS = pd.PdObject.attrs
+_EXTRA_PARAMS = pd.PdObject.extra_params
+
+
+def _floats(values):
+    """Returns the array data text "values" as an array of 32 bit floats,
+       or None if they can't be stored as floats without changing their
+       text."""
+
+    try:
+        floats = array.array('f', [float(v) for v in values])
+    except ValueError:
+        return None
+    for (f, v) in izip(floats, values):
+        if '%g' % f != v:
+            return None
+    return floats
+
+def dumps(patch):
+    """Returns the PdPatch "patch" in the binary format, as a string."""
+
+    strings = {None: 0}
+    table = []
+    def string(s):
+        try:
+            return strings[s]
+        except KeyError:
+            if '\0' in s:
+                raise ValueError('Strings with 0 bytes can\'t be stored')
+            table.append(s)
+            strings[s] = len(table)
+            return strings[s]
+
+    kinds = {}
+    (kind_words, words, floats) = ([], [], array.array('f'))
+    def kind(obj, flags, names):
+        key = (obj.chunk, obj.element, flags, names)
+        try:
+            return kinds[key]
+        except KeyError:
+            kind_words.extend([string(obj.chunk), string(obj.element), flags,
+                               len(names)])
+            kind_words.extend([string(n) for n in names])
+            kinds[key] = len(kinds)
+            return kinds[key]
+
+    objects = patch.structs + [node.value for (node, level) in patch.root()]
+    last_line = 0
+    for obj in objects:
+        line_num = obj.line_num or 0
+        (line_num, last_line) = ((line_num - last_line) % 0x100000000,
+                                 line_num)
+
+        values = None
+        if isinstance(obj, PdArrayData) and obj._data is not None:
+            # Still the floats it was loaded with
+            (start, values) = (obj._start, obj.floats())
+        elif obj.element == pd.ARRAY_DATA and obj.attrs['values'] is not None:
+            start = obj.attrs['start_idx']
+            values = _floats([obj.attrs['values']] + obj.extra_params)
+        if values is not None:
+            words.extend([kind(obj, VANILLA | FLOATS, ()), line_num,
+                          len(values), string(start)])
+            floats.extend(values)
+            continue
+
+        vals = [obj.attrs[k] for k in obj.attr_names]
+        if obj.vanilla:
+            (names, extra) = (obj.attr_names, obj.extra_params)
+            flags = VANILLA
+            if obj.is_declare():
+                flags |= DECLARE
+            words.extend([kind(obj, flags, names), line_num, len(extra)])
+        else:
+            # Decoded again when loaded, so only the values are needed
+            (names, extra) = ((), [v for v in vals if v is not None] + \
+                                  obj.extra_params)
+            vals = []
+            words.extend([kind(obj, 0, names), line_num, len(extra)])
+        words.extend([string(v) for v in vals])
+        words.extend([string(v) for v in extra])
+
+    words = kind_words + words
+    word_size = 2
+    if words and max(words) > 0xffff:
+        word_size = 4
+    words = array.array(WORD_TYPES[word_size], words)
+
+    text = ''.join([s + '\0' for s in table])
+    text += '\0' * (-len(text) % 4)
+    if sys.byteorder == 'big':
+        words.byteswap()
+        floats.byteswap()
+    return ''.join([HEADER.pack(MAGIC, VERSION, word_size, len(table),
+                                len(text), len(kinds), len(words),
+                                len(floats), len(patch.structs),
+                                len(objects)),
+                    text, words.tostring(), floats.tostring()])
+
+def dump(patch, filename):
+    """Writes the PdPatch "patch" to "filename" in the binary format."""
+
+    data = dumps(patch)
+    fd = open(filename, 'wb')
+    try:
+        fd.write(data)
+    finally:
+        fd.close()
+
+def loads(data, includes = None, dirname = None):
+    """Returns the PdPatch stored in the binary format in the string
+       "data". "includes" and "dirname" are used as for PdPatch(). Array
+       data refers to "data" rather than copying it. Raises PdInvalidPatch
+       if "data" isn't in the binary format, or is corrupt."""
+
+    if len(data) < HEADER.size:
+        raise PdInvalidPatch('Too short for a binary patch')
+    (magic, version, word_size, num_strings, text_len, num_kinds, num_words,
+     num_floats, num_structs, num_objects) = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise PdInvalidPatch('Not a binary patch')
+    if version != VERSION or word_size not in WORD_TYPES:
+        raise PdInvalidPatch('Binary patch version %d, expected %d' % \
+                             (version, VERSION))
+
+    pos = HEADER.size + text_len
+    floats_pos = pos + num_words * word_size
+    if len(data) < floats_pos + num_floats * 4:
+        raise PdInvalidPatch('Binary patch is truncated')
+
+    strings = [None] + data[HEADER.size:pos].split('\0')[:num_strings]
+    words = array.array(WORD_TYPES[word_size])
+    words.fromstring(data[pos:floats_pos])
+    if sys.byteorder == 'big':
+        words.byteswap()
+
+    # Each kind is (chunk, element, flags, attribute names)
+    (p, kinds) = (0, [])
+    try:
+        for i in xrange(num_kinds):
+            (chunk, element, flags, n) = words[p:p + 4]
+            if not chunk or not element:
+                # String 0 is None
+                raise PdInvalidPatch('Corrupt binary patch')
+            names = tuple([strings[w] for w in words[p + 4:p + 4 + n]])
+            kinds.append((strings[chunk], strings[element], flags, names))
+            p += 4 + n
+    except (IndexError, ValueError):
+        raise PdInvalidPatch('Corrupt binary patch')
+
+    # Every object made is kept, so there's nothing for the garbage
+    # collector to find while loading. Its passes over the new objects
+    # would take a large part of the time.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        (objects, line_num) = ([], 0)
+        new = PdBinObject.__new__
+        for i in xrange(num_objects):
+            (chunk, element, flags, names) = kinds[words[p]]
+            line_num = (line_num + words[p + 1]) % 0x100000000
+            num_extra = words[p + 2]
+            p += 3
+
+            if flags & FLOATS:
+                objects.append(PdArrayData(line_num, strings[words[p]], data,
+                                           floats_pos, num_extra))
+                floats_pos += 4 * num_extra
+                p += 1
+            elif flags & VANILLA:
+                # The attributes are decoded when they're used
+                obj = new(PdBinObject)
+                (obj.text, obj.line_num, obj.node, obj._shared, obj.chunk,
+                 obj.element, obj.attr_names, obj.vanilla, obj.library,
+                 obj.include, obj._flags, obj._strings, obj._words,
+                 obj._pos) = (None, line_num, None, False, chunk, element,
+                              names, True, None, [], flags, strings, words, p)
+                p += len(names) + num_extra
+                objects.append(obj)
+            else:
+                # Objects which aren't vanilla are decoded now, since they
+                # need to be looked up
+                obj = pd.PdObject.__new__(pd.PdObject)
+                (obj.text, obj.line_num, obj.node, obj._shared, obj.chunk,
+                 obj.element) = (None, line_num, None, False, chunk, element)
+                (obj.attr_names, obj.attrs, obj.extra_params, obj.vanilla) = \
+                    pdelement.get(element,
+                                  [strings[w] for w in words[p:p + num_extra]])
+                obj.lookup(includes)
+                p += num_extra
+                objects.append(obj)
+
+        patch = pd.PdPatch.from_objects(objects[num_structs:], includes,
+                                        dirname)
+    except (IndexError, ValueError):
+        # An index or count in the data is out of range
+        raise PdInvalidPatch('Corrupt binary patch')
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    patch.structs = objects[:num_structs]
+    return patch
+
+def load(filename, includes = None):
+    """Returns the PdPatch stored in the binary format in "filename"."""
+
+    fd = open(filename, 'rb')
+    try:
+        data = fd.read()
+    finally:
+        fd.close()
+    return loads(data, includes, os.path.dirname(os.path.abspath(filename)))
+
+
+class PdBinObject(pd.PdObject):
+    """A vanilla object loaded from the binary format. Its attributes and
+       extra params are decoded from the loaded data the first time either
+       is used. Otherwise it's the same as the PdObject parsed from the
+       object's text, except that it has no text. Using the attributes
+       raises PdInvalidPatch if their part of the data is corrupt."""
+
+    __slots__ = ('_flags', '_strings', '_words', '_pos')
+
+    def _decode(self):
+        get = self._strings.__getitem__
+        (words, p) = (self._words, self._pos)
+        end = p + len(self.attr_names)
+        try:
+            attrs = dict(izip(self.attr_names, map(get, words[p:end])))
+            # The number of extra params is the word before the values
+            extra_params = map(get, words[end:end + words[p - 1]])
+        except IndexError:
+            raise PdInvalidPatch('Corrupt binary patch')
+        _ATTRS.__set__(self, attrs)
+        _EXTRA_PARAMS.__set__(self, extra_params)
+        # The loaded data is no longer needed
+        (self._strings, self._words) = (None, None)
+
+    def _get_attrs(self):
+        try:
+            return _ATTRS.__get__(self, PdBinObject)
+        except AttributeError:
+            self._decode()
+            return _ATTRS.__get__(self, PdBinObject)
+
+    def _set_attrs(self, attrs):
+        _ATTRS.__set__(self, attrs)
+
+    def _get_extra_params(self):
+        try:
+            return _EXTRA_PARAMS.__get__(self, PdBinObject)
+        except AttributeError:
+            self._decode()
+            return _EXTRA_PARAMS.__get__(self, PdBinObject)
+
+    def _set_extra_params(self, extra_params):
+        _EXTRA_PARAMS.__set__(self, extra_params)
+
+    attrs = property(_get_attrs, _set_attrs)
+    extra_params = property(_get_extra_params, _set_extra_params)
+
+    def is_declare(self):
+        return bool(self._flags & DECLARE)
+
+
+class PdArrayData(PdBinObject):
+    """Array data ("#A") loaded from the binary format. The values stay as
+       32 bit floats in the loaded data until the object's attributes are
+       used, when they're turned into text as if they'd been parsed."""
+
+    __slots__ = ('_start', '_data', '_offset', '_count')
+
+    def __init__(self, line_num, start, data, offset, count):
+        (self.text, self.line_num, self.node, self._shared) = (None, line_num,
+                                                               None, False)
+        (self.chunk, self.element, self.vanilla) = (pd.ACHUNK, pd.ARRAY_DATA,
+                                                    True)
+        self.attr_names = pdelement.VANILLA_ELEMENTS[pd.ARRAY_DATA]
+        (self.library, self.include, self._flags) = (None, [],
+                                                     VANILLA | FLOATS)
+        (self._start, self._data, self._offset, self._count) = (start, data,
+                                                                offset, count)
+
+    def __len__(self):
+        return self._count
+
+    def loaded(self):
+        """Returns the (start index, data, offset) of the values in the
+           loaded data, or None if they've been changed since they were
+           loaded. This doesn't decode the object."""
+
+        if self._data is None:
+            return None
+        return (self._start, self._data, self._offset)
+
+    def buffer(self):
+        """Returns the values as a buffer of 32 bit little endian floats. If
+           the values haven't been changed this is a view of the loaded
+           data, so nothing is copied."""
+
+        if self._data is None:
+            floats = self.floats()
+            if sys.byteorder == 'big':
+                floats.byteswap()
+            return buffer(floats.tostring())
+        return buffer(self._data, self._offset, self._count * 4)
+
+    def floats(self):
+        """Returns the values as an array of 32 bit floats."""
+
+        floats = array.array('f')
+        if self._data is None:
+            # They've been changed, so use the text
+            values = [self.attrs['values']] + self.extra_params
+            floats.fromlist([float(v) for v in values if v is not None])
+            return floats
+
+        floats.fromstring(self.buffer())
+        if sys.byteorder == 'big':
+            floats.byteswap()
+        return floats
+
+    def _decode(self):
+        values = ['%g' % f for f in self.floats()]
+        _ATTRS.__set__(self, {'start_idx': self._start,
+                              'values': values and values[0] or None})
+        _EXTRA_PARAMS.__set__(self, values[1:])
+
+    def changed(self):
+        # The loaded floats are out of date once the object is changed. The
+        # attributes are decoded from them first, if they haven't been, as
+        # they're all that's left of the values after.
+        self._get_attrs()
+        self._data = None
+        PdBinObject.changed(self)
+
+
+if __name__ == '__main__':
+    # Converts each patch file given to the binary format, or each binary
+    # file back to text
+    if len(sys.argv) == 1:
+        print 'Usage: %s FILE...' % sys.argv[0]
+        sys.exit(2)
+
+    for filename in sys.argv[1:]:
+        (base, ext) = os.path.splitext(filename)
+        if ext == EXT:
+            sys.stdout.write(str(load(filename)))
+        else:
+            dump(pd.PdFile(filename).patch, base + EXT)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+""" Tests for pdcache.py """
+
+import os
+import shutil
+import tempfile
+import pd
+import pdcache
+import pdtest
+
+PATCH_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 10 10 osc~ 440;
+#N canvas 0 0 450 300 sub 0;
+#X obj 10 10 f;
+#X restore 10 40 pd sub;
+#X connect 0 0 1 0;
+"""
+
+def write(root, name, text = PATCH_TEXT):
+    path = os.path.join(root, name)
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+def counts(cache):
+    return (cache.hits, cache.misses, cache.evictions, cache.stale)
+
+@pdtest.passfail
+def testHits(root):
+    path = write(root, 'main.pd')
+    cache = pdcache.PdFileCache()
+    (one, two) = (cache.get(path), cache.get(path))
+    if one is not two or counts(cache) != (1, 1, 0, 0):
+        raise pdtest.Unexpected('counts', (1, 1, 0, 0), counts(cache))
+    if cache.size != pdcache.footprint(one) or len(cache) != 1:
+        raise pdtest.Unexpected('size', pdcache.footprint(one), cache.size)
+
+    # A changed file is parsed again
+    write(root, 'main.pd', PATCH_TEXT + '#X obj 10 70 f;\n')
+    three = cache.get(path)
+    if three is one or len(three.patch) != 4:
+        raise pdtest.Unexpected('objects', 4, len(three.patch))
+    if counts(cache) != (1, 2, 0, 1):
+        raise pdtest.Unexpected('counts', (1, 2, 0, 1), counts(cache))
+
+@pdtest.passfail
+def testEviction(root):
+    paths = [write(root, '%d.pd' % i) for i in range(3)]
+    size = pdcache.footprint(pd.PdFile(paths[0]))
+    # Room for two files
+    cache = pdcache.PdFileCache(size * 2)
+    cache.get(paths[0])
+    cache.get(paths[1])
+    cache.get(paths[0])
+    # The least recently used is dropped
+    cache.get(paths[2])
+    got = [p in cache for p in paths]
+    if got != [True, False, True] or counts(cache) != (1, 3, 1, 0):
+        raise pdtest.Unexpected('cached', [True, False, True], got)
+
+    # A file bigger than the budget isn't cached
+    cache = pdcache.PdFileCache(size - 1)
+    cache.get(paths[0])
+    if len(cache) or cache.size:
+        raise pdtest.Unexpected('cached', 0, len(cache))
+
+@pdtest.passfail
+def testClone(root):
+    path = write(root, 'main.pd')
+    cache = pdcache.PdFileCache()
+    shared = cache.get(path)
+    clone = cache.get(path, clone = True)
+    if clone is shared or str(clone) != str(shared):
+        raise pdtest.Unexpected('clone', str(shared), str(clone))
+
+    # Changing the clone doesn't change the cached file
+    obj = clone.patch.root()[0].value
+    if obj.attrs is not shared.patch.root()[0].value.attrs:
+        raise pdtest.Unexpected('shared attrs', True, False)
+    obj['type'] = 'phasor~'
+    if str(shared) != PATCH_TEXT or 'phasor~' not in str(clone):
+        raise pdtest.Unexpected('shared', PATCH_TEXT, str(shared))
+
+def test():
+    d = tempfile.mkdtemp()
+    try:
+        testHits(d)
+        testEviction(d)
+        testClone(d)
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+""" A cache of parsed Pd patch files, kept within a memory budget.
+
+    PdFileCache: parsed PdFiles by filename, dropping the least recently
+                 used when the budget is reached
+    load(): loads a file through the cache shared by the whole process
+    footprint(): estimates the memory used by a parsed PdFile
+
+Programs which keep running, and load the same patches again and again, can
+load them through a cache rather than parsing each one every time:
+
+    f = pdcache.load('main.pd', includes)
+    mine = pdcache.load('main.pd', includes, clone = True)
+    mine.patch.root()[0].value['x'] = '20'
+
+The cache's budget is for the estimated memory used by the parsed patches,
+not the number of them, as patches range from a few objects to hundreds of
+thousands. Each time a file is asked for it is checked with os.stat(), and
+parsed again if its size, modification time or inode has changed.
+
+By default the PdFile in the cache is returned, and is shared with everyone
+else who loads the same file. It must not be changed. A cache made with
+"frozen" freezes each patch (see PdPatch.freeze()), so that changing one
+raises an exception and one copy can be used by many threads.
+
+With "clone" a copy is returned whose objects share their parsed attributes
+with the cached copy, so making it is much cheaper than parsing the file, and
+which can be changed: objects are copied as they're changed (see
+PdPatch.clone()). Clones of frozen patches aren't frozen."""
+
+import os
+import threading
+from itertools import imap
+import pd
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+# The default budget, in bytes
+BUDGET = 256 * 1024 * 1024
+
+# The estimated memory used for each line of a parsed patch, and for each
+# byte of its text. Measured with python 2.7 on 64 bit Linux, where a
+# PdObject, its attrs dict, its tree node and the strings of its attributes
+# come to about 1KB for a typical line of 20-30 characters.
+LINE_COST = 700
+BYTE_COST = 16
+
+
+def footprint(f):
+    """Returns an estimate of the memory used by the PdFile "f" in bytes,
+       from the lines of the file."""
+
+    lines = f.lines or ()
+    return len(lines) * LINE_COST + sum(imap(len, lines)) * BYTE_COST
+
+def _stat(path):
+    # What's checked to see if a file has changed
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime, st.st_ino)
+
+def _clone(f):
+    """Returns a copy of the PdFile "f" whose patch is a clone of its
+       patch, see PdPatch.clone()."""
+
+    copy = pd.PdFile.__new__(pd.PdFile)
+    (copy.filename, copy.includes, copy.lines) = (f.filename, f.includes,
+                                                  f.lines)
+    copy.patch = f.patch.clone()
+    return copy
+
+
+class _Entry(object):
+    """A PdFile in the cache, in a list from the most to the least recently
+       used."""
+
+    __slots__ = ('key', 'pdfile', 'stat', 'size', 'prev', 'next')
+
+    def __init__(self, key = None, pdfile = None, stat = None, size = 0):
+        (self.key, self.pdfile, self.stat, self.size) = (key, pdfile, stat,
+                                                         size)
+        (self.prev, self.next) = (self, self)
+
+
+class PdFileCache(object):
+    """A cache of parsed PdFiles, keeping the estimated memory they use
+       (see footprint()) within "budget" bytes. Files are cached by their
+       absolute path and the includes they're loaded with. A cache can be
+       used by many threads.
+
+       "hits", "misses" and "evictions" count the files found in the cache,
+       the files parsed, and the files dropped to keep within the budget.
+       "stale" counts the files parsed again as they'd changed.
+
+       With "frozen" each patch is frozen when it's parsed, see
+       PdPatch.freeze()."""
+
+    def __init__(self, budget = BUDGET, frozen = False):
+        self.budget = budget
+        self.frozen = frozen
+        self.size = 0
+        (self.hits, self.misses, self.evictions, self.stale) = (0, 0, 0, 0)
+        self._entries = {}
+        # The most recently used entry is first after the head
+        self._head = _Entry()
+        self._lock = threading.Lock()
+
+    def get(self, filename, includes = None, clone = False):
+        """Returns the PdFile of "filename" loaded with "includes", from the
+           cache if it's there and the file hasn't changed. The PdFile
+           returned is shared, and mustn't be changed, unless "clone" is
+           given, when a copy which can be changed is returned."""
+
+        path = os.path.abspath(filename)
+        key = (path, includes)
+        stat = _stat(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.stat != stat:
+                self._remove(entry)
+                self.stale += 1
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                self._unlink(entry)
+                self._link(entry)
+                f = entry.pdfile
+            else:
+                self.misses += 1
+
+        if entry is None:
+            # Parsed outside the lock, so other files can be found while
+            # this one is parsed
+            f = pd.PdFile(path, includes)
+            if self.frozen:
+                f.patch.freeze()
+            self._add(_Entry(key, f, stat, footprint(f)))
+
+        if clone:
+            return _clone(f)
+        return f
+
+    def _add(self, entry):
+        if entry.size > self.budget:
+            # Caching it would only empty the cache
+            return
+        with self._lock:
+            old = self._entries.get(entry.key)
+            if old is not None:
+                # Loaded by another thread at the same time
+                self._remove(old)
+            self._entries[entry.key] = entry
+            self._link(entry)
+            self.size += entry.size
+            while self.size > self.budget:
+                self._remove(self._head.prev)
+                self.evictions += 1
+
+    def _link(self, entry):
+        # Makes "entry" the most recently used
+        head = self._head
+        (entry.prev, entry.next) = (head, head.next)
+        head.next.prev = entry
+        head.next = entry
+
+    def _unlink(self, entry):
+        entry.prev.next = entry.next
+        entry.next.prev = entry.prev
+
+    def _remove(self, entry):
+        self._unlink(entry)
+        del self._entries[entry.key]
+        self.size -= entry.size
+
+    def discard(self, filename, includes = None):
+        """Drops the PdFile of "filename" loaded with "includes" from the
+           cache, if it's there."""
+
+        with self._lock:
+            entry = self._entries.get((os.path.abspath(filename), includes))
+            if entry is not None:
+                self._remove(entry)
+
+    def clear(self):
+        """Drops every PdFile from the cache. The counts are kept."""
+
+        with self._lock:
+            self._entries.clear()
+            self._head = _Entry()
+            self.size = 0
+
+    def stats(self):
+        """Returns a dict of the counts, and the number of files cached, the
+           memory they use and the budget."""
+
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'stale': self.stale,
+                    'files': len(self._entries), 'size': self.size,
+                    'budget': self.budget}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, filename):
+        # Whether "filename" is cached with any includes
+        path = os.path.abspath(filename)
+        return bool([k for k in self._entries.keys() if k[0] == path])
+
+
+# The cache used by load()
+CACHE = PdFileCache()
+
+def load(filename, includes = None, clone = False):
+    """Returns the PdFile of "filename" from the cache shared by the whole
+       process. See PdFileCache.get()."""
+
+    return CACHE.get(filename, includes, clone)
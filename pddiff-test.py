@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+""" Tests for pddiff.py """
+
+import pd
+import pddiff
+import pdtest
+
+OLD_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 10 10 osc~ 440;
+#X obj 10 40 *~ 0.5;
+#X obj 10 70 dac~;
+#X msg 100 10 hello;
+#N canvas 0 0 450 300 sub 0;
+#X obj 10 10 inlet;
+#X obj 10 40 outlet;
+#X connect 0 0 1 0;
+#X restore 100 100 pd sub;
+#X connect 0 0 1 0;
+#X connect 1 0 2 0;
+#X connect 1 0 2 1;
+"""
+
+# An object inserted at the start shifts every id, the gain is modified, the
+# message removed, the sub-patch moved with an object inserted in it, and
+# one connection removed and one added
+NEW_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 10 5 loadbang;
+#X obj 10 10 osc~ 440;
+#X obj 10 40 *~ 0.25;
+#X obj 10 70 dac~;
+#N canvas 0 0 450 300 sub 0;
+#X obj 10 10 inlet;
+#X obj 10 25 t b;
+#X obj 10 40 outlet;
+#X connect 0 0 1 0;
+#X connect 1 0 2 0;
+#X restore 150 100 pd sub;
+#X connect 1 0 2 0;
+#X connect 2 0 3 0;
+#X connect 0 0 1 0;
+"""
+
+def patch(text):
+    return pd.PdPatch(text.splitlines(True))
+
+@pdtest.passfail
+def testSame():
+    diff = pddiff.PdDiff(patch(OLD_TEXT), patch(OLD_TEXT))
+    if diff:
+        raise pdtest.Unexpected('changes', '', str(diff))
+
+@pdtest.passfail
+def testDiff():
+    diff = pddiff.PdDiff(patch(OLD_TEXT), patch(NEW_TEXT))
+    got = [(c.kind, c.canvas, c.old_id, c.new_id) for c in diff \
+           if c.kind not in (pddiff.CONNECTED, pddiff.DISCONNECTED)]
+    expected = [(pddiff.ADDED, (), None, 0),
+                (pddiff.MODIFIED, (), 1, 2),
+                (pddiff.REMOVED, (), 3, None),
+                (pddiff.MOVED, (), 4, 4),
+                (pddiff.ADDED, (4,), None, 1)]
+    if got != expected:
+        raise pdtest.Unexpected('changes', expected, got)
+
+    if diff.id_maps[()] != {0: 1, 1: 2, 2: 3, 4: 4}:
+        raise pdtest.Unexpected('id_map', {0: 1, 1: 2, 2: 3, 4: 4},
+                                diff.id_maps[()])
+
+    got = [(c.kind, c.canvas, c.old or c.new) for c in diff \
+           if c.kind in (pddiff.CONNECTED, pddiff.DISCONNECTED)]
+    expected = [(pddiff.DISCONNECTED, (), (1, 0, 2, 1)),
+                (pddiff.CONNECTED, (), (0, 0, 1, 0)),
+                (pddiff.DISCONNECTED, (4,), (0, 0, 1, 0)),
+                (pddiff.CONNECTED, (4,), (0, 0, 1, 0)),
+                (pddiff.CONNECTED, (4,), (1, 0, 2, 0))]
+    if got != expected:
+        raise pdtest.Unexpected('connections', expected, got)
+
+def test():
+    testSame()
+    testDiff()
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+
+""" Structural differences between two versions of a Pd patch.
+
+    PdDiff: the changes between two PdPatch objects
+    PdChange: a single change
+
+A text diff of two .pd files is hard to read, since inserting or deleting one
+object changes the id of every object after it, and so every connect line
+which uses them. Instead the objects in each canvas are matched between the
+two patches, and connections are compared after mapping the old object ids
+to the new ones:
+
+    diff = pddiff.PdDiff(pd.PdFile('old.pd').patch, pd.PdFile('new.pd').patch)
+    for change in diff:
+        print change
+
+Objects are matched first by their content and position, then by content
+alone (moved objects), then by type and position (modified objects). The
+objects left over are matched by type, keeping their order, using a longest
+common subsequence. Each of these passes is a hash lookup, so large patches
+where most objects are unchanged are compared quickly.
+
+Sub-patches are matched the same way, using the content digests kept in the
+patch's tree, and the sub-patches matched are compared in turn. Sub-patches
+with the same digest are unchanged, so they aren't compared."""
+
+import sys
+import difflib
+import collections
+import pd
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+(ADDED, REMOVED, MOVED, MODIFIED, CONNECTED, DISCONNECTED) = \
+    ('added', 'removed', 'moved', 'modified', 'connected', 'disconnected')
+
+# The attributes giving an object's position in its canvas
+POSITION_ATTRS = ('x', 'y')
+
+# The longest common subsequence of the objects left over after the hash
+# matching is only used when the product of their numbers is below this.
+# Otherwise they're matched by type in order, which is linear.
+LCS_LIMIT = 1000000
+
+# The fields of each object matched in a canvas
+(ITEM_ID, ITEM_NODE, ITEM_CONTENT, ITEM_POS, ITEM_SUBTREE, ITEM_TYPE) = \
+    range(6)
+
+
+class PdChange(object):
+    """A single change between two patches. "kind" is one of ADDED,
+       REMOVED, MOVED, MODIFIED, CONNECTED or DISCONNECTED.
+
+       "canvas" is the path to the canvas in the new patch, as a tuple of
+       the object ids of each sub-patch from the top level canvas down.
+       "old_id" and "new_id" are the object's ids in each patch, and "old"
+       and "new" the PdObjects, where they exist.
+
+       For connections "old" and "new" are (src_id, outlet, dest_id, inlet)
+       tuples, with the ids of the old and new patch respectively."""
+
+    def __init__(self, kind, canvas, old_id = None, new_id = None,
+                 old = None, new = None):
+        (self.kind, self.canvas) = (kind, canvas)
+        (self.old_id, self.new_id, self.old, self.new) = (old_id, new_id,
+                                                          old, new)
+
+    def __str__(self):
+        where = '/'.join(['%d' % i for i in self.canvas]) or '(top)'
+        if self.kind == ADDED:
+            return '%s: + %d %s' % (where, self.new_id, self.new)
+        elif self.kind == REMOVED:
+            return '%s: - %d %s' % (where, self.old_id, self.old)
+        elif self.kind == MOVED:
+            return '%s: > %d -> %d moved %s -> %s %s' % (where, self.old_id,
+                        self.new_id, ','.join(position(self.old)),
+                        ','.join(position(self.new)), content(self.new))
+        elif self.kind == MODIFIED:
+            return '%s: ~ %d -> %d %s -> %s' % (where, self.old_id,
+                        self.new_id, content(self.old), content(self.new))
+        elif self.kind == CONNECTED:
+            return '%s: + connect %d %d %d %d' % ((where,) + self.new)
+        else:
+            return '%s: - connect %d %d %d %d' % ((where,) + self.old)
+
+    def __repr__(self):
+        return '<PdChange %s>' % str(self)
+
+
+def content(obj):
+    """Returns the text of "obj" without its position."""
+
+    vals = [obj.attrs[k] for k in obj.attr_names \
+            if k not in POSITION_ATTRS and obj.attrs[k] is not None]
+    return ' '.join([obj.element] + vals + obj.extra_params)
+
+def position(obj):
+    return tuple([obj.attrs.get(k) for k in POSITION_ATTRS])
+
+def _connection(obj):
+    try:
+        return tuple([int(obj.attrs[k]) for k in obj.attr_names])
+    except (TypeError, ValueError):
+        return None
+
+
+class PdDiff(object):
+    """The changes between the PdPatch "old" and the PdPatch "new". A PdDiff
+       is a sequence of PdChange objects, in the order of the canvases and
+       objects of the new patch.
+
+       "id_maps" is a dict from the path of each canvas in the new patch
+       that was matched (see PdChange), to a dict of its old object ids to
+       new object ids."""
+
+    def __init__(self, old, new):
+        (self.old, self.new) = (old, new)
+        self.changes = []
+        self.id_maps = {}
+        self._diff_canvas(old.root(), new.root(), ())
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __iter__(self):
+        return iter(self.changes)
+
+    def __nonzero__(self):
+        return bool(self.changes)
+
+    def select(self, kind):
+        """Returns the changes of the given kind."""
+
+        return [c for c in self.changes if c.kind == kind]
+
+    def __str__(self):
+        return '\n'.join([str(c) for c in self.changes])
+
+    def _items(self, node):
+        """Returns the objects of the canvas "node", and its connections."""
+
+        children = node[:]
+        if node.parent is not None and children and \
+           children[-1].value.element == pd.RESTORE:
+            # The sub-patch's own restore is part of the parent canvas
+            children = children[:-1]
+
+        (items, connects) = ([], [])
+        obj_id = 0
+        for child in children:
+            obj = child.value
+            if obj.element == pd.CONNECT:
+                connects.append(child.value)
+                continue
+
+            if child.leaf():
+                (text, pos, subtree) = (content(obj), position(obj), None)
+                typ = (obj.element, obj.attrs.get('type'))
+            else:
+                # A sub-patch is matched using its restore object
+                restore = child[len(child) - 1].value
+                (text, pos) = (content(restore), position(restore))
+                subtree = child.digest()
+                typ = (pd.CANVAS, None)
+            items.append((obj_id, child, text, pos, subtree, typ))
+            obj_id += 1
+        return (items, connects)
+
+    def _diff_canvas(self, old_node, new_node, path):
+        (old_items, old_connects) = self._items(old_node)
+        (new_items, new_connects) = self._items(new_node)
+
+        pairs = match(old_items, new_items)
+        id_map = dict([(o[ITEM_ID], n[ITEM_ID]) for (o, n) in pairs])
+        self.id_maps[path] = id_map
+
+        # Report the changes in the order of the new canvas, with the
+        # objects removed before the objects which were after them
+        changes = []
+        last = -1
+        for o in old_items:
+            if o[ITEM_ID] in id_map:
+                last = id_map[o[ITEM_ID]]
+            else:
+                # Placed after the new object matched to the last matched
+                # old object before it
+                changes.append(((last, 1),
+                                PdChange(REMOVED, path, old_id = o[ITEM_ID],
+                                         old = o[ITEM_NODE].value)))
+        matched_new = set(id_map.itervalues())
+        for n in new_items:
+            if n[ITEM_ID] not in matched_new:
+                changes.append(((n[ITEM_ID], 0),
+                                PdChange(ADDED, path, new_id = n[ITEM_ID],
+                                         new = n[ITEM_NODE].value)))
+
+        sub_patches = []
+        for (o, n) in pairs:
+            kind = None
+            if o[ITEM_CONTENT] != n[ITEM_CONTENT]:
+                kind = MODIFIED
+            elif o[ITEM_POS] != n[ITEM_POS]:
+                kind = MOVED
+            if kind:
+                # Sub-patches are described by their restore objects
+                (old_obj, new_obj) = (o[ITEM_NODE].value, n[ITEM_NODE].value)
+                if o[ITEM_SUBTREE] is not None:
+                    old_obj = o[ITEM_NODE][len(o[ITEM_NODE]) - 1].value
+                    new_obj = n[ITEM_NODE][len(n[ITEM_NODE]) - 1].value
+                changes.append(((n[ITEM_ID], 0),
+                                PdChange(kind, path, o[ITEM_ID], n[ITEM_ID],
+                                         old_obj, new_obj)))
+            if o[ITEM_SUBTREE] is not None and \
+               o[ITEM_SUBTREE] != n[ITEM_SUBTREE]:
+                sub_patches.append((n[ITEM_ID], o[ITEM_NODE], n[ITEM_NODE]))
+
+        changes.sort(key = lambda c: c[0])
+        self.changes.extend([c for (order, c) in changes])
+
+        self._diff_connections(old_connects, new_connects, id_map, path)
+
+        sub_patches.sort()
+        for (new_id, old_child, new_child) in sub_patches:
+            self._diff_canvas(old_child, new_child, path + (new_id,))
+
+    def _diff_connections(self, old_connects, new_connects, id_map, path):
+        # Connections are compared with the old ids mapped to the new ids.
+        # Connections to removed objects can't be mapped, so are always
+        # disconnected.
+        (old, mapped) = ([], set())
+        for obj in old_connects:
+            conn = _connection(obj)
+            if conn is None:
+                continue
+            (src, outlet, dest, inlet) = conn
+            new_conn = None
+            if src in id_map and dest in id_map:
+                new_conn = (id_map[src], outlet, id_map[dest], inlet)
+                mapped.add(new_conn)
+            old.append((conn, new_conn))
+
+        new = []
+        for obj in new_connects:
+            conn = _connection(obj)
+            if conn is not None:
+                new.append(conn)
+
+        new_set = set(new)
+        for (conn, new_conn) in old:
+            if new_conn not in new_set:
+                self.changes.append(PdChange(DISCONNECTED, path, old = conn))
+        for conn in new:
+            if conn not in mapped:
+                self.changes.append(PdChange(CONNECTED, path, new = conn))
+
+
+def _match_by(old_items, new_items, keyfn, pairs):
+    """Pairs the items of "old_items" and "new_items" with the same key, in
+       order. Appends the pairs to "pairs" and returns the lists of the
+       items left over."""
+
+    by_key = collections.defaultdict(collections.deque)
+    for item in new_items:
+        by_key[keyfn(item)].append(item)
+
+    (old_left, matched) = ([], set())
+    for item in old_items:
+        candidates = by_key.get(keyfn(item))
+        if candidates:
+            n = candidates.popleft()
+            pairs.append((item, n))
+            matched.add(n[ITEM_ID])
+        else:
+            old_left.append(item)
+    return (old_left, [n for n in new_items if n[ITEM_ID] not in matched])
+
+def match(old_items, new_items):
+    """Returns a list of (old, new) pairs of the matching objects of a
+       canvas. See the module documentation for how they're matched."""
+
+    pairs = []
+    keyfns = [lambda i: (i[ITEM_CONTENT], i[ITEM_POS], i[ITEM_SUBTREE]),
+              lambda i: (i[ITEM_CONTENT], i[ITEM_SUBTREE]),
+              lambda i: (i[ITEM_CONTENT], i[ITEM_POS]),
+              lambda i: (i[ITEM_TYPE], i[ITEM_POS])]
+    for keyfn in keyfns:
+        if not (old_items and new_items):
+            return pairs
+        (old_items, new_items) = _match_by(old_items, new_items, keyfn, pairs)
+
+    if not (old_items and new_items):
+        return pairs
+
+    if len(old_items) * len(new_items) > LCS_LIMIT:
+        _match_by(old_items, new_items, lambda i: i[ITEM_TYPE], pairs)
+        return pairs
+
+    matcher = difflib.SequenceMatcher(None,
+                                      [i[ITEM_TYPE] for i in old_items],
+                                      [i[ITEM_TYPE] for i in new_items])
+    for (a, b, size) in matcher.get_matching_blocks():
+        pairs.extend(zip(old_items[a:a + size], new_items[b:b + size]))
+    return pairs
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print 'Usage: %s OLD_FILE NEW_FILE' % sys.argv[0]
+        sys.exit(2)
+
+    diff = PdDiff(pd.PdFile(sys.argv[1]).patch, pd.PdFile(sys.argv[2]).patch)
+    if diff:
+        print diff
+        sys.exit(1)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+""" Tests for pddsp.py """
+
+import pd
+import pddsp
+import pdtest
+from pdexceptions import *
+
+# osc~ -> sub-patch (gain) -> dac~, with a separate noise~ -> dac~ chain.
+# The sub-patch's inlets are numbered left to right, so the inlet~ on the
+# right is its second inlet.
+PATCH_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 10 10 osc~ 440;
+#N canvas 0 0 450 300 gain 0;
+#X obj 100 10 inlet~;
+#X obj 10 10 inlet;
+#X obj 10 40 *~;
+#X obj 10 70 outlet~;
+#X connect 0 0 2 0;
+#X connect 1 0 2 1;
+#X connect 2 0 3 0;
+#X restore 10 40 pd gain;
+#X obj 10 70 dac~;
+#X obj 100 10 noise~;
+#X obj 100 40 lop~ 1000;
+#X msg 200 10 0.5;
+#X connect 0 0 1 1;
+#X connect 3 0 4 0;
+#X connect 4 0 2 1;
+#X connect 1 0 2 0;
+#X connect 5 0 1 0;
+"""
+
+GAIN_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 100 10 inlet~;
+#X obj 10 10 inlet;
+#X obj 10 40 *~;
+#X obj 10 70 outlet~;
+#X connect 0 0 2 0;
+#X connect 1 0 2 1;
+#X connect 2 0 3 0;
+"""
+
+def graph(text = PATCH_TEXT):
+    return pddsp.PdDspGraph(pd.PdPatch(text.splitlines(True)))
+
+@pdtest.passfail
+def testGraph():
+    g = graph()
+    expected = [(0,), (1, 0), (1, 2), (1, 3), (2,), (3,), (4,)]
+    if g.nodes() != expected:
+        raise pdtest.Unexpected('Nodes', expected, g.nodes())
+    # The message to the control inlet isn't a signal connection
+    expected = [((0,), (1, 0)), ((1, 0), (1, 2)), ((1, 2), (1, 3)),
+                ((1, 3), (2,)), ((3,), (4,)), ((4,), (2,))]
+    if sorted(g.edges()) != expected:
+        raise pdtest.Unexpected('Edges', expected, sorted(g.edges()))
+
+    expected = [(0,), (1, 0), (1, 2), (1, 3), (3,), (4,), (2,)]
+    if g.order() != expected:
+        raise pdtest.Unexpected('Order', expected, g.order())
+    expected = [[(0,), (1, 0), (1, 2), (1, 3), (2,), (3,), (4,)]]
+    if g.chains() != expected or g.chain_counts() != [7]:
+        raise pdtest.Unexpected('Chains', expected, g.chains())
+
+@pdtest.passfail
+def testLoop():
+    g = graph(PATCH_TEXT + '#X connect 2 0 0 0;\n')
+    expected = [[(0,), (1, 0), (1, 2), (1, 3), (2,)]]
+    if g.loops() != expected:
+        raise pdtest.Unexpected('Loops', expected, g.loops())
+    try:
+        g.order()
+    except PdDspLoop, e:
+        if e.loop != expected[0]:
+            raise pdtest.Unexpected('Loop', expected[0], e.loop)
+    else:
+        raise pdtest.Unexpected('PdDspLoop', 'raised', 'not raised')
+
+@pdtest.passfail
+def testInvalidation():
+    patch = pd.PdPatch(PATCH_TEXT.splitlines(True))
+    g = pddsp.PdDspGraph(patch)
+    order = g.order()
+    infos = dict(g._infos)
+    # Unchanged, the order is kept
+    if g.order() != order or g._order is None:
+        raise pdtest.Unexpected('Cached order', order, g.order())
+
+    # Disconnecting the noise~ chain from the dac~ splits the chains. Only
+    # the top level canvas is looked at again.
+    patch.root()[len(patch.root()) - 3].value['dest_id'] = '5'
+    if g.chain_counts() != [5, 2]:
+        raise pdtest.Unexpected('Chains', [5, 2], g.chain_counts())
+    sub = patch.root()[1].digest()
+    if g._infos[sub] is not infos[sub] or len(g._infos) != 2:
+        raise pdtest.Unexpected('Canvas infos kept', infos, g._infos)
+
+@pdtest.passfail
+def testAbstraction():
+    # The same gain as an abstraction, used twice. Each use has its own
+    # objects.
+    abstraction = pd.PdPatch(GAIN_TEXT.splitlines(True))
+    text = '''#N canvas 0 0 450 300 10;
+#X obj 10 10 osc~ 440;
+#X obj 10 40 gain~;
+#X obj 10 70 gain~;
+#X obj 10 100 dac~;
+#X connect 0 0 1 1;
+#X connect 1 0 2 1;
+#X connect 2 0 3 0;
+'''
+    g = pddsp.PdDspGraph(pd.PdPatch(text.splitlines(True)),
+                         {'gain~': abstraction})
+    expected = [(0,), (1, 0), (1, 2), (1, 3), (2, 0), (2, 2), (2, 3), (3,)]
+    if g.order() != expected:
+        raise pdtest.Unexpected('Order', expected, g.order())
+
+def test():
+    testGraph()
+    testLoop()
+    testInvalidation()
+    testAbstraction()
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+
+""" The signal (DSP) graph of a Pd patch.
+
+    PdDspGraph: the signal objects of a patch and the connections between
+                them, in the order Pd would run them
+    abstraction_patches(): the abstractions loaded by pd.load_recursive()
+
+Signal objects are those whose type ends in "~". Sub-patches, and
+abstractions where their patches are given, are included through their
+inlet~ and outlet~ objects, so a signal connected into a sub-patch continues
+from the inlet~ it's connected to. Each object in the graph is identified by
+its path: the object ids of the sub-patches and abstractions it's in, from
+the top level canvas down, followed by its own id, e.g. (3, 0) for object 0
+in the sub-patch with id 3.
+
+    graph = pddsp.PdDspGraph(patch)
+    for chain in graph.chains():
+        print len(chain), 'objects'
+    for path in graph.order():
+        print path, graph.obj(path)
+
+The graph is worked out again when the patch is changed, which is found
+from the patch's content digest. Only the canvases which changed are looked
+at again; the rest are found by their digests. The order and chains are kept
+until the patch changes.
+
+A connection is taken to carry a signal if it's from a signal object or an
+outlet~, and to a signal object or an inlet~. Signal objects with control
+outlets, such as env~, are counted as signal connections too. Sub-patches
+with block~ or switch~ are sorted with the rest of the patch, although Pd
+runs them separately."""
+
+import os
+import sys
+import heapq
+import pd
+from pdexceptions import *
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+SIGNAL_SUFFIX = '~'
+INLETS = ('inlet', 'inlet~')
+OUTLETS = ('outlet', 'outlet~')
+
+
+class _CanvasInfo(object):
+    """The parts of a canvas the graph is built from, as object ids and
+       child indexes. Canvases with the same content have the same
+       _CanvasInfo, so it's kept by the canvas's digest."""
+
+    def __init__(self, node):
+        children = node[:]
+        if node.parent is not None and children and \
+           children[-1].value.element == pd.RESTORE:
+            # The sub-patch's own restore is part of the parent canvas
+            children = children[:-1]
+
+        # The index of each object's node in the canvas, by object id
+        self.index = {}
+        # The object ids of the signal objects, and of the sub-patches and
+        # possible abstractions with the abstraction's type
+        (self.signal, self.branches, self.externals) = (set(), [], [])
+        (inlets, outlets) = ([], [])
+        self.connects = []
+
+        obj_id = 0
+        for (i, child) in enumerate(children):
+            obj = child.value
+            if obj.element == pd.CONNECT:
+                try:
+                    self.connects.append(tuple([int(obj.attrs[k]) for k in \
+                                                obj.attr_names]))
+                except (TypeError, ValueError):
+                    pass
+                continue
+
+            self.index[obj_id] = i
+            if not child.leaf():
+                self.branches.append(obj_id)
+            elif obj.element == pd.OBJ:
+                typ = obj.attrs.get('type') or ''
+                if typ.endswith(SIGNAL_SUFFIX):
+                    self.signal.add(obj_id)
+                if not obj.vanilla:
+                    self.externals.append((obj_id, typ))
+                # Inlets and outlets are numbered from left to right
+                if typ in INLETS:
+                    inlets.append((_x(obj), obj_id))
+                elif typ in OUTLETS:
+                    outlets.append((_x(obj), obj_id))
+            obj_id += 1
+
+        self.inlets = [obj_id for (x, obj_id) in sorted(inlets)]
+        self.outlets = [obj_id for (x, obj_id) in sorted(outlets)]
+
+def _x(obj):
+    try:
+        return float(obj.attrs.get('x'))
+    except (TypeError, ValueError):
+        return 0
+
+
+class PdDspGraph(object):
+    """The signal graph of the PdPatch "patch". "abstractions" is an
+       optional dict of object types to the PdPatch of the abstraction, such
+       as returned by abstraction_patches(). Abstractions not given aren't
+       included."""
+
+    def __init__(self, patch, abstractions = None):
+        self.patch = patch
+        self.abstractions = abstractions or {}
+        # _CanvasInfo by canvas digest
+        self._infos = {}
+        self._version = None
+
+    def _check(self):
+        # Builds the graph again if the patch or an abstraction has changed
+        version = (self.patch.digest(),
+                   [(typ, p.digest()) for (typ, p) in \
+                    sorted(self.abstractions.iteritems())])
+        if version == self._version:
+            return
+        (self._objects, self._succ, self._edges) = ({}, {}, [])
+        (self._order, self._chains) = (None, None)
+        used = set()
+        self._expand(self.patch.root(), (), (), used)
+        # Canvases no longer in the patch aren't kept
+        for digest in set(self._infos) - used:
+            del self._infos[digest]
+        self._version = version
+
+    def _info(self, node, used):
+        digest = node.digest()
+        used.add(digest)
+        info = self._infos.get(digest)
+        if info is None:
+            info = self._infos[digest] = _CanvasInfo(node)
+        return info
+
+    def _expand(self, node, prefix, stack, used):
+        info = self._info(node, used)
+
+        # The canvases of the sub-patches and abstractions in this canvas,
+        # with the abstractions each is inside
+        inner = [(obj_id, node[info.index[obj_id]], stack) \
+                 for obj_id in info.branches]
+        for (obj_id, typ) in info.externals:
+            patch = self.abstractions.get(typ)
+            # An abstraction can't contain itself
+            if patch is not None and typ not in stack:
+                inner.append((obj_id, patch.root(), stack + (typ,)))
+        inner_infos = {}
+        for (obj_id, child, child_stack) in inner:
+            inner_infos[obj_id] = self._info(child, used)
+            self._expand(child, prefix + (obj_id,), child_stack, used)
+
+        # Abstractions named with a "~" are replaced by their contents
+        for obj_id in info.signal:
+            if obj_id not in inner_infos:
+                path = prefix + (obj_id,)
+                self._objects[path] = node[info.index[obj_id]].value
+                self._succ[path] = []
+
+        for (src, outlet, dest, inlet) in info.connects:
+            src_path = self._port(prefix, src, outlet, info, inner_infos,
+                                  'outlets')
+            dest_path = self._port(prefix, dest, inlet, info, inner_infos,
+                                   'inlets')
+            if src_path in self._succ and dest_path in self._succ:
+                self._succ[src_path].append(dest_path)
+                self._edges.append((src_path, dest_path))
+
+    def _port(self, prefix, obj_id, n, info, inner_infos, ports):
+        # The path of the signal object a connection to or from outlet or
+        # inlet "n" of the object "obj_id" is made with, or None
+        inner = inner_infos.get(obj_id)
+        if inner is not None:
+            ids = getattr(inner, ports)
+            if 0 <= n < len(ids) and ids[n] in inner.signal:
+                return prefix + (obj_id, ids[n])
+        elif obj_id in info.signal:
+            return prefix + (obj_id,)
+        return None
+
+    def __len__(self):
+        self._check()
+        return len(self._objects)
+
+    def __contains__(self, path):
+        self._check()
+        return path in self._objects
+
+    def nodes(self):
+        """Returns the paths of the signal objects, sorted."""
+
+        self._check()
+        return sorted(self._objects)
+
+    def obj(self, path):
+        """Returns the PdObject of the signal object "path"."""
+
+        self._check()
+        return self._objects[path]
+
+    def edges(self):
+        """Returns (src, dest) tuples of the paths of each signal
+           connection."""
+
+        self._check()
+        return list(self._edges)
+
+    def successors(self, path):
+        self._check()
+        return list(self._succ[path])
+
+    def order(self):
+        """Returns the paths of the signal objects in an order where each
+           object comes after the objects connected to its inlets. Objects
+           which could go in either order are sorted by path. Raises
+           PdDspLoop if objects are connected in a loop."""
+
+        self._check()
+        if self._order is None:
+            succ = self._succ
+            pending = dict.fromkeys(succ, 0)
+            for dests in succ.itervalues():
+                for dest in dests:
+                    pending[dest] += 1
+            ready = [p for (p, n) in pending.iteritems() if n == 0]
+            heapq.heapify(ready)
+            order = []
+            while ready:
+                path = heapq.heappop(ready)
+                order.append(path)
+                for dest in succ[path]:
+                    pending[dest] -= 1
+                    if pending[dest] == 0:
+                        heapq.heappush(ready, dest)
+            if len(order) != len(succ):
+                raise PdDspLoop(self.loops()[0])
+            self._order = order
+        return list(self._order)
+
+    def loops(self):
+        """Returns a list of the loops of signal objects, each a sorted list
+           of the paths of the objects in it."""
+
+        self._check()
+        loops = []
+        for scc in _sccs(sorted(self._succ), self._succ):
+            if len(scc) > 1 or scc[0] in self._succ[scc[0]]:
+                loops.append(sorted(scc))
+        return sorted(loops)
+
+    def chains(self):
+        """Returns the groups of signal objects connected to each other, as
+           sorted lists of their paths, largest first. The number of objects
+           in a chain is a rough guide to the DSP load it adds."""
+
+        self._check()
+        if self._chains is None:
+            # Union-find, with each path's group leader
+            leader = dict([(p, p) for p in self._succ])
+
+            def find(p):
+                while leader[p] != p:
+                    leader[p] = leader[leader[p]]
+                    p = leader[p]
+                return p
+
+            for (src, dest) in self._edges:
+                (a, b) = (find(src), find(dest))
+                if a != b:
+                    leader[max(a, b)] = min(a, b)
+            groups = {}
+            for p in self._succ:
+                groups.setdefault(find(p), []).append(p)
+            chains = [sorted(g) for g in groups.itervalues()]
+            chains.sort(key = lambda c: (-len(c), c[0]))
+            self._chains = chains
+        return [list(c) for c in self._chains]
+
+    def chain_counts(self):
+        """Returns the number of objects in each of chains()."""
+
+        return [len(c) for c in self.chains()]
+
+
+def _sccs(nodes, succ):
+    """Returns the strongly connected components of the graph "succ", a
+       dict of each node to a list of the nodes it connects to."""
+
+    (index, low, on_stack) = ({}, {}, set())
+    (stack, found) = ([], [])
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(succ[root]))]
+        while work:
+            (v, children) = work[-1]
+            for w in children:
+                if w not in index:
+                    index[w] = low[w] = len(index)
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(succ[w])))
+                    break
+                elif w in on_stack:
+                    low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+                if low[v] == index[v]:
+                    scc = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        scc.append(w)
+                        if w == v:
+                            break
+                    found.append(scc)
+    return found
+
+def abstraction_patches(files):
+    """Returns a dict of object types to the PdPatch of each abstraction,
+       from the dict of PdFiles returned by pd.load_recursive()."""
+
+    found = {}
+    for f in files.itervalues():
+        for (typ, path) in f.abstractions().iteritems():
+            loaded = files.get(os.path.abspath(path))
+            if loaded is not None:
+                found[typ] = loaded.patch
+    return found
+
+
+if __name__ == '__main__':
+    import getopt
+    import pdincludes
+    try:
+        options, args = getopt.getopt(sys.argv[1:], 'i:h',
+                                      ['include=', 'help'])
+    except getopt.GetoptError, err:
+        print str(err)
+        sys.exit(2)
+
+    dirs = [arg for (opt, arg) in options if opt in ('-i', '--include')]
+    if len(args) != 1 or [o for (o, a) in options if o in ('-h', '--help')]:
+        print 'Usage: %s [-i DIR]... FILE' % sys.argv[0]
+        print 'Lists the signal chains and DSP loops of the Pd patch FILE.'
+        sys.exit(2)
+
+    files = pd.load_recursive(args[0], pdincludes.PdIncludes(dirs))
+    graph = PdDspGraph(files[os.path.abspath(args[0])].patch,
+                       abstraction_patches(files))
+    print '%d signal objects' % len(graph)
+    for chain in graph.chains():
+        print '%5d objects from %s' % (len(chain), graph.obj(chain[0]))
+    loops = graph.loops()
+    for loop in loops:
+        print 'DSP loop: %s' % ', '.join([str(graph.obj(p)) for p in loop])
+    sys.exit(loops and 1 or 0)
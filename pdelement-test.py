@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+""" Tests for pdelement.py """
+
+import sys
+import StringIO
+import pdelement
+import pdtest
+
+def old_get(name, params):
+    """The definition lookup get() made before it used the decoders, with
+       "params" applied to the attribute names each time, for comparison."""
+
+    def make_dict(attrs, params):
+        kv = dict(zip(attrs, params))
+        if len(params) < len(attrs):
+            kv.update([(k, None) for k in attrs[len(params):]])
+            return (kv, [])
+        return (kv, params[len(attrs):])
+
+    known = True
+    if name == 'canvas':
+        if len(params) == 5:
+            attrs = pdelement.VANILLA_ELEMENTS['canvas-5']
+        else:
+            attrs = pdelement.VANILLA_ELEMENTS['canvas-6']
+    elif name == 'obj':
+        attrs = pdelement.OBJ_ATTRS
+        if len(params) >= pdelement.OBJ_NUM_ATTRS:
+            typ = params[pdelement.TYPE_INDEX]
+            oattrs = pdelement.VANILLA_OBJECTS.get(typ)
+            if oattrs is not None:
+                attrs = attrs + oattrs
+            else:
+                known = pdelement.is_num_or_var(typ)
+        else:
+            known = False
+    else:
+        attrs = pdelement.VANILLA_ELEMENTS[name]
+
+    (kv, extra_params) = make_dict(attrs, params)
+    return (tuple(attrs), kv, extra_params, known)
+
+def param_lists(num_attrs):
+    """Returns lists of params shorter than, as long as and longer than
+       "num_attrs"."""
+
+    params = ['p%d' % i for i in range(num_attrs + 2)]
+    return [params[:n] for n in (0, num_attrs // 2, num_attrs - 1, num_attrs,
+                                 num_attrs + 2) if n >= 0]
+
+@pdtest.passfail
+def testSpecialCases():
+    # The elements and objects whose attributes the old get() worked out
+    # itself, or which have the most attributes
+    cases = [('array', ['tab', '4', 'float', '1']),
+             ('array', ['tab', '4']),
+             ('coords', ['0', '-1', '1', '1', '85', '60', '1', '0', '0']),
+             ('coords', ['0', '-1']),
+             ('canvas', ['0', '0', '450', '300', '10']),
+             ('canvas', ['0', '0', '450', '300', 'sub', '0']),
+             ('obj', ['10', '10']),
+             ('obj', ['10', '10', 'myabs', '1', '2']),
+             ('obj', ['10', '10', '\\$1', '1']),
+             ('obj', ['10', '10', '5'])]
+    for typ in ('tgl', 'toggle', 'hsl', 'vsl', 'nbx', 'bng', 'cnv', 'vu',
+                'hradio'):
+        cases.append(('obj', ['10', '10', typ]))
+        cases.append(('obj', ['10', '10', typ, '15', '0', 'empty']))
+        attrs = pdelement.OBJ_ATTRS + pdelement.VANILLA_OBJECTS[typ]
+        cases.append(('obj', ['10', '10', typ] + \
+                      ['v%d' % i for i in range(len(attrs))]))
+
+    for (name, params) in cases:
+        expected = old_get(name, params)
+        got = pdelement.get(name, params)
+        if got != expected:
+            raise pdtest.Unexpected('%s %s' % (name, params), expected, got)
+
+    expected = (('name', 'size', 'elem_type', 'save_flag'),
+                {'name': 'tab', 'size': '4', 'elem_type': 'float',
+                 'save_flag': '1'}, [], True)
+    got = pdelement.get('array', ['tab', '4', 'float', '1'])
+    if got != expected:
+        raise pdtest.Unexpected('array', expected, got)
+
+@pdtest.passfail
+def testAllDefinitions():
+    for name in pdelement.VANILLA_ELEMENTS:
+        if name in ('canvas-5', 'canvas-6'):
+            continue
+        num_attrs = len(pdelement.VANILLA_ELEMENTS[name])
+        for params in param_lists(num_attrs):
+            expected = old_get(name, params)
+            got = pdelement.get(name, params)
+            if got != expected:
+                raise pdtest.Unexpected('%s %s' % (name, params), expected,
+                                        got)
+
+    for (typ, attrs) in pdelement.VANILLA_OBJECTS.items():
+        for params in param_lists(len(attrs)):
+            params = ['10', '10', typ] + params
+            expected = old_get('obj', params)
+            got = pdelement.get('obj', params)
+            if got != expected:
+                raise pdtest.Unexpected('obj %s' % params, expected, got)
+
+@pdtest.passfail
+def testUnknown():
+    stdout = sys.stdout
+    sys.stdout = out = StringIO.StringIO()
+    try:
+        got = [pdelement.get('nosuch', ['1', '2']),
+               pdelement.get('nosuch', ['3']),
+               pdelement.get('quiet', [], warn = False)]
+    finally:
+        sys.stdout = stdout
+
+    expected = [((), {}, ['1', '2'], False), ((), {}, ['3'], False),
+                ((), {}, [], False)]
+    if got != expected:
+        raise pdtest.Unexpected('unknown', expected, got)
+    # The warning is printed once, and not when "warn" is False
+    expected = 'Warning: No built-in definition for nosuch.\n'
+    if out.getvalue() != expected:
+        raise pdtest.Unexpected('warning', expected, out.getvalue())
+
+def test():
+    testSpecialCases()
+    testAllDefinitions()
+    testUnknown()
+
+if __name__ == '__main__':
+    test()
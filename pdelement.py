@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import sys
+from itertools import izip
 
 # Element Definitions
 #
@@ -13,6 +14,9 @@ import sys
 #   The scheme used here stores the attribute names in order for each PD
 # object type. This requires less code to maintain since there is just a
 # single list of attributes in order here.
+#   The attribute names are stored as tuples. Each PdObject refers to these
+# directly rather than taking a copy, so they are shared by every object
+# parsed and must not be modified.
 #
 
 # These are built-in to pd-vanilla. The keys are all names that can occur after
@@ -28,25 +32,25 @@ import sys
 ARRAY_DATA = 'array-data'
 
 VANILLA_ELEMENTS = {
-    'array':        ['name', 'size', 'save_flag'],
-    ARRAY_DATA:     ['start_idx', 'values'],
+    'array':        ('name', 'size', 'elem_type', 'save_flag'),
+    ARRAY_DATA:     ('start_idx', 'values'),
     # There are two types of canvas, define both
-    'canvas-5':     ['x', 'y', 'width', 'height', 'font_size'],
-    'canvas-6':     ['x', 'y', 'width', 'height', 'name', 'open_on_load'],
-    'connect':      ['src_id', 'src_out', 'dest_id', 'dest_out'],
-    'coords':       ['x1', 'y2', 'x2', 'y1', 'width', 'heigth', 'gop'],
-    'declare':      ['path_type', 'path'],
-    'floatatom':    ['x', 'y', 'width', 'lower', 'upper', 'label_pos', 'label',
-                     'receive', 'send'],
-    'import':       ['name'],
-    'msg':          ['x', 'y', 'text'],
-    'obj':          ['x', 'y', 'type'],
-    'restore':      ['x', 'y', 'name'],
-    'scalar':       [],
-    'struct':       [],
-    'symbolatom':   ['x', 'y', 'width', 'lower', 'upper', 'label_pos', 'label',
-                     'receive', 'send'],
-    'text':         ['x', 'y', 'text']
+    'canvas-5':     ('x', 'y', 'width', 'height', 'font_size'),
+    'canvas-6':     ('x', 'y', 'width', 'height', 'name', 'open_on_load'),
+    'connect':      ('src_id', 'src_out', 'dest_id', 'dest_out'),
+    'coords':       ('x1', 'y2', 'x2', 'y1', 'width', 'heigth', 'gop'),
+    'declare':      ('path_type', 'path'),
+    'floatatom':    ('x', 'y', 'width', 'lower', 'upper', 'label_pos', 'label',
+                     'receive', 'send'),
+    'import':       ('name',),
+    'msg':          ('x', 'y', 'text'),
+    'obj':          ('x', 'y', 'type'),
+    'restore':      ('x', 'y', 'name'),
+    'scalar':       (),
+    'struct':       (),
+    'symbolatom':   ('x', 'y', 'width', 'lower', 'upper', 'label_pos', 'label',
+                     'receive', 'send'),
+    'text':         ('x', 'y', 'text')
     }
 
 
@@ -54,244 +58,244 @@ VANILLA_ELEMENTS = {
 # type name that appears after the x/y parameters (chunk-type obj x y type).
 # The values are the attributes for the object.
 VANILLA_OBJECTS = {
-    '!=':           ['rhs'],
-    '%':            ['rhs'],
-    '&&':           ['rhs'],
-    '&':            ['rhs'],
-    '*':            ['rhs'],
-    '*~':           ['rhs'],
-    '+':            ['rhs'],
-    '+~':           ['rhs'],
-    '-':            ['rhs'],
-    '-~':           ['rhs'],
-    '/':            ['rhs'],
-    '/~':           ['rhs'],
-    '<':            ['rhs'],
-    '<<':           ['rhs'],
-    '<=':           ['rhs'],
-    '==':           ['rhs'],
-    '>':            ['rhs'],
-    '>=':           ['rhs'],
-    '>>':           ['rhs'],
-    '|':            ['rhs'],
-    '||':           ['rhs'],
-    'abs':          [],
-    'abs~':         [],
-    'adc~':         ['inputs'],
-    'append':       ['template_name', 'fields'],
-    'arraysize':    ['array_name'],
-    'atan':         [],
-    'atan2':        [],
-    'bag':          [],
-    'bang':         [],
-    'bang~':        [],
-    'bendin':       ['channel'],
-    'bendout':      ['channel'],
-    'biquad~':      ['coeffs'],
-    'block~':       ['size', 'overlap', 'resampling'],
-    'bng':          ['size', 'hold', 'interrupt', 'init',
+    '!=':           ('rhs',),
+    '%':            ('rhs',),
+    '&&':           ('rhs',),
+    '&':            ('rhs',),
+    '*':            ('rhs',),
+    '*~':           ('rhs',),
+    '+':            ('rhs',),
+    '+~':           ('rhs',),
+    '-':            ('rhs',),
+    '-~':           ('rhs',),
+    '/':            ('rhs',),
+    '/~':           ('rhs',),
+    '<':            ('rhs',),
+    '<<':           ('rhs',),
+    '<=':           ('rhs',),
+    '==':           ('rhs',),
+    '>':            ('rhs',),
+    '>=':           ('rhs',),
+    '>>':           ('rhs',),
+    '|':            ('rhs',),
+    '||':           ('rhs',),
+    'abs':          (),
+    'abs~':         (),
+    'adc~':         ('inputs',),
+    'append':       ('template_name', 'fields'),
+    'arraysize':    ('array_name',),
+    'atan':         (),
+    'atan2':        (),
+    'bag':          (),
+    'bang':         (),
+    'bang~':        (),
+    'bendin':       ('channel',),
+    'bendout':      ('channel',),
+    'biquad~':      ('coeffs',),
+    'block~':       ('size', 'overlap', 'resampling'),
+    'bng':          ('size', 'hold', 'interrupt', 'init',
                      'send', 'receive', 'label', 'label_x', 'label_y', 'font',
-                     'font_size', 'bg_color', 'fg_color', 'label_color'],
-    'bp~':          ['freq', 'q'],
-    'catch~':       ['bus_name'],
-    'change':       ['init'],
-    'clip':         ['lower', 'upper'],
-    'clip~':        ['lower', 'upper'],
-    'closebang':    [],
-    'cnv':          ['size', 'width', 'height', 'send',
+                     'font_size', 'bg_color', 'fg_color', 'label_color'),
+    'bp~':          ('freq', 'q'),
+    'catch~':       ('bus_name',),
+    'change':       ('init',),
+    'clip':         ('lower', 'upper'),
+    'clip~':        ('lower', 'upper'),
+    'closebang':    (),
+    'cnv':          ('size', 'width', 'height', 'send',
                      'receive', 'label', 'label_x', 'label_y', 'font',
-                     'font_size', 'bg_color', 'label_color', 'reserved'],
-    'cos':          [],
-    'cos~':         [],
-    'cpole~':       ['re', 'im'],
-    'cputime':      [],
-    'ctlin':        ['controller', 'channel'],
-    'ctlout':       ['controller', 'channel'],
-    'czero_rev~':   ['re', 'im'],
-    'czero~':       ['re', 'im'],
-    'dac~':         ['outputs'],
-    'dbtopow':      [],
-    'dbtopow~':     [],
-    'dbtorms':      [],
-    'dbtorms~':     [],
-    'declare':      ['path_type', 'path'],
-    'delay':        ['ms'],
-    'delread~':     ['buf', 'ms'],
-    'delwrite~':    ['buf', 'ms'],
-    'div':          ['rhs'],
-    'dmstodb':      [],
-    'drawcurve':    [],
-    'drawnumber':   [],
-    'drawpolygon':  [],
-    'drawsymbol':   [],
-    'drunk':        ['upper', 'step'],
-    'element':      [],
-    'env~':         ['window', 'period'],
-    'exp':          [],
-    'expr':         ['expr'],
-    'expr~':        ['expr'],
-    'exp~':         ['base'],
-    'fft~':         [],
-    'filledcurve':  [],
-    'filledpolygon': [],
-    'float':        ['init'],
-    'framp~':       [],
-    'ftom':         [],
-    'ftom~':        [],
-    'get':          [],
-    'getsize':      [],
-    'hip~':         ['freq'],
-    'hradio':       ['size', 'new_old', 'init', 'number',
+                     'font_size', 'bg_color', 'label_color', 'reserved'),
+    'cos':          (),
+    'cos~':         (),
+    'cpole~':       ('re', 'im'),
+    'cputime':      (),
+    'ctlin':        ('controller', 'channel'),
+    'ctlout':       ('controller', 'channel'),
+    'czero_rev~':   ('re', 'im'),
+    'czero~':       ('re', 'im'),
+    'dac~':         ('outputs',),
+    'dbtopow':      (),
+    'dbtopow~':     (),
+    'dbtorms':      (),
+    'dbtorms~':     (),
+    'declare':      ('path_type', 'path'),
+    'delay':        ('ms',),
+    'delread~':     ('buf', 'ms'),
+    'delwrite~':    ('buf', 'ms'),
+    'div':          ('rhs',),
+    'dmstodb':      (),
+    'drawcurve':    (),
+    'drawnumber':   (),
+    'drawpolygon':  (),
+    'drawsymbol':   (),
+    'drunk':        ('upper', 'step'),
+    'element':      (),
+    'env~':         ('window', 'period'),
+    'exp':          (),
+    'expr':         ('expr',),
+    'expr~':        ('expr',),
+    'exp~':         ('base',),
+    'fft~':         (),
+    'filledcurve':  (),
+    'filledpolygon': (),
+    'float':        ('init',),
+    'framp~':       (),
+    'ftom':         (),
+    'ftom~':        (),
+    'get':          (),
+    'getsize':      (),
+    'hip~':         ('freq',),
+    'hradio':       ('size', 'new_old', 'init', 'number',
                      'send', 'receive', 'label', 'label_x', 'label_y', 'font',
                      'font_size', 'bg_color', 'fg_color', 'label_color',
-                     'default_value'],
-    'hslider':      ['width', 'height', 'bottom', 'top',
+                     'default_value'),
+    'hslider':      ('width', 'height', 'bottom', 'top',
                      'log', 'init', 'send', 'receive', 'label', 'label_x',
                      'label_y', 'font', 'font_size', 'bg_color', 'fg_color',
-                     'label_color', 'default_value', 'steady_on_click'],
-    'ifft~':        [],
-    'import':       ['name'],
-    'initbang':     [],
-    'inlet':        ['name'],
-    'inlet~':       ['name'],
-    'int':          ['init'],
-    'key':          [],
-    'keyname':      [],
-    'keyup':        [],
-    'line':         ['init', 'grain_rate'],
-    'line~':        [],
-    'list':         ['init'],
-    'loadbang':     [],
-    'log':          [],
-    'log~':         ['base'],
-    'lop~':         ['freq'],
-    'makefilename': ['format'],
-    'makenote':     ['velocity', 'duration'],
-    'makesymbol':   ['format'],
-    'max':          [],
-    'max~':         [],
-    'metro':        ['ms'],
-    'midiin':       [],
-    'midiout':      [],
-    'midirealtimein': [],
-    'min':          [],
-    'min~':         [],
-    'mod':          ['value'],
-    'moses':        ['value'],
-    'mtof':         [],
-    'mtof~':        [],
-    'namecanvas':   [],
-    'nbx':          ['size', 'height', 'min', 'max', 'log',
+                     'label_color', 'default_value', 'steady_on_click'),
+    'ifft~':        (),
+    'import':       ('name',),
+    'initbang':     (),
+    'inlet':        ('name',),
+    'inlet~':       ('name',),
+    'int':          ('init',),
+    'key':          (),
+    'keyname':      (),
+    'keyup':        (),
+    'line':         ('init', 'grain_rate'),
+    'line~':        (),
+    'list':         ('init',),
+    'loadbang':     (),
+    'log':          (),
+    'log~':         ('base',),
+    'lop~':         ('freq',),
+    'makefilename': ('format',),
+    'makenote':     ('velocity', 'duration'),
+    'makesymbol':   ('format',),
+    'max':          (),
+    'max~':         (),
+    'metro':        ('ms',),
+    'midiin':       (),
+    'midiout':      (),
+    'midirealtimein': (),
+    'min':          (),
+    'min~':         (),
+    'mod':          ('value',),
+    'moses':        ('value',),
+    'mtof':         (),
+    'mtof~':        (),
+    'namecanvas':   (),
+    'nbx':          ('size', 'height', 'min', 'max', 'log',
                      'init', 'send', 'receive', 'label', 'label_x', 'label_y',
                      'font', 'font_size', 'bg_color', 'fg_color',
-                     'label_color', 'log_height'],
-    'netreceive':   ['port_num', 'tcp_udp'],
-    'netsend':      ['tcp_udp'],
-    'noise~':       [],
-    'notein':       ['channel'],
-    'noteout':      ['channel'],
-    'openpanel':    [],
-    'osc~':         ['freq'],
-    'outlet':       ['name'],
-    'outlet~':      ['name'],
-    'pack':         ['format'],
-    'pgmin':        ['channel'],
-    'pgmout':       ['channel'],
-    'phasor~':      ['freq'],
-    'pipe':         ['data_type', 'delay'],
-    'plot':         [],
-    'pointer':      [],
-    'poly':         ['num_voices', 'steal_voices'],
-    'polytouchin':  ['channel'],
-    'polytouchout': ['channel'],
-    'pow':          ['value'],
-    'powtodb':      [],
-    'pow~':         [],
-    'print':        ['prefix'],
-    'print~':       ['prefix'],
-    'q8_rsqrt~':    [],
-    'q8_sqrt~':     [],
-    'qlist':        [],
-    'random':       ['max'],
-    'readsf~':      ['num_channels', 'buf_size'],
-    'realtime':     [],
-    'receive':      ['src'],
-    'receive~':     ['src'],
-    'rfft~':        [],
-    'rifft~':       [],
-    'rmstodb':      [],
-    'rmstodb~':     [],
-    'route':        ['format'],
-    'rpole~':       ['re'],
-    'rsqrt~':       [],
-    'rzero_rev~':   ['re'],
-    'rzero~':       ['re'],
-    'samphold~':    [],
-    'samplerate~':  [],
-    'savepanel':    [],
-    'select':       [],
-    'send':         ['dest'],
-    'send~':        ['dest'],
-    'serial':       [],
-    'set':          [],
-    'setsize':      [],
-    'sig~':         ['init'],
-    'sin':          [],
-    'snapshot~':    ['ms'],
-    'soundfiler':   [],
-    'spigot':       ['init'],
-    'sqrt':         [],
-    'sqrt~':        [],
-    'stripnote':    [],
-    'struct':       [],
-    'sublist':      ['template_name', 'field'],
-    'swap':         [],
-    'switch~':      [],
-    'symbol':       ['init'],
-    'sysexin':      [],
-    'table':        ['name', 'size'],
-    'tabosc4~':     ['table'],
-    'tabplay~':     ['table'],
-    'tabread':      ['table'],
-    'tabread4':     ['table'],
-    'tabread4~':    ['table'],
-    'tabread~':     ['table'],
-    'tabreceive~':  ['table'],
-    'tabsend~':     ['array_name'],
-    'tabwrite':     ['table'],
-    'tabwrite~':    ['table'],
-    'tan':          [],
-    'textfile':     [],
-    'threshold~':   ['val', 'deb_time', 'rest_time'],
-    'throw~':       ['name'],
-    'timer':        [],
-    'toggle':       ['size', 'init', 'send', 'receive',
+                     'label_color', 'log_height'),
+    'netreceive':   ('port_num', 'tcp_udp'),
+    'netsend':      ('tcp_udp',),
+    'noise~':       (),
+    'notein':       ('channel',),
+    'noteout':      ('channel',),
+    'openpanel':    (),
+    'osc~':         ('freq',),
+    'outlet':       ('name',),
+    'outlet~':      ('name',),
+    'pack':         ('format',),
+    'pgmin':        ('channel',),
+    'pgmout':       ('channel',),
+    'phasor~':      ('freq',),
+    'pipe':         ('data_type', 'delay'),
+    'plot':         (),
+    'pointer':      (),
+    'poly':         ('num_voices', 'steal_voices'),
+    'polytouchin':  ('channel',),
+    'polytouchout': ('channel',),
+    'pow':          ('value',),
+    'powtodb':      (),
+    'pow~':         (),
+    'print':        ('prefix',),
+    'print~':       ('prefix',),
+    'q8_rsqrt~':    (),
+    'q8_sqrt~':     (),
+    'qlist':        (),
+    'random':       ('max',),
+    'readsf~':      ('num_channels', 'buf_size'),
+    'realtime':     (),
+    'receive':      ('src',),
+    'receive~':     ('src',),
+    'rfft~':        (),
+    'rifft~':       (),
+    'rmstodb':      (),
+    'rmstodb~':     (),
+    'route':        ('format',),
+    'rpole~':       ('re',),
+    'rsqrt~':       (),
+    'rzero_rev~':   ('re',),
+    'rzero~':       ('re',),
+    'samphold~':    (),
+    'samplerate~':  (),
+    'savepanel':    (),
+    'select':       (),
+    'send':         ('dest',),
+    'send~':        ('dest',),
+    'serial':       (),
+    'set':          (),
+    'setsize':      (),
+    'sig~':         ('init',),
+    'sin':          (),
+    'snapshot~':    ('ms',),
+    'soundfiler':   (),
+    'spigot':       ('init',),
+    'sqrt':         (),
+    'sqrt~':        (),
+    'stripnote':    (),
+    'struct':       (),
+    'sublist':      ('template_name', 'field'),
+    'swap':         (),
+    'switch~':      (),
+    'symbol':       ('init',),
+    'sysexin':      (),
+    'table':        ('name', 'size'),
+    'tabosc4~':     ('table',),
+    'tabplay~':     ('table',),
+    'tabread':      ('table',),
+    'tabread4':     ('table',),
+    'tabread4~':    ('table',),
+    'tabread~':     ('table',),
+    'tabreceive~':  ('table',),
+    'tabsend~':     ('array_name',),
+    'tabwrite':     ('table',),
+    'tabwrite~':    ('table',),
+    'tan':          (),
+    'textfile':     (),
+    'threshold~':   ('val', 'deb_time', 'rest_time'),
+    'throw~':       ('name',),
+    'timer':        (),
+    'toggle':       ('size', 'init', 'send', 'receive',
                      'label', 'label_x', 'label_y', 'font', 'font_size',
                      'bg_color', 'fg_color', 'label_color', 'init_value',
-                     'default_value'],
-    'touchin':      ['channel'],
-    'touchout':     ['channel'],
-    'trigger':      ['format'],
-    'unpack':       ['format'],
-    'until':        [],
-    'value':        [],
-    'vcf~':         ['q'],
-    'vd~':          ['buf'],
-    'vline~':       [],
-    'vradio':       ['size', 'new_old', 'init', 'number',
+                     'default_value'),
+    'touchin':      ('channel',),
+    'touchout':     ('channel',),
+    'trigger':      ('format',),
+    'unpack':       ('format',),
+    'until':        (),
+    'value':        ('name',),
+    'vcf~':         ('q',),
+    'vd~':          ('buf',),
+    'vline~':       (),
+    'vradio':       ('size', 'new_old', 'init', 'number',
                      'send', 'receive', 'label', 'label_x', 'label_y', 'font',
                      'font_size', 'bg_color', 'fg_color', 'label_color',
-                     'default_value'],
-    'vslider':      ['width', 'height', 'bottom', 'top',
+                     'default_value'),
+    'vslider':      ('width', 'height', 'bottom', 'top',
                      'log', 'init', 'send', 'receive', 'label', 'label_x',
                      'label_y', 'font', 'font_size', 'bg_color', 'fg_color',
-                     'label_color', 'default_value', 'steady_on_click'],
-    'vsnapshot~':   [],
-    'vu':           ['width', 'height', 'receive', 'label',
+                     'label_color', 'default_value', 'steady_on_click'),
+    'vsnapshot~':   (),
+    'vu':           ('width', 'height', 'receive', 'label',
                      'label_x', 'label_y', 'font', 'font_size', 'bg_color',
-                     'label_color', 'scale', 'reserved'],
-    'wrap~':        [],
-    'writesf~':     [],
+                     'label_color', 'scale', 'reserved'),
+    'wrap~':        (),
+    'writesf~':     (),
     }
 
 # Aliases
@@ -311,6 +315,59 @@ OBJ_ATTRS = VANILLA_ELEMENTS['obj']
 OBJ_NUM_ATTRS = len(OBJ_ATTRS)
 TYPE_INDEX = 2
 
+# Symbols
+#
+# The attributes which name the symbols objects send to and receive from.
+# Each name space is separate, e.g. [send~ x] doesn't send to [receive x].
+# For tables and delay lines the table (or delwrite~) is the receiver and the
+# objects which use it are the senders. Every [value] of a name shares one
+# variable, so each one both sends and receives. Each value is a tuple of
+# (name space, role, attribute) tuples.
+(MESSAGE, SIGNAL, BUS, TABLE, DELAY, VALUE) = ('message', 'signal', 'bus',
+                                               'table', 'delay', 'value')
+(SEND, RECEIVE) = ('send', 'receive')
+
+SYMBOL_OBJECTS = {
+    'send':         ((MESSAGE, SEND, 'dest'),),
+    'receive':      ((MESSAGE, RECEIVE, 'src'),),
+    'send~':        ((SIGNAL, SEND, 'dest'),),
+    'receive~':     ((SIGNAL, RECEIVE, 'src'),),
+    'throw~':       ((BUS, SEND, 'name'),),
+    'catch~':       ((BUS, RECEIVE, 'bus_name'),),
+    'table':        ((TABLE, RECEIVE, 'name'),),
+    'tabsend~':     ((TABLE, SEND, 'array_name'),),
+    'arraysize':    ((TABLE, SEND, 'array_name'),),
+    'delwrite~':    ((DELAY, RECEIVE, 'buf'),),
+    'delread~':     ((DELAY, SEND, 'buf'),),
+    'vd~':          ((DELAY, SEND, 'buf'),),
+    'value':        ((VALUE, SEND, 'name'), (VALUE, RECEIVE, 'name')),
+    }
+SYMBOL_OBJECTS.update([(t, ((TABLE, SEND, 'table'),)) for t in \
+                       ('tabosc4~', 'tabplay~', 'tabread', 'tabread4',
+                        'tabread4~', 'tabread~', 'tabreceive~', 'tabwrite',
+                        'tabwrite~')])
+# The GUI objects all name their symbols 'send' and 'receive'
+SYMBOL_OBJECTS.update([(t, ((MESSAGE, SEND, 'send'),
+                            (MESSAGE, RECEIVE, 'receive'))) \
+                       for (t, a) in VANILLA_OBJECTS.items() \
+                       if 'send' in a and 'receive' in a])
+SYMBOL_OBJECTS['vu'] = ((MESSAGE, RECEIVE, 'receive'),)
+SYMBOL_OBJECTS.update([(a[0], SYMBOL_OBJECTS[a[1]]) for a in aliases \
+                       if a[1] in SYMBOL_OBJECTS])
+
+SYMBOL_ELEMENTS = {
+    'array':        ((TABLE, RECEIVE, 'name'),),
+    'floatatom':    ((MESSAGE, SEND, 'send'), (MESSAGE, RECEIVE, 'receive')),
+    'symbolatom':   ((MESSAGE, SEND, 'send'), (MESSAGE, RECEIVE, 'receive')),
+    # Messages send to the names after each "\;" in their text
+    'msg':          (),
+    }
+
+# The attribute names of the objects above. Objects with other attribute
+# names have no symbols, which can be checked without decoding the object.
+SYMBOL_ATTR_NAMES = frozenset([OBJ_ATTRS + VANILLA_OBJECTS[t] \
+                               for t in SYMBOL_OBJECTS])
+
 def is_num_or_var(text):
     # Return known if the object is just a number or dollar-arg,
     # otherwise it's an unknown abstraction.
@@ -323,26 +380,90 @@ def is_num_or_var(text):
     except ValueError, ex:
         return False
 
-def make_dict(attrs, params):
-    kv = dict(zip(attrs, params))
+# Decoders
+#
+# Every line of every patch goes through get(), so rather than working out
+# which attributes apply to each element on every call, a decoder function is
+# built once for each element and object type. get() is then a single dict
+# lookup and call. Each decoder takes the list of params and returns the same
+# tuple as get().
+
+def _decoder(attrs, known = True):
+    """Returns a decoder for the attribute names "attrs"."""
+
+    num_attrs = len(attrs)
+
+    def decode(params):
+        if len(params) >= num_attrs:
+            return (attrs, dict(izip(attrs, params)), params[num_attrs:],
+                    known)
+        else:
+            # If we don't have enough parameters set the remaining attributes
+            # to None
+            kv = dict.fromkeys(attrs)
+            kv.update(izip(attrs, params))
+            return (attrs, kv, [], known)
+
+    return decode
+
+# 'obj' decoders for each known object type, which include the x, y and type
+# attributes common to all objects.
+OBJECT_DECODERS = dict([(typ, _decoder(OBJ_ATTRS + attrs)) \
+                        for (typ, attrs) in VANILLA_OBJECTS.items()])
+
+_decode_obj_attrs = _decoder(OBJ_ATTRS)
+_decode_obj_short = _decoder(OBJ_ATTRS, known = False)
+_decode_canvas5 = _decoder(VANILLA_ELEMENTS['canvas-5'])
+_decode_canvas6 = _decoder(VANILLA_ELEMENTS['canvas-6'])
 
-    len_params = len(params)
-    len_attrs = len(attrs)
-    if len_params < len_attrs:
-        # If we don't have enough parameters set the remaining attributes to
-        # None
-        kv.update([(k, None) for k in attrs[len_params:]])
-        extra_params = []
+def _decode_canvas(params):
+    # There are two types of canvas. The first canvas in a patch has 5
+    # params, sub-patches have 6.
+    if len(params) == 5:
+        return _decode_canvas5(params)
     else:
-        # Save the additional parameters that we don't have attributes for
-        extra_params = params[len_attrs:]
+        return _decode_canvas6(params)
 
-    return (kv, extra_params)
+def _decode_obj(params):
+    # All 'obj' should start with x, y and type.
+    if len(params) >= OBJ_NUM_ATTRS:
+        decode = OBJECT_DECODERS.get(params[TYPE_INDEX])
+        if decode is not None:
+            return decode(params)
 
+        # No definition for this object type, use the minimal 'obj'
+        # attributes. Since the type wasn't found, check if it's a number or
+        # dollar-arg (a variable). If not, it's an external abstraction.
+        (attrs, kv, extra_params, known) = _decode_obj_attrs(params)
+        return (attrs, kv, extra_params, is_num_or_var(params[TYPE_INDEX]))
+    else:
+        # Don't even have x,y,type. Save what we can and return it.
+        return _decode_obj_short(params)
+
+def _decode_unknown(params):
+    # We may encounter elements which this code doesn't know about. These
+    # have no attributes, all params are kept as extra params.
+    return ((), {}, params[:], False)
+
+def decode(attrs, params, known = True):
+    """Returns the same tuple as get() for the attribute names "attrs". Used
+       for definitions which aren't built-in, e.g. objects from the external
+       libraries in pdlibs."""
+
+    return _decoder(attrs, known)(params)
+
+ELEMENT_DECODERS = dict([(name, _decoder(attrs)) \
+                         for (name, attrs) in VANILLA_ELEMENTS.items()])
+ELEMENT_DECODERS['canvas'] = _decode_canvas
+ELEMENT_DECODERS['obj'] = _decode_obj
+
+
+# Names of the elements without a definition that get() has been asked for
+_unknown_elements = set()
 
 def get(name, params, warn = True):
-    """Returns a three valued tuple containing:
-        . a list of attribute names in the order they occur in the Pd patch
+    """Returns a four valued tuple containing:
+        . a tuple of attribute names in the order they occur in the Pd patch
           file format
         . a dict of attribute names and values from "params"
         . a list of the values from "params" not used in generating the dict.
@@ -357,20 +478,16 @@ def get(name, params, warn = True):
 
        Attribute values are set to None if there are too few values in
        "params".  When there are too many parameters the remaining values
-       are return as a list in the second argument of the returned tuple.
+       are return as a list in the third value of the returned tuple.
 
-       The final arg of the return tuple indicates whether a definition was
-       found for the given "name". If a definition is not found, the name
-       is likely to be an external abstraction.
+       The final value of the returned tuple indicates whether a definition
+       was found for the given "name". If a definition is not found, the
+       name is likely to be an external abstraction. Elements with no
+       definition have no attributes and all "params" are returned as extra
+       values. A warning is printed the first time each of them is seen,
+       unless "warn" is False.
        """
 
-    # The PD line format is quite inconsistent, so we have to deal with a few
-    # special cases here...
-    len_params = len(params)
-
-    # Each of these cases attempt to get a list of attribute names for the
-    # "name" passed in. The attribute names and the values from "params" are
-    # put into a dictionary and returned to the caller.
     # NOTES:
     # - This code is Python 2.6 compatible, so I haven't used the new
     #   collections.OrderedDict.
@@ -379,56 +496,14 @@ def get(name, params, warn = True):
     #   any incompatible edge cases where the custom imlementation may differ
     #   from what is expected of a standard dict.
 
-    if name == 'canvas':
-        if len_params == 5:
-            name = 'canvas-5'
-        else:
-            name = 'canvas-6'
-
-        attrs = VANILLA_ELEMENTS[name]
-        (kv, extra_params) = make_dict(attrs, params)
-        return (attrs, kv, extra_params, True)
-    elif name == 'obj':
-        # There are a few different 'obj' cases to handle here...
-
-        # All 'obj' should start with x, y and type.
-        if len_params >= OBJ_NUM_ATTRS:
-            oattrs = VANILLA_OBJECTS.get(params[TYPE_INDEX])
-            if oattrs is not None:
-                known = True
-                attrs = OBJ_ATTRS + oattrs
-            else:
-                # No definition for this object type, use the minimal 'obj'
-                # attributes
-                attrs = OBJ_ATTRS
-                # Since the type wasn't found, check if it's a a number or
-                # dollar-arg (a variable). If not, it's a external abstration.
-                known = is_num_or_var(params[TYPE_INDEX])
-
-            (kv, extra_params) = make_dict(attrs, params)
-
-            return (attrs, kv, extra_params, known)
-        else:
-            # Don't even have x,y,type. Save what we can and return it.
-            (kv, extra_params) = make_dict(OBJ_ATTRS, params)
-            return (OBJ_ATTRS, kv, extra_params, False)
-    else:
-        try:
-            attrs = VANILLA_ELEMENTS[name]
-            known = True
-        except KeyError, ex:
-            # We may encounter elements which this code doesn't know about.
-            # In this case we add an empty definition.
-            # - Could just use a defaultdict here and omit the warning.
-            #   Is there something better to do here?
+    decode = ELEMENT_DECODERS.get(name)
+    if decode is None:
+        if name not in _unknown_elements:
+            _unknown_elements.add(name)
             if warn:
                 print 'Warning: No built-in definition for %s.' % name
-            VANILLA_ELEMENTS[name] = []
-            attrs = []
-            known = False
-
-        (kv, extra_params) = make_dict(attrs, params)
-        return (attrs, kv, extra_params, known)
+        decode = _decode_unknown
+    return decode(params)
 
 if __name__ == '__main__':
     if len(sys.argv) == 2:
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+""" Tests for pdelf.py and the libraries loaded with "declare -lib" """
+
+import os
+import shutil
+import struct
+import tempfile
+import pd
+import pdelf
+import pdincludes
+import pdtest
+from pdexceptions import *
+
+STT_OBJECT = 1
+
+def elf_data(names, elf_class = pdelf.ELFCLASS64, others = ()):
+    """Returns the text of a little endian ELF shared object whose dynamic
+       symbol table has a function for each of "names", and an undefined
+       function and a data object for each of "others", which aren't
+       exported functions."""
+
+    formats = pdelf.ELF_FORMATS[elf_class]
+    header_fmt = '<' + formats['header']
+    section_fmt = '<' + formats['section']
+    sym_fmt = '<' + formats['sym'][0]
+
+    strings = '\0'
+    syms = []
+    def sym(name, info, shndx):
+        if elf_class == pdelf.ELFCLASS32:
+            # name, value, size, info, other, shndx
+            return struct.pack(sym_fmt, name, 0, 0, info, 0, shndx)
+        # name, info, other, shndx, value, size
+        return struct.pack(sym_fmt, name, info, 0, shndx, 0, 0)
+
+    syms.append(sym(0, 0, 0))
+    func = (pdelf.STB_GLOBAL << 4) | pdelf.STT_FUNC
+    for name in names:
+        syms.append(sym(len(strings), func, 1))
+        strings += name + '\0'
+    for name in others:
+        syms.append(sym(len(strings), func, pdelf.SHN_UNDEF))
+        syms.append(sym(len(strings), (pdelf.STB_GLOBAL << 4) | STT_OBJECT,
+                        1))
+        strings += name + '\0'
+    syms = ''.join(syms)
+
+    # The header, the string table, the symbol table, then the null, dynsym
+    # and dynstr section headers
+    ident = pdelf.ELF_MAGIC + chr(elf_class) + chr(pdelf.ELFDATA2LSB) + \
+            '\x01' + '\0' * 9
+    header_size = len(ident) + struct.calcsize(header_fmt)
+    (str_off, sym_off) = (header_size, header_size + len(strings))
+    shoff = sym_off + len(syms)
+    entsize = struct.calcsize(sym_fmt)
+    sections = [struct.pack(section_fmt, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+                struct.pack(section_fmt, 0, pdelf.SHT_DYNSYM, 0, 0, sym_off,
+                            len(syms), 2, 1, 8, entsize),
+                struct.pack(section_fmt, 0, 3, 0, 0, str_off, len(strings),
+                            0, 0, 1, 0)]
+    header = struct.pack(header_fmt, 3, 62, 1, 0, 0, shoff, 0, header_size,
+                         0, 0, len(sections[0]), len(sections), 0)
+    return ident + header + strings + syms + ''.join(sections)
+
+def write(path, data):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+NAMES = ['mylib_setup', 'osc2_tilde_setup', 'setup_my0x2dobj', 'helper']
+
+@pdtest.passfail
+def testSymbols(root):
+    for elf_class in (pdelf.ELFCLASS32, pdelf.ELFCLASS64):
+        path = write(os.path.join(root, 'elf%d.so' % elf_class),
+                     elf_data(NAMES, elf_class, ['undefined_setup']))
+        got = pdelf.symbols(path)
+        if got != NAMES:
+            raise pdtest.Unexpected('symbols', NAMES, got)
+
+    expected = ['mylib', 'osc2~', 'my-obj']
+    got = pdelf.setup_objects(NAMES + ['_setup', 'setup_'])
+    if got != expected:
+        raise pdtest.Unexpected('setup_objects', expected, got)
+
+    path = write(os.path.join(root, 'bad.so'), 'not an ELF file')
+    try:
+        pdelf.symbols(path)
+        raise pdtest.Unexpected('bad', 'PdInvalidExternal', 'no exception')
+    except PdInvalidExternal:
+        pass
+
+@pdtest.passfail
+def testCache(root):
+    path = write(os.path.join(root, 'cached.so'), elf_data(NAMES))
+    cache_file = os.path.join(root, 'symbols.cache')
+    cache = pdelf.PdSymbolCache(cache_file)
+    expected = ('mylib', 'osc2~', 'my-obj')
+    if cache.objects(path) != expected:
+        raise pdtest.Unexpected('objects', expected, cache.objects(path))
+    cache.save()
+
+    # A file which hasn't changed is found in the cache, and the saved cache
+    # is used by the next PdSymbolCache
+    for c in (cache, pdelf.PdSymbolCache(cache_file)):
+        got = c.objects(path)
+        if got != expected or c._dirty:
+            raise pdtest.Unexpected('cached', (expected, False),
+                                    (got, c._dirty))
+
+    # A changed file is read again
+    write(path, elf_data(['other_setup']))
+    got = cache.objects(path)
+    if got != ('other',) or not cache._dirty:
+        raise pdtest.Unexpected('changed', ('other',), got)
+
+@pdtest.passfail
+def testDeclareLib(root):
+    libs = os.path.join(root, 'libs')
+    write(os.path.join(libs, 'mylib.pd_linux'),
+          elf_data(['mylib_setup', 'myobj_setup']))
+    inc = pdincludes.PdIncludes([libs],
+                                symbols = pdelf.PdSymbolCache())
+    text = '#N canvas 0 0 450 300 10;\n#X declare -lib mylib;\n' \
+           '#X obj 10 10 myobj;\n#X obj 10 40 nothere;\n'
+    patch = pd.PdPatch(text.splitlines(True), inc, dirname = root)
+
+    # The object is provided by the library's "_setup" symbol
+    got = [(n.value.name(), n.value.library) for (n, i, l) in \
+           patch.select(element = pd.OBJ)]
+    expected = [('myobj', 'mylib'), ('nothere', None)]
+    if got != expected:
+        raise pdtest.Unexpected('libraries', expected, got)
+    if inc.library_objects('mylib') != set(['mylib', 'myobj']):
+        raise pdtest.Unexpected('library_objects', set(['mylib', 'myobj']),
+                                inc.library_objects('mylib'))
+
+def test():
+    d = tempfile.mkdtemp()
+    try:
+        testSymbols(d)
+        testCache(d)
+        testDeclareLib(d)
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+""" Reads the symbols exported by compiled Pd externals, ala unix nm.
+
+    PdSymbolCache: the objects provided by each external, cached by file
+                   modification time.
+
+A compiled external (.pd_linux, .so etc) provides one object class for each
+"<name>_setup" function it exports, or "setup_<name>" where the object name
+contains characters which can't be used in a C function name. This module
+reads the dynamic symbol table of ELF shared objects directly, so there's no
+need to run nm. Other formats (Mach-O, PE) are not supported and are treated
+as providing no objects."""
+
+import os
+import sys
+import struct
+import marshal
+from pdexceptions import *
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+ELF_MAGIC = '\x7fELF'
+(ELFCLASS32, ELFCLASS64) = (1, 2)
+(ELFDATA2LSB, ELFDATA2MSB) = (1, 2)
+(SHT_SYMTAB, SHT_DYNSYM) = (2, 11)
+STT_FUNC = 2
+(STB_GLOBAL, STB_WEAK) = (1, 2)
+SHN_UNDEF = 0
+
+# struct formats for the parts of the file we read, for each ELF class.
+#   header      the ELF header after e_ident, up to e_shstrndx
+#   section     a section header
+#   sym         a symbol table entry, and the positions of st_name, st_info
+#               and st_shndx in the unpacked tuple
+ELF_FORMATS = {
+    ELFCLASS32: {'header':  'HHIIIIIHHHHHH',
+                 'section': 'IIIIIIIIII',
+                 'sym':     ('IIIBBH', 0, 3, 5)},
+    ELFCLASS64: {'header':  'HHIQQQIHHHHHH',
+                 'section': 'IIQQQQIIQQ',
+                 'sym':     ('IBBHQQ', 0, 1, 3)}
+    }
+
+# Index of the fields we need in the unpacked header and section header
+(E_SHOFF, E_SHENTSIZE, E_SHNUM) = (5, 10, 11)
+(SH_TYPE, SH_OFFSET, SH_SIZE, SH_LINK, SH_ENTSIZE) = (1, 4, 5, 6, 9)
+
+EI_NIDENT = 16
+SETUP_SUFFIX = '_setup'
+SETUP_PREFIX = 'setup_'
+TILDE_SUFFIX = '_tilde'
+
+
+def is_elf(filename):
+    fd = open(filename, 'rb')
+    try:
+        return fd.read(len(ELF_MAGIC)) == ELF_MAGIC
+    finally:
+        fd.close()
+
+def symbols(filename):
+    """Returns a list of the names of the functions defined and exported by
+       the ELF shared object "filename". The dynamic symbol table is used
+       if there is one, otherwise the full symbol table. Only the parts of
+       the file needed are read. Raises PdInvalidExternal if "filename" is
+       not a valid ELF file."""
+
+    fd = open(filename, 'rb')
+    try:
+        return _read_symbols(fd, filename)
+    except struct.error, ex:
+        raise PdInvalidExternal(filename, 'Truncated ELF file')
+    finally:
+        fd.close()
+
+def _read_symbols(fd, filename):
+    ident = fd.read(EI_NIDENT)
+    if len(ident) < EI_NIDENT or ident[:len(ELF_MAGIC)] != ELF_MAGIC:
+        raise PdInvalidExternal(filename, 'Not an ELF file')
+
+    (elf_class, data) = (ord(ident[4]), ord(ident[5]))
+    try:
+        formats = ELF_FORMATS[elf_class]
+        endian = {ELFDATA2LSB: '<', ELFDATA2MSB: '>'}[data]
+    except KeyError:
+        raise PdInvalidExternal(filename, 'Unknown ELF class or data ' \
+                                'encoding (%d, %d)' % (elf_class, data))
+
+    header_fmt = endian + formats['header']
+    header = struct.unpack(header_fmt, fd.read(struct.calcsize(header_fmt)))
+    (shoff, shentsize, shnum) = (header[E_SHOFF], header[E_SHENTSIZE],
+                                 header[E_SHNUM])
+    if not shoff:
+        raise PdInvalidExternal(filename, 'No section headers')
+
+    section_fmt = endian + formats['section']
+    section_size = struct.calcsize(section_fmt)
+    fd.seek(shoff)
+    first = struct.unpack(section_fmt, fd.read(section_size))
+    if shnum == 0:
+        # More sections than fit in e_shnum, the real number is in the
+        # size of the first section header
+        shnum = first[SH_SIZE]
+    fd.seek(shoff)
+    table = fd.read(shentsize * shnum)
+    sections = [struct.unpack_from(section_fmt, table, i * shentsize) \
+                for i in range(shnum)]
+
+    symtab = None
+    for sh_type in (SHT_DYNSYM, SHT_SYMTAB):
+        for section in sections:
+            if section[SH_TYPE] == sh_type:
+                symtab = section
+                break
+        if symtab:
+            break
+    if symtab is None or symtab[SH_LINK] >= shnum:
+        return []
+
+    strtab = sections[symtab[SH_LINK]]
+    fd.seek(strtab[SH_OFFSET])
+    strings = fd.read(strtab[SH_SIZE])
+    fd.seek(symtab[SH_OFFSET])
+    syms = fd.read(symtab[SH_SIZE])
+
+    (sym_fmt, name_idx, info_idx, shndx_idx) = formats['sym']
+    sym_fmt = endian + sym_fmt
+    entsize = symtab[SH_ENTSIZE] or struct.calcsize(sym_fmt)
+
+    names = []
+    for offset in range(0, len(syms) - entsize + 1, entsize):
+        sym = struct.unpack_from(sym_fmt, syms, offset)
+        info = sym[info_idx]
+        if (info & 0xf) == STT_FUNC and (info >> 4) in (STB_GLOBAL, STB_WEAK) \
+           and sym[shndx_idx] != SHN_UNDEF:
+            start = sym[name_idx]
+            end = strings.find('\0', start)
+            if end < 0:
+                end = len(strings)
+            names.append(strings[start:end])
+    return names
+
+def _unhex(name):
+    # Pd encodes each character which isn't valid in a C name as 0xNN
+    parts = name.split('0x')
+    out = [parts[0]]
+    for part in parts[1:]:
+        try:
+            out.append(chr(int(part[:2], 16)) + part[2:])
+        except ValueError:
+            out.append('0x' + part)
+    return ''.join(out)
+
+def setup_objects(names):
+    """Returns the Pd object names for the setup functions in the list of
+       symbol "names". Other names are ignored."""
+
+    objects = []
+    for name in names:
+        if name.startswith(SETUP_PREFIX) and len(name) > len(SETUP_PREFIX):
+            objects.append(_unhex(name[len(SETUP_PREFIX):]))
+        elif name.endswith(SETUP_SUFFIX) and len(name) > len(SETUP_SUFFIX):
+            obj = name[:-len(SETUP_SUFFIX)]
+            if obj.endswith(TILDE_SUFFIX):
+                obj = obj[:-len(TILDE_SUFFIX)] + '~'
+            objects.append(obj)
+    return objects
+
+
+class PdSymbolCache(object):
+    """The objects provided by each compiled external, cached by the file's
+       modification time and size so each file is only read once, or again
+       after it changes. If "cache_file" is given the cache is loaded from it
+       when first used, and written back by save()."""
+
+    # Bump this if the layout of the cache file changes
+    VERSION = 1
+
+    def __init__(self, cache_file = None):
+        self.cache_file = cache_file
+        self._cache = None
+        self._dirty = False
+
+    def _load(self):
+        # The cache is only set once it's loaded, so other threads never see
+        # it half loaded
+        loaded = {}
+        if self.cache_file and os.path.isfile(self.cache_file):
+            fd = open(self.cache_file, 'rb')
+            try:
+                try:
+                    (version, cache) = marshal.load(fd)
+                    if version == self.VERSION:
+                        loaded = cache
+                except (EOFError, ValueError, TypeError):
+                    # A corrupt cache is just rebuilt
+                    pass
+            finally:
+                fd.close()
+        self._cache = loaded
+
+    def objects(self, filename):
+        """Returns a tuple of the object names provided by the external
+           "filename". Files which aren't ELF files provide no objects."""
+
+        if self._cache is None:
+            self._load()
+
+        filename = os.path.realpath(filename)
+        st = os.stat(filename)
+        stamp = (st.st_mtime, st.st_size)
+        entry = self._cache.get(filename)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        if is_elf(filename):
+            objs = tuple(setup_objects(symbols(filename)))
+        else:
+            objs = ()
+
+        self._cache[filename] = (stamp, objs)
+        self._dirty = True
+        return objs
+
+    def save(self):
+        """Writes the cache back to the cache file, if it has changed."""
+
+        if not (self.cache_file and self._dirty):
+            return
+
+        fd = open(self.cache_file, 'wb')
+        try:
+            marshal.dump((self.VERSION, self._cache), fd)
+        finally:
+            fd.close()
+        self._dirty = False
+
+
+if __name__ == '__main__':
+    # Lists the objects provided by each external given
+    for filename in sys.argv[1:]:
+        try:
+            print '%s: %s' % (filename, ' '.join(setup_objects(
+                                                    symbols(filename))))
+        except PdInvalidExternal, ex:
+            print str(ex)
@@ -27,3 +27,52 @@ class InvalidPdLine(PdException):
                                             (err_text, line_num, \
                                             line_text))
         (self.line_text, self.line_num, self.ex) = (line_text, line_num, ex)
+
+
+class PdInvalidExternal(PdException):
+    """Raised when a compiled external can't be read."""
+    def __init__(self, filename, err_text):
+        super(PdInvalidExternal, self).__init__('%s: %s' % (filename,
+                                                            err_text))
+        (self.filename, self.err_text) = (filename, err_text)
+
+
+class PdCancelled(PdException):
+    """Raised when getting the result of a load which was cancelled."""
+    def __init__(self, filename):
+        super(PdCancelled, self).__init__('%s: Load cancelled' % filename)
+        self.filename = filename
+
+
+class PdTimeout(PdException):
+    """Raised when a load doesn't complete within the time given."""
+    def __init__(self, filename, timeout):
+        super(PdTimeout, self).__init__('%s: Not loaded after %gs' % \
+                                        (filename, timeout))
+        (self.filename, self.timeout) = (filename, timeout)
+
+
+class PdDspLoop(PdException):
+    """Raised when the signal objects of a patch can't be sorted because
+       they're connected in a loop."""
+    def __init__(self, loop):
+        super(PdDspLoop, self).__init__('DSP loop of %d objects' % len(loop))
+        self.loop = loop
+
+
+class PdFrozen(PdException, TypeError):
+    """Raised when something frozen, such as a frozen PdPatch, is
+       changed."""
+    def __init__(self, what):
+        super(PdFrozen, self).__init__('%s is frozen and can\'t be changed' % \
+                                       what)
+
+
+class PdAbstractionLoop(PdException):
+    """Raised when an abstraction uses itself, directly or through other
+       abstractions, so it can't be inlined. "paths" are the files of the
+       abstractions in the loop, starting and ending with the same one."""
+    def __init__(self, paths):
+        super(PdAbstractionLoop, self).__init__('Abstraction uses itself: ' \
+                                                '%s' % ' -> '.join(paths))
+        self.paths = paths
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+""" Tests for pdflatten.py """
+
+import os
+import shutil
+import tempfile
+import StringIO
+import pd
+import pdflatten
+import pdincludes
+import pdtest
+from pdexceptions import *
+
+MAIN_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 10 10 voice 440 left;
+#X obj 10 40 voice 220;
+#X obj 10 70 dac~;
+#X connect 0 0 2 0;
+#X connect 1 0 2 1;
+"""
+
+VOICE_TEXT = """#N canvas 50 60 300 200 10;
+#X obj 10 10 osc~ \\$1;
+#X obj 10 40 r \\$0-\\$2;
+#X msg 10 70 set \\$1 \\$0;
+#X text 10 100 uses \\$1;
+#X obj 10 130 inner \\$0-x \\$1 \\, f 20;
+#X obj 10 160 outlet~;
+#X connect 0 0 5 0;
+"""
+
+INNER_TEXT = """#N canvas 0 0 200 100 10;
+#X obj 10 10 s \\$1;
+#X obj 10 40 f \\$0;
+"""
+
+def inlined(args, first):
+    # The text of an inlined voice, whose $0 suffixes start at "first"
+    (freq, name) = args
+    return """#N canvas 50 60 300 200 voice 0;
+#X obj 10 10 osc~ %s;
+#X obj 10 40 r \\$0-flat%d-%s;
+#X msg 10 70 set \\$1 \\$0-flat%d;
+#X text 10 100 uses \\$1;
+#N canvas 0 0 200 100 inner 0;
+#X obj 10 10 s \\$0-flat%d-x;
+#X obj 10 40 f \\$0-flat%d;
+#X restore 10 130 pd inner;
+#X obj 10 160 outlet~;
+#X connect 0 0 5 0;
+""" % (freq, first, name, first, first, first + 1)
+
+def write(root, name, text):
+    path = os.path.join(root, name)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+@pdtest.passfail
+def testFlatten(root):
+    main = write(root, 'main.pd', MAIN_TEXT)
+    write(root, os.path.join('abs', 'voice.pd'), VOICE_TEXT)
+    write(root, os.path.join('abs', 'inner.pd'), INNER_TEXT)
+    inc = pdincludes.PdIncludes([os.path.join(root, 'abs')])
+
+    out = StringIO.StringIO()
+    count = pdflatten.flatten(main, out, inc)
+    lines = MAIN_TEXT.splitlines(True)
+    expected = lines[0] + \
+               inlined(('440', 'left'), 1) + '#X restore 10 10 pd voice;\n' + \
+               inlined(('220', '0'), 3) + '#X restore 10 40 pd voice;\n' + \
+               ''.join(lines[3:])
+    if out.getvalue() != expected or count != 4:
+        raise pdtest.Unexpected('flattened', expected, out.getvalue())
+
+    # The flattened patch needs no abstractions
+    patch = pd.PdPatch(out.getvalue().splitlines(True), inc)
+    if patch.select(known = False) or len(patch) != len(lines) - 1:
+        raise pdtest.Unexpected('objects', len(lines) - 1, len(patch))
+
+@pdtest.passfail
+def testLoop(root):
+    main = write(root, 'loop.pd', '#N canvas 0 0 450 300 10;\n' \
+                                  '#X obj 10 10 one;\n')
+    write(root, os.path.join('loop', 'one.pd'),
+          '#N canvas 0 0 450 300 10;\n#X obj 10 10 two;\n')
+    write(root, os.path.join('loop', 'two.pd'),
+          '#N canvas 0 0 450 300 10;\n#X obj 10 10 one;\n')
+    inc = pdincludes.PdIncludes([os.path.join(root, 'loop')])
+    try:
+        pdflatten.flatten(main, StringIO.StringIO(), inc)
+        raise pdtest.Unexpected('loop', 'PdAbstractionLoop', 'no exception')
+    except PdAbstractionLoop, ex:
+        got = [os.path.basename(p) for p in ex.paths]
+        if got != ['one.pd', 'two.pd', 'one.pd']:
+            raise pdtest.Unexpected('paths', ['one.pd', 'two.pd', 'one.pd'],
+                                    got)
+
+def test():
+    d = tempfile.mkdtemp()
+    try:
+        testFlatten(d)
+        testLoop(d)
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+""" Inlining the abstractions a Pd patch uses, to make a single patch file.
+
+    flatten(): writes a patch with each abstraction it uses in its place as a
+               sub-patch
+    substitute(): puts the creation arguments of an abstraction in the text
+                  of one of its objects
+
+A flattened patch needs no abstraction files when it's loaded, so it can be
+copied and loaded on its own, and Pd doesn't search for any files:
+
+    with open('flat.pd', 'w') as out:
+        pdflatten.flatten('main.pd', out, includes)
+
+Each object which is an abstraction found in the includes is replaced by a
+"#N canvas ... #X restore pd NAME" sub-patch holding the objects of the
+abstraction's patch, and the same is done for the abstractions it uses. As
+the sub-patch takes the place of the object, the object ids, and so the
+connections, are unchanged.
+
+The creation arguments of each instance are put in the place of "$1", "$2"
+etc. in the objects of the abstraction, as Pd does when it makes them, and
+"0" for arguments which aren't given. Message boxes are left as they are, as
+their dollar args are those of the messages they're sent, and so are
+comments. Each instance has its own "$0" in Pd, but a sub-patch shares the
+$0 of its patch, so "$0" in an inlined abstraction is given a suffix which
+is different for each instance, e.g. "$0-flat3". Names like "$0-freq" stay
+local to the instance, but a "$0" used on its own becomes a symbol rather
+than a number.
+
+Objects whose type uses a dollar arg aren't inlined, and nor are the
+abstractions which aren't found, as pd.load_recursive() doesn't load them.
+Declares in abstractions are kept as they are, so directories they give
+relative to the abstraction's own directory are relative to the flattened
+patch's directory."""
+
+import os
+import re
+import sys
+import pd
+from pdexceptions import *
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+# A dollar arg in the text of a patch, with its number in the group
+DOLLAR = re.compile(r'\\\$(\d+)')
+DOLLAR_START = '\\$'
+# What "$0" becomes in each inlined abstraction, from the number of the
+# abstraction inlined
+LOCAL = '\\$0-flat%d'
+# The text which starts the width given to an object box, e.g. ", f 20"
+WIDTH = '\\,'
+# Elements whose dollar args aren't creation arguments
+MESSAGE = 'msg'
+COMMENT = 'text'
+
+
+def substitute(text, element, args, local):
+    """Returns the text of an object of an abstraction, whose element is
+       "element", with the creation arguments "args" in place of its dollar
+       args, and "local" in place of "$0"."""
+
+    if element == COMMENT or DOLLAR_START not in text:
+        return text
+
+    def value(match):
+        n = int(match.group(1))
+        if n == 0:
+            return local
+        elif element == MESSAGE:
+            return match.group(0)
+        elif n <= len(args):
+            return args[n - 1]
+        else:
+            return '0'
+
+    return DOLLAR.sub(value, text)
+
+
+class _Flattener(object):
+    """Yields the lines of a flattened patch, from the dict of PdFiles
+       loaded by pd.load_recursive(). "count" is the number of abstractions
+       inlined so far."""
+
+    def __init__(self, files):
+        self.files = files
+        self.count = 0
+        # The abstractions used by each file, see PdFile.abstractions()
+        self._abstractions = {}
+
+    def abstractions(self, path):
+        found = self._abstractions.get(path)
+        if found is None:
+            found = dict([(typ, os.path.abspath(p)) for (typ, p) in \
+                          self.files[path].abstractions().iteritems()])
+            self._abstractions[path] = found
+        return found
+
+    def lines(self, path, args = None, local = None, stack = None):
+        """Yields the lines of the patch file "path" with its abstractions
+           inlined. The lines of the patch's top level canvas are left out
+           unless it's the top level patch, when "args" is None. Otherwise
+           its dollar args are replaced, see substitute(). "stack" is the
+           list of files being inlined."""
+
+        stack = (stack or []) + [path]
+        abstractions = self.abstractions(path)
+        objects = [node.value for (node, level) in \
+                   self.files[path].patch.root()]
+        if args is not None:
+            objects = objects[1:]
+
+        for obj in objects:
+            text = str(obj)
+            if args is not None:
+                text = substitute(text, obj.element, args, local)
+            inlined = None
+            if obj.element == pd.OBJ and not obj.vanilla:
+                inlined = abstractions.get(obj.attrs.get('type'))
+            if inlined not in self.files:
+                yield '%s;\n' % text
+                continue
+
+            if inlined in stack:
+                raise PdAbstractionLoop(stack[stack.index(inlined):] + \
+                                        [inlined])
+            # chunk, element, x, y, type and the arguments, which may be
+            # followed by the width of the box
+            words = text.split(' ')
+            (x, y, name, inner_args) = (words[2], words[3], words[4],
+                                        words[5:])
+            if WIDTH in inner_args:
+                inner_args = inner_args[:inner_args.index(WIDTH)]
+
+            self.count += 1
+            canvas = self.files[inlined].patch.canvas
+            yield '%s %s %s %s %s %s %s 0;\n' % (pd.NCHUNK, pd.CANVAS,
+                                                 canvas['x'], canvas['y'],
+                                                 canvas['width'],
+                                                 canvas['height'], name)
+            for line in self.lines(inlined, inner_args, LOCAL % self.count,
+                                   stack):
+                yield line
+            yield '%s %s %s %s pd %s;\n' % (pd.XCHUNK, pd.RESTORE, x, y,
+                                            name)
+
+
+def flatten(filename, out, includes = None, profile = None):
+    """Writes the patch "filename" to the file object "out" with each
+       abstraction it uses, found with "includes", in its place as a
+       sub-patch, and the same for the abstractions they use. The files are
+       loaded with pd.load_recursive() (see it for "profile"), then the
+       flattened patch is written a line at a time as it's made. Returns the
+       number of abstractions inlined.
+
+       Raises PdAbstractionLoop if an abstraction uses itself. Lines may
+       have been written by then."""
+
+    files = pd.load_recursive(filename, includes, profile)
+    path = os.path.abspath(filename)
+
+    # Struct definitions can only come before the top level canvas, so those
+    # of every file are written first, each once
+    structs = []
+    for p in [path] + sorted([p for p in files if p != path]):
+        for s in files[p].patch.structs:
+            text = '%s;\n' % s
+            if text not in structs:
+                structs.append(text)
+    out.writelines(structs)
+
+    flattener = _Flattener(files)
+    for line in flattener.lines(path):
+        out.write(line)
+    return flattener.count
+
+
+if __name__ == '__main__':
+    import getopt
+    import pdincludes
+    try:
+        options, args = getopt.getopt(sys.argv[1:], 'i:h',
+                                      ['include=', 'help'])
+    except getopt.GetoptError, err:
+        print str(err)
+        sys.exit(2)
+
+    dirs = [arg for (opt, arg) in options if opt in ('-i', '--include')]
+    if len(args) not in (1, 2) or \
+       [o for (o, a) in options if o in ('-h', '--help')]:
+        print 'Usage: %s [-i DIR]... FILE [OUT]' % sys.argv[0]
+        print 'Writes the Pd patch FILE with the abstractions it uses ' \
+              'inlined to OUT, or'
+        print 'to stdout.'
+        sys.exit(2)
+
+    out = sys.stdout
+    if len(args) == 2:
+        out = open(args[1], 'w')
+    try:
+        count = flatten(args[0], out, pdincludes.PdIncludes(dirs))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print >> sys.stderr, '%d abstractions inlined' % count
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+""" Generates synthetic Pd patches for testing and benchmarking.
+
+    generate(): yields the lines of a single patch
+    generate_files(): writes a patch and a library of abstractions it uses
+
+Patches are generated from a seed, so the same arguments always give the
+same patch. The objects used are a mix of pd-vanilla objects, messages,
+atoms and GUI objects, with sub-patches, arrays and connections:
+
+    lines = pdgen.generate(objects = 10000, depth = 2, connections = 1.5)
+    patch = pd.PdPatch(lines)"""
+
+import os
+import sys
+import random
+import getopt
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+# Templates for the objects in generated patches. Each is formatted with the
+# object's x, y and a number used to make names unique.
+OBJECT_TEMPLATES = [
+    '#X obj %d %d osc~ 440',
+    '#X obj %d %d *~ 0.5',
+    '#X obj %d %d + %d',
+    '#X obj %d %d metro 100',
+    '#X obj %d %d f',
+    '#X obj %d %d t b b f',
+    '#X obj %d %d s snd%d',
+    '#X obj %d %d r snd%d',
+    '#X obj %d %d pack f f',
+    '#X obj %d %d route 1 2 3',
+    '#X obj %d %d line~',
+    '#X obj %d %d tabread4~ arr%d',
+    '#X msg %d %d set %d \\; rcv bang',
+    '#X floatatom %d %d 5 0 0 0 - - -',
+    '#X text %d %d comment number %d',
+    '#X obj %d %d tgl 15 0 snd%d rcv empty 17 7 0 10 -262144 -1 -1 0 1',
+    '#X obj %d %d hsl 128 15 0 127 0 0 empty empty empty -2 -8 0 10 ' \
+        '-262144 -1 -1 0 1',
+    ]
+
+ABSTRACTION_NAME = 'abs_%d'
+ABSTRACTION_DIR = 'abs'
+MAIN_NAME = 'main.pd'
+# Values per "#A" line and per text line within it, as Pd saves them
+ARRAY_CHUNK = 1000
+ARRAY_LINE = 10
+
+
+def _canvas_counts(objects, depth, subpatches):
+    """Returns the number of objects for each canvas in the canvas tree, in
+       the order the canvases are generated (depth first)."""
+
+    num_canvases = sum([subpatches ** d for d in range(depth + 1)])
+    (per_canvas, rest) = divmod(objects, num_canvases)
+    return [per_canvas + (i < rest) for i in range(num_canvases)]
+
+def _array_lines(rnd, num, size):
+    yield '#N canvas 0 0 450 300 (subpatch) 0;\n'
+    yield '#X array arr%d %d float 3;\n' % (num, size)
+    for start in range(0, size, ARRAY_CHUNK):
+        values = ['%g' % round(rnd.uniform(-1, 1), 4) \
+                  for i in range(min(ARRAY_CHUNK, size - start))]
+        # Pd splits long lines, which exercises continuation lines
+        chunks = [' '.join(values[i:i + ARRAY_LINE]) \
+                  for i in range(0, len(values), ARRAY_LINE)]
+        chunks[0] = '#A %d %s' % (start, chunks[0])
+        chunks[-1] += ';'
+        for chunk in chunks:
+            yield chunk + '\n'
+    yield '#X coords 0 1 %d -1 200 140 1;\n' % size
+    yield '#X restore %d %d graph;\n' % (rnd.randint(0, 800),
+                                         rnd.randint(0, 600))
+
+def generate(objects = 1000, depth = 0, subpatches = 2, connections = 1.0,
+             arrays = 0, array_size = 100, abstractions = (), seed = 0):
+    """Yields the lines of a generated patch.
+
+       objects       total number of objects, spread evenly over all the
+                     canvases
+       depth         depth of nested sub-patches
+       subpatches    number of sub-patches in each canvas above "depth"
+       connections   number of connections per object in each canvas
+       arrays        number of arrays, each in a graph on the top canvas
+       array_size    number of values in each array
+       abstractions  names of abstractions to use. Each is used once,
+                     spread over the canvases in place of other objects.
+       seed          random seed"""
+
+    rnd = random.Random(seed)
+    counts = _canvas_counts(objects, depth, subpatches)
+    abstractions = list(abstractions)
+    # Which objects (by overall index) are abstractions
+    abs_at = dict(zip(rnd.sample(xrange(objects),
+                                 min(len(abstractions), objects)),
+                      abstractions))
+    state = {'canvas': 0, 'obj': 0}
+
+    def canvas(level):
+        count = counts[state['canvas']]
+        state['canvas'] += 1
+        num_objs = 0
+        for i in xrange(count):
+            (x, y) = (rnd.randint(0, 1000), rnd.randint(0, 1000))
+            name = abs_at.get(state['obj'])
+            state['obj'] += 1
+            if name:
+                yield '#X obj %d %d %s %d;\n' % (x, y, name, i)
+            else:
+                template = OBJECT_TEMPLATES[rnd.randint(
+                                                0, len(OBJECT_TEMPLATES) - 1)]
+                if template.count('%d') == 3:
+                    yield template % (x, y, rnd.randint(0, 99)) + ';\n'
+                else:
+                    yield template % (x, y) + ';\n'
+            num_objs += 1
+
+        if level < depth:
+            for i in range(subpatches):
+                yield '#N canvas 0 0 450 300 sub%d 0;\n' % i
+                for line in canvas(level + 1):
+                    yield line
+                yield '#X restore %d %d pd sub%d;\n' % (rnd.randint(0, 800),
+                                                       rnd.randint(0, 600), i)
+                num_objs += 1
+
+        if level == 0:
+            for i in range(arrays):
+                for line in _array_lines(rnd, i, array_size):
+                    yield line
+                num_objs += 1
+
+        if num_objs > 1:
+            for i in xrange(int(round(connections * num_objs))):
+                yield '#X connect %d %d %d %d;\n' % (
+                        rnd.randint(0, num_objs - 1), rnd.randint(0, 3),
+                        rnd.randint(0, num_objs - 1), rnd.randint(0, 3))
+
+    yield '#N canvas 0 0 800 600 10;\n'
+    for line in canvas(0):
+        yield line
+
+def write(filename, lines):
+    fd = open(filename, 'w')
+    try:
+        fd.writelines(lines)
+    finally:
+        fd.close()
+
+def generate_files(dirname, objects = 1000, abstractions = 0, fanout = 2,
+                   abstraction_objects = 20, seed = 0, **kwargs):
+    """Writes a generated patch called "main.pd" to "dirname", along with
+       "abstractions" abstraction patches in the "abs" sub-directory.
+
+       The main patch uses "fanout" abstractions and each abstraction uses up
+       to "fanout" others, so loading the main patch recursively loads a tree
+       of abstractions. Each abstraction has "abstraction_objects" objects.
+       Other keyword arguments are passed to generate() for the main patch.
+       Returns the path of the main patch."""
+
+    rnd = random.Random(seed)
+    absdir = os.path.join(dirname, ABSTRACTION_DIR)
+    if abstractions and not os.path.isdir(absdir):
+        os.makedirs(absdir)
+
+    for i in range(abstractions):
+        # Abstractions only use abstractions with higher numbers, so there
+        # are no cycles
+        later = range(i + 1, abstractions)
+        uses = rnd.sample(later, min(fanout, len(later)))
+        write(os.path.join(absdir, ABSTRACTION_NAME % i + '.pd'),
+              generate(abstraction_objects,
+                       abstractions = [ABSTRACTION_NAME % n for n in uses],
+                       seed = seed + i + 1))
+
+    uses = rnd.sample(range(abstractions), min(fanout, abstractions))
+    main = os.path.join(dirname, MAIN_NAME)
+    write(main, generate(objects,
+                         abstractions = [ABSTRACTION_NAME % n for n in uses],
+                         seed = seed, **kwargs))
+    return main
+
+
+def usage():
+    print """
+Usage: %s [OPTION]... FILE
+Writes a generated Pd patch to FILE.
+
+Options:
+-o, --objects N       Number of objects (default 1000)
+-d, --depth N         Depth of nested sub-patches (default 0)
+-b, --subpatches N    Sub-patches in each canvas (default 2)
+-c, --connections F   Connections per object (default 1.0)
+-a, --arrays N        Number of arrays (default 0)
+-z, --array-size N    Values in each array (default 100)
+-s, --seed N          Random seed (default 0)
+""" % os.path.basename(sys.argv[0])
+
+if __name__ == '__main__':
+    try:
+        options, args = getopt.getopt(sys.argv[1:], 'o:d:b:c:a:z:s:h',
+                                      ['objects=', 'depth=', 'subpatches=',
+                                       'connections=', 'arrays=',
+                                       'array-size=', 'seed=', 'help'])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(1)
+
+    kwargs = {}
+    names = {'-o': 'objects', '-d': 'depth', '-b': 'subpatches',
+             '-c': 'connections', '-a': 'arrays', '-z': 'array_size',
+             '-s': 'seed'}
+    for opt, arg in options:
+        if opt in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+        if opt.startswith('--'):
+            key = opt[2:].replace('-', '_')
+        else:
+            key = names[opt]
+        if key == 'connections':
+            kwargs[key] = float(arg)
+        else:
+            kwargs[key] = int(arg)
+
+    if len(args) != 1:
+        usage()
+        sys.exit(1)
+
+    write(args[0], generate(**kwargs))
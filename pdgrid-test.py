@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+""" Tests for pdgrid.py """
+
+import random
+import pd
+import pdgrid
+import pdtest
+
+PATCH_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 10 10 osc~ 440;
+#X obj 30 15 dac~;
+#X msg 200 10 hello;
+#X obj 10 100 tgl 15 0 empty empty empty 17 7 0 10 -262144 -1 -1 0 1;
+#N canvas 0 0 450 300 sub 0;
+#X obj 10 10 inlet;
+#X obj 12 12 outlet;
+#X restore 300 200 pd sub;
+#X connect 0 0 1 0;
+"""
+
+def grids(text = PATCH_TEXT):
+    return pdgrid.grids(pd.PdPatch(text.splitlines(True)))
+
+def ids(items):
+    return [i.obj_id for i in items]
+
+@pdtest.passfail
+def testBoxes():
+    (top, sub) = grids()
+    got = [i.box for i in top]
+    # Text boxes are 6x13 characters plus padding at font size 10
+    expected = [(10, 10, 62, 28), (30, 15, 58, 33), (200, 10, 234, 28),
+                (10, 100, 25, 115), (300, 200, 340, 218)]
+    if got != expected:
+        raise pdtest.Unexpected('Boxes', expected, got)
+    if ids(sub) != [0, 1]:
+        raise pdtest.Unexpected('Sub-patch ids', [0, 1], ids(sub))
+
+@pdtest.passfail
+def testQueries():
+    (top, sub) = grids()
+    for (got, expected) in ((ids(top.query(0, 0, 100, 50)), [0, 1]),
+                            (ids(top.at(320, 210)), [4]),
+                            (ids(top.at(100, 100)), []),
+                            (top.nearest(100, 100).obj_id, 3),
+                            (top.nearest(1000, 1000).obj_id, 4),
+                            ([(a.obj_id, b.obj_id) for (a, b) in \
+                              top.overlaps()], [(0, 1)]),
+                            (len(sub.overlaps()), 1)):
+        if got != expected:
+            raise pdtest.Unexpected('Query', expected, got)
+
+@pdtest.passfail
+def testBruteForce():
+    # The grid gives the same results as checking every object
+    rand = random.Random(1)
+    lines = ['#N canvas 0 0 450 300 10;\n']
+    for i in range(500):
+        lines.append('#X obj %d %d %s;\n' % (rand.randint(0, 2000),
+                                             rand.randint(0, 2000),
+                                             rand.choice(['f', 'metro 100',
+                                                          'osc~ 440'])))
+    grid = pdgrid.grids(pd.PdPatch(lines), cell_size = 50)[0]
+    items = grid.items
+
+    expected = [(a.obj_id, b.obj_id) for a in items for b in items \
+                if a.obj_id < b.obj_id and pdgrid._overlap(a.box, b.box)]
+    got = [(a.obj_id, b.obj_id) for (a, b) in grid.overlaps()]
+    if got != expected:
+        raise pdtest.Unexpected('Overlaps', expected, got)
+
+    for i in range(50):
+        (x, y) = (rand.randint(-500, 2500), rand.randint(-500, 2500))
+        expected = min([(pdgrid._distance(it.box, x, y), it.obj_id) \
+                        for it in items])[1]
+        got = grid.nearest(x, y).obj_id
+        if got != expected:
+            raise pdtest.Unexpected('Nearest %d,%d' % (x, y), expected, got)
+
+        box = (x, y, x + 300, y + 200)
+        expected = [it.obj_id for it in items \
+                    if pdgrid._overlap(it.box, box)]
+        got = ids(grid.query(*box))
+        if got != expected:
+            raise pdtest.Unexpected('Query %s' % (box,), expected, got)
+
+def test():
+    testBoxes()
+    testQueries()
+    testBruteForce()
+
+if __name__ == '__main__':
+    test()
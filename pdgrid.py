@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+
+""" A spatial index of the objects in each canvas of a Pd patch.
+
+    PdGrid: a uniform grid of the boxes of the objects in one canvas
+    grids(): returns a PdGrid for each canvas of a patch
+    bbox(): estimates the box an object is drawn in
+
+Each object's box is estimated from its coordinates, its type and the
+patch's font size, and added to each cell of the grid it touches. Finding the
+objects in a region, the object nearest a point and the objects which
+overlap then only looks at the cells involved, rather than every object in
+the canvas:
+
+    for grid in pdgrid.grids(patch):
+        for (a, b) in grid.overlaps():
+            print 'Overlapping:', a.obj, b.obj
+
+The boxes are estimates. Pd measures the text of object boxes with the font
+it's using, which isn't known here, so the widths of boxes with text may be
+a little out."""
+
+import sys
+import pd
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+# The size of each grid cell, in pixels. Most object boxes fit in one or two.
+CELL_SIZE = 64
+
+# The character width and height Pd uses for each font size
+FONT_SIZES = {8: (5, 11), 10: (6, 13), 12: (7, 16), 16: (10, 19),
+              24: (14, 29), 36: (22, 44)}
+DEFAULT_FONT_SIZE = 10
+
+# The padding around the text of a box, and the fewest characters wide it's
+# drawn
+(TEXT_PAD_X, TEXT_PAD_Y, MIN_CHARS) = (4, 5, 3)
+# Comments wrap at this many characters
+COMMENT_CHARS = 60
+
+# GUI objects whose size is a single square 'size'
+SQUARE_GUIS = ('bng', 'tgl', 'toggle')
+# GUI objects sized by 'width' and 'height'
+SIZED_GUIS = ('hsl', 'hslider', 'vsl', 'vslider', 'cnv', 'vu')
+
+
+def font_size(patch):
+    """Returns the font size of the PdPatch "patch"."""
+
+    try:
+        size = int(patch.canvas.attrs.get('font_size'))
+    except (TypeError, ValueError):
+        return DEFAULT_FONT_SIZE
+    return size
+
+def _int(obj, attr):
+    try:
+        return int(float(obj.attrs.get(attr)))
+    except (TypeError, ValueError):
+        return None
+
+def _char_size(size):
+    return FONT_SIZES.get(size, FONT_SIZES[DEFAULT_FONT_SIZE])
+
+def _text_box(words, size, max_chars = None):
+    (char_w, char_h) = _char_size(size)
+    chars = max(len(' '.join(words)), MIN_CHARS)
+    lines = 1
+    if max_chars and chars > max_chars:
+        lines = (chars + max_chars - 1) // max_chars
+        chars = max_chars
+    return (chars * char_w + TEXT_PAD_X, lines * char_h + TEXT_PAD_Y)
+
+def _words(obj):
+    # The text of the box, which is everything after x and y
+    vals = [obj.attrs[k] for k in obj.attr_names[2:] \
+            if obj.attrs[k] is not None]
+    return vals + obj.extra_params
+
+def _graph_size(node):
+    # A sub-patch drawn as a graph has its size in its coords
+    for child in node[:]:
+        coords = child.value
+        if coords.element == 'coords' and _int(coords, 'gop'):
+            (w, h) = (_int(coords, 'width'), _int(coords, 'heigth'))
+            if w and h:
+                return (w, h)
+    return None
+
+def bbox(obj, node = None, size = DEFAULT_FONT_SIZE):
+    """Returns the estimated (x1, y1, x2, y2) box of the PdObject "obj" in
+       its canvas, or None if it isn't drawn or has no coordinates. For a
+       sub-patch, "obj" is its restore object and "node" the sub-patch's
+       node. "size" is the patch's font size."""
+
+    (x, y) = (_int(obj, 'x'), _int(obj, 'y'))
+    if x is None or y is None or obj.element in (pd.CANVAS, pd.CONNECT):
+        return None
+
+    element = obj.element
+    (w, h) = (None, None)
+    if element == pd.OBJ:
+        typ = obj.attrs.get('type')
+        if typ in SQUARE_GUIS:
+            w = h = _int(obj, 'size')
+        elif typ in SIZED_GUIS:
+            (w, h) = (_int(obj, 'width'), _int(obj, 'height'))
+        elif typ in ('hdl', 'hradio', 'vdl', 'vradio'):
+            (cell, number) = (_int(obj, 'size'), _int(obj, 'number'))
+            if cell and number:
+                (w, h) = (cell * number, cell)
+                if typ[0] == 'v':
+                    (w, h) = (h, w)
+        elif typ == 'nbx':
+            (digits, h) = (_int(obj, 'size'), _int(obj, 'height'))
+            if digits and h:
+                w = digits * _char_size(size)[0] + h
+    elif element in ('floatatom', 'symbolatom'):
+        width = _int(obj, 'width') or (element == 'floatatom' and 5 or 10)
+        (w, h) = _text_box(['0' * width], size)
+    elif element == pd.RESTORE and node is not None:
+        graph = _graph_size(node)
+        if graph:
+            (w, h) = graph
+    elif element == 'text':
+        (w, h) = _text_box(_words(obj), size, COMMENT_CHARS)
+
+    if not (w and h):
+        (w, h) = _text_box(_words(obj), size)
+    return (x, y, x + w, y + h)
+
+
+class PdGridItem(object):
+    """An object in a PdGrid. "obj_id" is the object's id in the canvas,
+       "node" its tree node and "box" its (x1, y1, x2, y2) box. "obj" is the
+       PdObject, which for a sub-patch is its restore object."""
+
+    __slots__ = ('obj_id', 'node', 'obj', 'box')
+
+    def __init__(self, obj_id, node, obj, box):
+        (self.obj_id, self.node, self.obj, self.box) = (obj_id, node, obj,
+                                                        box)
+
+    def __repr__(self):
+        return '<PdGridItem %d %s %s>' % (self.obj_id, self.box, self.obj)
+
+
+def _overlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def _distance(box, x, y):
+    # The squared distance from the point to the nearest edge of the box, or
+    # 0 if it's inside
+    dx = max(box[0] - x, 0, x - box[2])
+    dy = max(box[1] - y, 0, y - box[3])
+    return dx * dx + dy * dy
+
+
+class PdGrid(object):
+    """A uniform grid of the objects in the canvas "node" of a PdPatch, with
+       cells "cell_size" pixels square. "size" is the patch's font size.
+       Objects without coordinates aren't included."""
+
+    def __init__(self, node, size = DEFAULT_FONT_SIZE, cell_size = CELL_SIZE):
+        self.canvas = node
+        self.cell_size = cell_size
+        self.items = []
+        # (column, row) to the list of items touching that cell
+        self._cells = {}
+
+        children = node[:]
+        if node.parent is not None and children and \
+           children[-1].value.element == pd.RESTORE:
+            # The sub-patch's own restore is part of the parent canvas
+            children = children[:-1]
+
+        obj_id = 0
+        for child in children:
+            obj = child.value
+            if obj.element == pd.CONNECT:
+                continue
+            if child.leaf():
+                box = bbox(obj, None, size)
+            else:
+                # A sub-patch is drawn where its restore object is
+                obj = child[len(child) - 1].value
+                box = bbox(obj, child, size)
+            if box is not None:
+                self._add(PdGridItem(obj_id, child, obj, box))
+            obj_id += 1
+
+        # The lowest and highest (column, row) of any cell used
+        self._bounds = None
+        if self._cells:
+            (cols, rows) = zip(*self._cells.iterkeys())
+            self._bounds = (min(cols), min(rows), max(cols), max(rows))
+
+    def _add(self, item):
+        self.items.append(item)
+        cells = self._cells
+        for key in self._keys(item.box):
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [item]
+            else:
+                cell.append(item)
+
+    def _keys(self, box):
+        c = self.cell_size
+        # The right and bottom edges aren't part of the box
+        (cx1, cy1, cx2, cy2) = (box[0] // c, box[1] // c,
+                                (box[2] - 1) // c, (box[3] - 1) // c)
+        return [(i, j) for i in range(cx1, cx2 + 1) \
+                for j in range(cy1, cy2 + 1)]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def query(self, x1, y1, x2, y2):
+        """Returns the items whose boxes overlap the region (x1, y1, x2, y2),
+           in the order of their object ids."""
+
+        box = (x1, y1, x2, y2)
+        (found, cells) = ({}, self._cells)
+        for key in self._keys(box):
+            for item in cells.get(key, ()):
+                if item.obj_id not in found and _overlap(item.box, box):
+                    found[item.obj_id] = item
+        return [found[k] for k in sorted(found)]
+
+    def at(self, x, y):
+        """Returns the items whose boxes contain the point (x, y)."""
+
+        return self.query(x, y, x + 1, y + 1)
+
+    def nearest(self, x, y):
+        """Returns the item whose box is nearest the point (x, y), or None
+           if the grid is empty. Of items at the same distance the one with
+           the lowest id is returned."""
+
+        if not self.items:
+            return None
+
+        c = self.cell_size
+        (cx, cy) = (x // c, y // c)
+        # The furthest ring of cells that can hold any item
+        b = self._bounds
+        limit = max(cx - b[0], cy - b[1], b[2] - cx, b[3] - cy)
+
+        (best, best_dist) = (None, None)
+        ring = 0
+        while ring <= limit:
+            # Items not yet seen are at least this far away
+            if best is not None and best_dist < ((ring - 1) * c) ** 2:
+                break
+            for key in self._ring(cx, cy, ring):
+                for item in self._cells.get(key, ()):
+                    dist = _distance(item.box, x, y)
+                    if best is None or (dist, item.obj_id) < \
+                       (best_dist, best.obj_id):
+                        (best, best_dist) = (item, dist)
+            ring += 1
+        return best
+
+    def _ring(self, cx, cy, ring):
+        if ring == 0:
+            return [(cx, cy)]
+        keys = []
+        for i in range(cx - ring, cx + ring + 1):
+            keys.append((i, cy - ring))
+            keys.append((i, cy + ring))
+        for j in range(cy - ring + 1, cy + ring):
+            keys.append((cx - ring, j))
+            keys.append((cx + ring, j))
+        return keys
+
+    def overlaps(self):
+        """Returns (a, b) tuples of the items whose boxes overlap, with
+           a.obj_id < b.obj_id, sorted by id."""
+
+        found = set()
+        for cell in self._cells.itervalues():
+            for i in range(len(cell)):
+                a = cell[i]
+                for b in cell[i + 1:]:
+                    if _overlap(a.box, b.box):
+                        if a.obj_id < b.obj_id:
+                            found.add((a.obj_id, b.obj_id))
+                        else:
+                            found.add((b.obj_id, a.obj_id))
+        by_id = dict([(item.obj_id, item) for item in self.items])
+        return [(by_id[a], by_id[b]) for (a, b) in sorted(found)]
+
+
+def grids(patch, cell_size = CELL_SIZE):
+    """Returns a PdGrid for each canvas of the PdPatch "patch", the top
+       level canvas first and then each sub-patch in the order they're
+       defined."""
+
+    size = font_size(patch)
+    found = []
+    pending = [patch.root()]
+    while pending:
+        node = pending.pop()
+        found.append(PdGrid(node, size, cell_size))
+        pending.extend(reversed([c for c in node[:] if not c.leaf()]))
+    return found
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print 'Usage: %s FILE' % sys.argv[0]
+        print 'Lists the objects which overlap in the Pd patch FILE.'
+        sys.exit(2)
+
+    found = False
+    for grid in grids(pd.PdFile(sys.argv[1]).patch):
+        for (a, b) in grid.overlaps():
+            print '%d: %s\n%d: %s\n' % (a.obj.line_num + 1, a.obj,
+                                        b.obj.line_num + 1, b.obj)
+            found = True
+    sys.exit(found and 1 or 0)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+""" Tests for pdincludes.py and the declare search path in pd.py """
+
+import os
+import shutil
+import tempfile
+import pd
+import pdincludes
+import pdtest
+
+PATCH_TEXT = """#N canvas 0 0 450 300 10;
+#X declare -path abs -stdpath extra/other;
+#X obj 10 10 myabs;
+#X obj 10 40 otherabs;
+#X obj 10 70 shared;
+#X obj 10 100 nothere;
+"""
+
+def touch(*parts):
+    path = os.path.join(*parts)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    open(path, 'w').close()
+
+def write_patch(filename):
+    fd = open(filename, 'w')
+    try:
+        fd.write(PATCH_TEXT)
+    finally:
+        fd.close()
+
+def make_tree(d):
+    # <d>/root is the Pd install, <d>/patches holds the patches
+    touch(d, 'root', 'extra', 'shared.pd')
+    touch(d, 'root', 'extra', 'other', 'otherabs.pd')
+    touch(d, 'patches', 'abs', 'myabs.pd')
+    touch(d, 'patches', 'abs', 'shared.pd')
+    write_patch(os.path.join(d, 'patches', 'one.pd'))
+    write_patch(os.path.join(d, 'patches', 'two.pd'))
+
+@pdtest.passfail
+def testDeclare(d):
+    root = os.path.join(d, 'root')
+    patches = os.path.join(d, 'patches')
+    inc = pdincludes.PdIncludes([os.path.join(root, 'extra')],
+                                pd_root = root)
+    one = pd.PdFile(os.path.join(patches, 'one.pd'), inc).patch
+
+    expected = [os.path.join(patches, 'abs'),
+                os.path.join(root, 'extra', 'other')]
+    if one.search_path() != expected:
+        raise pdtest.Unexpected('search_path', expected, one.search_path())
+
+    # Declared directories are searched first
+    found = dict([(node.value.name(), sorted(node.value.include)) \
+                  for (node, obj_id, level) in one.select(element = 'obj')])
+    checks = [('myabs', [os.path.join(patches, 'abs')]),
+              ('otherabs', [os.path.join(root, 'extra', 'other')]),
+              ('shared', [os.path.join(patches, 'abs')]),
+              ('nothere', [])]
+    for (name, expected) in checks:
+        if found[name] != expected:
+            raise pdtest.Unexpected(name, expected, found[name])
+
+@pdtest.passfail
+def testSharedView(d):
+    root = os.path.join(d, 'root')
+    patches = os.path.join(d, 'patches')
+    inc = pdincludes.PdIncludes([os.path.join(root, 'extra')],
+                                pd_root = root)
+    one = pd.PdFile(os.path.join(patches, 'one.pd'), inc).patch
+    two = pd.PdFile(os.path.join(patches, 'two.pd'), inc).patch
+
+    if one.includes is not two.includes:
+        raise pdtest.Unexpected('view', 'shared', 'not shared')
+    if one.includes is inc:
+        raise pdtest.Unexpected('view', 'layered', 'base')
+
+    # extra, extra/other and abs are each scanned once
+    if len(inc._scanned) != 3:
+        raise pdtest.Unexpected('scanned', 3, len(inc._scanned))
+
+@pdtest.passfail
+def testFrozen(d):
+    root = os.path.join(d, 'root')
+    patches = os.path.join(d, 'patches')
+    inc = pdincludes.PdIncludes([os.path.join(root, 'extra')],
+                                pd_root = root)
+    one = pd.PdFile(os.path.join(patches, 'one.pd'), inc).patch
+    inc.freeze()
+
+    # Looking for a name which isn't there doesn't change the includes
+    files = len(inc._files)
+    if inc.get('nothere') or len(inc._files) != files:
+        raise pdtest.Unexpected('files', files, len(inc._files))
+    if not one.includes.frozen:
+        raise pdtest.Unexpected('view', 'frozen', 'not frozen')
+    try:
+        inc.populate()
+        raise pdtest.Unexpected('populate', 'TypeError', 'no exception')
+    except TypeError:
+        pass
+
+    # Patches parsed after the freeze share the same frozen view
+    two = pd.PdFile(os.path.join(patches, 'two.pd'), inc).patch
+    if two.includes is not one.includes:
+        raise pdtest.Unexpected('view', 'shared', 'not shared')
+
+def test():
+    d = tempfile.mkdtemp()
+    try:
+        make_tree(d)
+        testDeclare(d)
+        testSharedView(d)
+        testFrozen(d)
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == '__main__':
+    test()
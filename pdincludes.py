@@ -1,30 +1,113 @@
 #!/usr/bin/env python
 
 import os
-import sys
 import collections
-import pdplatform
-import pdconfig
+
+# pdconfig and pdplatform are only needed by extra() and when run as a script.
+# They are imported there to keep the import of this module cheap.
+
+# Extensions of compiled externals on each platform
+EXTERNAL_EXTS = ('.dll', '.pd_linux', '.so', '.l_i386', '.l_ia64',
+                 '.pd_darwin', '.d_fat')
+FILE_EXTS = ('.pd',) + EXTERNAL_EXTS
+
+# What get() returns for names which aren't found
+NOT_FOUND = frozenset()
 
 class PdIncludes:
 
-    def __init__(self, dirs, populate = True, cache = False):
+    def __init__(self, dirs, populate = True, cache = False,
+                 libraries = None, symbols = None, pd_root = None):
+        """"libraries" is an optional pdlibs.PdLibraries. Objects defined in
+           its packs are resolved from there, without searching "dirs".
+
+           "symbols" is an optional pdelf.PdSymbolCache used to find the
+           objects provided by compiled externals. One is created when first
+           needed if not given.
+
+           "pd_root" is the Pd install dir, used to find the directories
+           given with "declare -stdpath" and "declare -stdlib"."""
+
         if isinstance(dirs, str):
             raise TypeError('"dirs" argument should be an iterable of ' \
                             'directories.')
         self._dirs = dirs
+        self.libraries = libraries
+        self.symbols = symbols
+        self.pd_root = pd_root
         self._files = collections.defaultdict(set)
+        # The files found in each directory scanned, and the layered views
+        # made by layer(). These are kept so that each directory is only
+        # scanned once, however many patches declare it.
+        self._scanned = {}
+        self._layers = {}
+        self.frozen = False
         if populate:
             self.populate()
         # TODO use a cache file
 
     def populate(self):
+        if self.frozen:
+            raise TypeError('The includes are frozen and can\'t be changed')
         for rootdir in self._dirs:
-            for root, dirs, files in os.walk(rootdir):
-                for f in files:
-                    if f.endswith('.pd') or f.endswith('.dll'):
-                        name = os.path.splitext(f)[0]
-                        self._files[name].add(root)
+            for name, roots in self._scan(rootdir).iteritems():
+                self._files[name].update(roots)
+
+    def _scan(self, rootdir):
+        """Returns a dict of the file names (without extension) found in
+           "rootdir" and its sub-directories, to the set of directories each
+           was found in."""
+
+        try:
+            return self._scanned[rootdir]
+        except KeyError:
+            pass
+
+        found = collections.defaultdict(set)
+        for root, dirs, files in os.walk(rootdir):
+            for f in files:
+                if f.endswith(FILE_EXTS):
+                    name = os.path.splitext(f)[0]
+                    found[name].add(root)
+
+        # Threads scanning the same directory at once all use the first
+        # result stored
+        return self._scanned.setdefault(rootdir, found)
+
+    def layer(self, dirs):
+        """Returns a view of this PdIncludes which searches "dirs" before its
+           own directories, as Pd does for the directories given by
+           "declare -path". Views are cached, so all the patches which
+           declare the same directories share a single view."""
+
+        key = tuple(dirs)
+        try:
+            return self._layers[key]
+        except KeyError:
+            pass
+
+        files = collections.defaultdict(set)
+        for d in key:
+            for name, roots in self._scan(d).iteritems():
+                files[name].update(roots)
+
+        view = PdLayeredIncludes(self, list(key), files)
+        if self.frozen:
+            view.freeze()
+        return self._layers.setdefault(key, view)
+
+    def freeze(self):
+        """Stops the directories found being changed, so that the includes
+           can be used by many threads at once. Views made by layer() are
+           frozen too. Lookups never change the includes, frozen or not,
+           and the views and directories scanned which are kept are only
+           added to, so threads never need to wait for each other."""
+
+        self._files = dict([(name, frozenset(dirs)) for (name, dirs) in \
+                            self._files.iteritems()])
+        self.frozen = True
+        for view in self._layers.values():
+            view.freeze()
 
     def __contains__(self, path):
         return os.path.splitext(path)[0] in self._files
@@ -36,27 +119,105 @@ class PdIncludes:
         return val
 
     def get(self, key):
-        val = self._files[key]
+        # Looking a name up mustn't add it to the defaultdict, as the
+        # includes may be being used by other threads
+        val = self._files.get(key, NOT_FOUND)
         if not val:
             keydir = os.path.dirname(key)
             if keydir:
                 k = os.path.basename(key)
-                dirs = self._files[k]
+                dirs = self._files.get(k, NOT_FOUND)
                 for valdir in dirs:
                     if os.path.basename(valdir) == keydir:
                         return [valdir]
         return val
 
+    def library(self, key, libs = None):
+        """Returns a tuple of the library name and attribute names if "key"
+           is defined in one of the object definition packs, otherwise
+           None. "libs" overrides the libraries searched for names without a
+           library prefix."""
+
+        if self.libraries is None:
+            return None
+        return self.libraries.get(key, libs)
+
+    def externals(self, key):
+        """Returns a list of the paths of the compiled externals called
+           "key" (e.g. zexy.pd_linux for "zexy")."""
+
+        paths = []
+        name = os.path.basename(key)
+        for d in self.get(key):
+            for ext in EXTERNAL_EXTS:
+                path = os.path.join(d, name + ext)
+                if os.path.isfile(path):
+                    paths.append(path)
+        return paths
+
+    def library_objects(self, key):
+        """Returns the set of object names provided by the compiled external
+           library called "key", as found by reading the "_setup" symbols it
+           exports."""
+
+        symbols = self._symbol_cache()
+        objs = set()
+        for path in self.externals(key):
+            objs.update(symbols.objects(path))
+        return objs
+
+    def _symbol_cache(self):
+        if self.symbols is None:
+            import pdelf
+            self.symbols = pdelf.PdSymbolCache()
+        return self.symbols
+
     def __str__(self):
         return '\n'.join(self._dirs)
 
+
+class PdLayeredIncludes(PdIncludes):
+    """A view of a PdIncludes with extra directories which are searched
+       first. These are made by PdIncludes.layer(), not directly."""
+
+    def __init__(self, base, dirs, files):
+        PdIncludes.__init__(self, dirs, populate = False,
+                            libraries = base.libraries, pd_root = base.pd_root)
+        self.base = base
+        self._files = files
+
+    def get(self, key):
+        val = PdIncludes.get(self, key)
+        if not val:
+            val = self.base.get(key)
+        return val
+
+    def __contains__(self, path):
+        return PdIncludes.__contains__(self, path) or path in self.base
+
+    def layer(self, dirs):
+        # Layers aren't stacked, the base makes a single view of all the
+        # extra dirs
+        return self.base.layer(list(dirs) + self._dirs)
+
+    def _symbol_cache(self):
+        return self.base._symbol_cache()
+
+    def __str__(self):
+        return '\n'.join(self._dirs + [str(self.base)])
+
 def extra():
+    import pdplatform
+    import pdconfig
     cfg = pdconfig.PdConfigParser(pdplatform.pref_file)
     pd_root = cfg.get('pd_root')
     exdir = os.path.join(pd_root, 'extra')
     return PdIncludes([exdir])
 
 if __name__ == '__main__':
+    import sys
+    import pdplatform
+    import pdconfig
     if len(sys.argv) > 1:
         cfg = pdconfig.PdConfigParser(pdplatform.pref_file)
         pd_root = cfg.get('pd_root')
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+""" Tests for pdlibs.py """
+
+import os
+import shutil
+import tempfile
+import pd
+import pdincludes
+import pdlibs
+import pdtest
+
+SOURCE_TEXT = """
+# test library
+limiter~    num_inputs buf_size
+z~          samples   # trailing comment
+abs~
+lim~ = limiter~
+"""
+
+PATCH_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 10 10 limiter~ 2 512 extra;
+#X obj 10 40 testlib/z~ 64;
+#X obj 10 70 not_in_a_pack 1;
+#X obj 10 100 lim~;
+"""
+
+def make_pack(d):
+    source = os.path.join(d, 'testlib.txt')
+    fd = open(source, 'w')
+    try:
+        fd.write(SOURCE_TEXT)
+    finally:
+        fd.close()
+    return pdlibs.compile_pack(source)
+
+@pdtest.passfail
+def testCompileLoad(d):
+    defs = pdlibs.load_pack(make_pack(d))
+    expected = {'limiter~': ('num_inputs', 'buf_size'),
+                'lim~': ('num_inputs', 'buf_size'),
+                'z~': ('samples',),
+                'abs~': ()}
+    if defs != expected:
+        raise pdtest.Unexpected('defs', expected, defs)
+
+@pdtest.passfail
+def testLookup(d):
+    libs = pdlibs.PdLibraries([d])
+    # Without the library loaded only prefixed names are found
+    for typ, expected in [('limiter~', None),
+                          ('testlib/limiter~', ('testlib',
+                                                ('num_inputs', 'buf_size'))),
+                          ('nolib/limiter~', None)]:
+        got = libs.get(typ)
+        if got != expected:
+            raise pdtest.Unexpected(typ, expected, got)
+
+    libs = pdlibs.PdLibraries([d], ['nolib', 'testlib'])
+    got = libs.get('z~')
+    if got != ('testlib', ('samples',)):
+        raise pdtest.Unexpected('z~', ('testlib', ('samples',)), got)
+
+    if libs.available() != ['testlib']:
+        raise pdtest.Unexpected('available', ['testlib'], libs.available())
+
+@pdtest.passfail
+def testPatch(d):
+    libs = pdlibs.PdLibraries([d], ['testlib'])
+    inc = pdincludes.PdIncludes([], libraries = libs)
+    patch = pd.PdPatch(PATCH_TEXT.splitlines(True), inc)
+
+    objs = [node.value for (node, obj_id, level) in patch][1:]
+    checks = [(objs[0], 'buf_size', '512'), (objs[0], 'library', 'testlib'),
+              (objs[1], 'samples', '64'), (objs[2], 'library', None),
+              (objs[3], 'num_inputs', None)]
+    for (obj, attr, expected) in checks:
+        if attr == 'library':
+            got = obj.library
+        else:
+            got = obj[attr]
+        if got != expected:
+            raise pdtest.Unexpected(attr, expected, got)
+
+    known = [o.known() for o in objs]
+    if known != [True, True, False, True]:
+        raise pdtest.Unexpected('known', [True, True, False, True], known)
+
+    if objs[0].extra_params != ['extra']:
+        raise pdtest.Unexpected('extra_params', ['extra'],
+                                objs[0].extra_params)
+
+def test():
+    d = tempfile.mkdtemp()
+    try:
+        testCompileLoad(d)
+        testLookup(d)
+        testPatch(d)
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == '__main__':
+    test()
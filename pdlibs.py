@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+""" Object definitions for external libraries (Gem, zexy, cyclone etc).
+
+    PdLibraries: finds and loads object definition packs, one per library.
+
+pdelement only knows about the objects built-in to pd-vanilla. Object
+definitions for other libraries are kept in packs, one pack per library,
+named after the library (e.g. "zexy.pdlib"). Packs are compiled from a simple
+text source with compile_pack() (or by running this module as a script) and
+are only loaded the first time an object from that library is looked up.
+
+The source format has one object per line, the object name followed by its
+attribute names in the order they occur after the x, y and type attributes
+of the "obj" element:
+
+    # zexy object definitions
+    abs~
+    limiter~    num_inputs buf_size
+    z~          samples
+
+An object may also be defined as an alias of another in the same pack:
+
+    lim~ = limiter~
+"""
+
+import os
+import sys
+import marshal
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+PACK_EXT = '.pdlib'
+# Bump this if the layout of the compiled pack changes
+PACK_VERSION = 1
+
+
+class PdLibraries(object):
+    """Looks up object definitions in the packs found in "dirs".
+
+       Objects given with a library prefix (e.g. "zexy/limiter~") are looked
+       up in that library's pack. Objects without a prefix are looked up in
+       each of the "libs" in turn. In Pd these would be the libraries loaded
+       at start up or with "declare -lib"."""
+
+    def __init__(self, dirs, libs = ()):
+        if isinstance(dirs, str):
+            raise TypeError('"dirs" argument should be an iterable of ' \
+                            'directories.')
+        self._dirs = dirs
+        self.libs = list(libs)
+        # Packs loaded so far. None is stored for libraries that don't have a
+        # pack so we don't search for them again.
+        self._packs = {}
+
+    def pack(self, lib):
+        """Returns the dict of object definitions for the library "lib",
+           loading it if needed. Returns None if there is no pack for
+           "lib"."""
+
+        try:
+            return self._packs[lib]
+        except KeyError:
+            pass
+
+        defs = None
+        for d in self._dirs:
+            filename = os.path.join(d, lib + PACK_EXT)
+            if os.path.isfile(filename):
+                defs = load_pack(filename)
+                break
+
+        # Threads loading the same pack at once all use the first one stored
+        return self._packs.setdefault(lib, defs)
+
+    def get(self, typ, libs = None):
+        """Returns a tuple of the library name and attribute names for the
+           object type "typ", or None if it isn't defined in any pack. The
+           libraries searched for types without a library prefix can be
+           overridden with "libs"."""
+
+        if '/' in typ:
+            (lib, name) = typ.rsplit('/', 1)
+            defs = self.pack(lib)
+            if defs:
+                attrs = defs.get(name)
+                if attrs is not None:
+                    return (lib, attrs)
+            return None
+
+        if libs is None:
+            libs = self.libs
+        for lib in libs:
+            defs = self.pack(lib)
+            if defs:
+                attrs = defs.get(typ)
+                if attrs is not None:
+                    return (lib, attrs)
+        return None
+
+    def available(self):
+        """Returns a sorted list of the library names for all packs found."""
+
+        names = set()
+        for d in self._dirs:
+            if os.path.isdir(d):
+                names.update([os.path.splitext(f)[0] for f in os.listdir(d) \
+                              if f.endswith(PACK_EXT)])
+        return sorted(names)
+
+    def __str__(self):
+        return '\n'.join(self._dirs)
+
+
+def parse_source(lines):
+    """Returns a dict of object name to a tuple of attribute names from the
+       lines of a pack source file."""
+
+    defs = {}
+    aliases = []
+    for line_num, line in enumerate(lines):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        words = line.split()
+        if len(words) == 3 and words[1] == '=':
+            aliases.append((words[0], words[2], line_num))
+        else:
+            defs[words[0]] = tuple(words[1:])
+
+    # Aliases are resolved at the end so they can refer to definitions which
+    # come later in the file
+    for (alias, name, line_num) in aliases:
+        try:
+            defs[alias] = defs[name]
+        except KeyError:
+            raise ValueError('%d: Alias "%s" refers to unknown object "%s"' % \
+                             (line_num + 1, alias, name))
+    return defs
+
+def compile_pack(source, dest = None):
+    """Compiles the pack source file "source" and writes it to "dest". If
+       "dest" is not given the pack is written alongside "source" with the
+       pack extension. Returns the name of the file written."""
+
+    if dest is None:
+        dest = os.path.splitext(source)[0] + PACK_EXT
+
+    fd = None
+    try:
+        fd = open(source, 'U')
+        defs = parse_source(fd)
+    finally:
+        if fd:
+            fd.close()
+
+    fd = None
+    try:
+        fd = open(dest, 'wb')
+        marshal.dump((PACK_VERSION, defs), fd)
+    finally:
+        if fd:
+            fd.close()
+
+    return dest
+
+def load_pack(filename):
+    """Returns the dict of object definitions in the compiled pack
+       "filename"."""
+
+    fd = None
+    try:
+        fd = open(filename, 'rb')
+        (version, defs) = marshal.load(fd)
+    finally:
+        if fd:
+            fd.close()
+
+    if version != PACK_VERSION:
+        raise ValueError('%s: pack version %s, expected %s. Please ' \
+                         'recompile it.' % (filename, version, PACK_VERSION))
+    return defs
+
+def pack_dir():
+    """The directory where packs are installed for the user."""
+
+    import pdplatform
+    return os.path.join(pdplatform.pref_dir, 'libs')
+
+
+if __name__ == '__main__':
+    # Compile each pack source given into the user's pack directory
+    if len(sys.argv) == 1:
+        print 'Usage: %s <pack source>...' % os.path.basename(sys.argv[0])
+        print 'Compiles each object definition pack source into %s' % \
+              pack_dir()
+        sys.exit(1)
+
+    if not os.path.isdir(pack_dir()):
+        os.makedirs(pack_dir())
+
+    for source in sys.argv[1:]:
+        name = os.path.splitext(os.path.basename(source))[0]
+        print compile_pack(source, os.path.join(pack_dir(), name + PACK_EXT))
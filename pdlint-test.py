@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+""" Tests for pdlint.py """
+
+import pd
+import pdlint
+import pdtest
+
+PATCH_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 10 10 osc~ 440;
+#X obj 10 40 catch~ bus;
+#X obj 10 70 nosuchobject;
+#X obj 100 10 s~ sig;
+#N canvas 0 0 450 300 sub 0;
+#X obj 10 10 send~ sig;
+#X obj 10 40 catch~ bus;
+#X obj 10 70 inlet;
+#X connect 2 0 5 0;
+#X restore 100 100 pd sub;
+#X obj 10 100 table tab;
+#N canvas 0 0 450 300 (subpatch) 0;
+#X array tab 100 float 0;
+#X coords 0 1 99 -1 200 140 1;
+#X restore 100 200 graph;
+#X connect 0 0 1 0;
+#X connect 0 0 7 0;
+#X connect 5 0 0 0;
+"""
+
+def lint(rules = None):
+    patch = pd.PdPatch(PATCH_TEXT.splitlines(True))
+    return pdlint.PdLinter(rules).lint(patch, 'test.pd')
+
+@pdtest.passfail
+def testUnknownObjects():
+    messages = lint([pdlint.UnknownObjects])
+    got = [(m.rule, m.line_num, m.obj.name()) for m in messages]
+    expected = [('unknown-object', 3, 'nosuchobject')]
+    if got != expected:
+        raise pdtest.Unexpected('Unknown objects', expected, got)
+
+@pdtest.passfail
+def testDanglingConnections():
+    # The connect in the sub-patch is checked against the three objects
+    # there, and the sub-patch's restore is counted in the top level canvas
+    messages = lint([pdlint.DanglingConnections])
+    got = [(m.line_num, m.message) for m in messages]
+    expected = [(9, 'Connection dest_id 5 is not an object in the canvas'),
+                (17, 'Connection dest_id 7 is not an object in the canvas')]
+    if got != expected:
+        raise pdtest.Unexpected('Dangling connections', expected, got)
+
+@pdtest.passfail
+def testDuplicateReceives():
+    messages = lint([pdlint.DuplicateReceives])
+    got = [(m.line_num, m.message) for m in messages]
+    expected = [(6, 'Duplicate send~ name "sig" (first at line 5)'),
+                (7, 'Duplicate catch~ name "bus" (first at line 3)'),
+                (13, 'Duplicate table name "tab" (first at line 12)')]
+    if got != expected:
+        raise pdtest.Unexpected('Duplicate receives', expected, got)
+
+@pdtest.passfail
+def testSinglePass():
+    # Every rule sees each node once, whatever else is subscribed to it
+    class Count(pdlint.PdRule):
+        name = 'count'
+        subscribe = (pdlint.ALL,)
+
+        def start(self, patch, filename, messages):
+            pdlint.PdRule.start(self, patch, filename, messages)
+            self.seen = []
+
+        def visit(self, node, obj_id, canvas):
+            self.seen.append(node.value.line_num)
+
+    linter = pdlint.PdLinter(pdlint.RULES + [Count])
+    messages = linter.lint(pd.PdPatch(PATCH_TEXT.splitlines(True)), 'test.pd')
+    got = sorted(linter.rules[-1].seen)
+    expected = range(19)
+    if got != expected:
+        raise pdtest.Unexpected('Nodes visited', expected, got)
+    got = [m.rule for m in messages]
+    expected = ['duplicate-receive', 'duplicate-receive',
+                'dangling-connection', 'unknown-object', 'duplicate-receive',
+                'dangling-connection']
+    if sorted(got) != sorted(expected):
+        raise pdtest.Unexpected('Rules', sorted(expected), sorted(got))
+
+def test():
+    testUnknownObjects()
+    testDanglingConnections()
+    testDuplicateReceives()
+    testSinglePass()
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+
+""" Lint checks for Pd patches, run in a single pass over each patch.
+
+    PdLinter: runs a set of rules over patches
+    PdRule: the base class for rules
+    PdLintMessage: a problem found by a rule
+
+Each rule subscribes to the parts of a patch it checks, and the linter walks
+each patch once, calling each rule for the parts it subscribed to. Running
+more rules doesn't mean more passes over the patch. The keys a rule can
+subscribe to are:
+
+    <element>       every element of that type, e.g. "connect", "msg" or
+                    "canvas" (the top level canvas and each sub-patch)
+    obj:<type>      every object of that type, e.g. "obj:send"
+    canvas-end      the end of each canvas, after everything in it
+    *               everything
+
+For example:
+
+    class NoMetro(pdlint.PdRule):
+        name = 'no-metro'
+        subscribe = ('obj:metro',)
+
+        def visit(self, node, obj_id, canvas):
+            self.warn(node, 'metro is not allowed')
+
+    linter = pdlint.PdLinter(pdlint.RULES + [NoMetro])
+    for message in linter.lint(patch, 'file.pd'):
+        print message
+
+The built-in rules are in RULES."""
+
+import sys
+import getopt
+import collections
+import pd
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+CANVAS_END = 'canvas-end'
+ALL = '*'
+
+
+class PdLintMessage(object):
+    """A problem found by "rule" in the object "obj" of a patch."""
+
+    def __init__(self, rule, obj, message, filename = None):
+        (self.rule, self.obj, self.message, self.filename) = (rule, obj,
+                                                              message,
+                                                              filename)
+        # Objects made rather than parsed have no line number
+        self.line_num = obj.line_num
+
+    def __str__(self):
+        where = self.filename or '<patch>'
+        if self.line_num is not None:
+            # Line numbers are counted from zero
+            where = '%s:%d' % (where, self.line_num + 1)
+        return '%s: %s: %s' % (where, self.rule, self.message)
+
+    def __repr__(self):
+        return '<PdLintMessage %s>' % str(self)
+
+
+class PdRule(object):
+    """The base class for rules. "subscribe" lists the keys the rule's
+       visit() is called for, see the module documentation. A new instance
+       of each rule is made for each linter."""
+
+    # Used in messages and to select rules
+    name = None
+    subscribe = ()
+
+    def __init__(self):
+        self.messages = None
+        self.filename = None
+
+    def start(self, patch, filename, messages):
+        """Called before each patch. Rules which keep state over a patch
+           should reset it here and call this."""
+
+        (self.messages, self.filename) = (messages, filename)
+
+    def visit(self, node, obj_id, canvas):
+        """Called for each node subscribed to. "obj_id" is the object's id
+           in its canvas (-1 for connections and the top level canvas) and
+           "canvas" is the node of the canvas it's in. For canvas-end
+           "node" is the canvas node and "obj_id" the number of objects in
+           it."""
+
+        pass
+
+    def finish(self):
+        """Called after each patch."""
+
+        pass
+
+    def warn(self, node, message):
+        self.messages.append(PdLintMessage(self.name, node.value, message,
+                                           self.filename))
+
+
+class UnknownObjects(PdRule):
+    """Objects which aren't vanilla and weren't found in the includes or
+       the libraries loaded."""
+
+    name = 'unknown-object'
+    subscribe = (pd.OBJ,)
+
+    def visit(self, node, obj_id, canvas):
+        if not node.value.known():
+            self.warn(node, 'Unknown object "%s"' % node.value.name())
+
+
+class DanglingConnections(PdRule):
+    """Connections to or from objects which don't exist."""
+
+    name = 'dangling-connection'
+    subscribe = (pd.CONNECT, CANVAS_END)
+
+    def start(self, patch, filename, messages):
+        PdRule.start(self, patch, filename, messages)
+        self._connects = collections.defaultdict(list)
+
+    def visit(self, node, obj_id, canvas):
+        if node.value.element == pd.CONNECT:
+            self._connects[canvas].append(node)
+            return
+
+        # The end of the canvas, when its number of objects is known
+        for connect in self._connects.pop(node, ()):
+            for attr in ('src_id', 'dest_id'):
+                val = connect.value.get(attr)
+                try:
+                    valid = 0 <= int(val) < obj_id
+                except (TypeError, ValueError):
+                    valid = False
+                if not valid:
+                    self.warn(connect, 'Connection %s %s is not an object ' \
+                              'in the canvas' % (attr, val))
+
+
+class DuplicateReceives(PdRule):
+    """Names which Pd allows only one of in a patch: the names received by
+       catch~, send~ (read by receive~), delwrite~ (read by delread~) and
+       tables and arrays (read by tabread etc)."""
+
+    name = 'duplicate-receive'
+    # Each object type and the attribute holding its name
+    NAME_ATTRS = {'catch~': 'bus_name', 'send~': 'dest', 's~': 'dest',
+                  'delwrite~': 'buf', 'table': 'name'}
+    # Object types which share the name space of another type
+    KINDS = {'s~': 'send~'}
+    subscribe = tuple(['obj:%s' % t for t in NAME_ATTRS]) + ('array',)
+
+    def start(self, patch, filename, messages):
+        PdRule.start(self, patch, filename, messages)
+        self._seen = {}
+
+    def visit(self, node, obj_id, canvas):
+        obj = node.value
+        if obj.element == pd.OBJ:
+            typ = obj.get('type')
+            (kind, name) = (self.KINDS.get(typ, typ),
+                            obj.get(self.NAME_ATTRS[typ]))
+        else:
+            # Arrays and tables share a name space
+            (kind, name) = ('table', obj.get('name'))
+        if not name:
+            return
+
+        first = self._seen.get((kind, name))
+        if first is None:
+            self._seen[(kind, name)] = obj
+        else:
+            line = ''
+            if first.line_num is not None:
+                line = ' (first at line %d)' % (first.line_num + 1)
+            self.warn(node, 'Duplicate %s name "%s"%s' % (kind, name, line))
+
+
+RULES = [UnknownObjects, DanglingConnections, DuplicateReceives]
+
+
+class PdLinter(object):
+    """Runs "rules" (rule classes, by default RULES) over patches."""
+
+    def __init__(self, rules = None):
+        if rules is None:
+            rules = RULES
+        self.rules = [rule() for rule in rules]
+        # Which rules are called for each key
+        self._dispatch = collections.defaultdict(list)
+        for rule in self.rules:
+            for key in rule.subscribe:
+                self._dispatch[key].append(rule)
+
+    def lint(self, patch, filename = None):
+        """Returns a list of the PdLintMessages for the PdPatch "patch",
+           in the order of the objects in the patch."""
+
+        messages = []
+        for rule in self.rules:
+            rule.start(patch, filename, messages)
+
+        root = patch.root()
+        self._visit(root, -1, None)
+        self._canvas(root)
+
+        for rule in self.rules:
+            rule.finish()
+        return messages
+
+    def _visit(self, node, obj_id, canvas):
+        obj = node.value
+        dispatch = self._dispatch
+        element = obj.element
+        for rule in dispatch.get(element, ()):
+            rule.visit(node, obj_id, canvas)
+        if element == pd.OBJ:
+            for rule in dispatch.get('obj:%s' % obj.attrs.get('type'), ()):
+                rule.visit(node, obj_id, canvas)
+        for rule in dispatch.get(ALL, ()):
+            rule.visit(node, obj_id, canvas)
+
+    def _canvas(self, canvas):
+        children = canvas[:]
+        restore = None
+        if canvas.parent is not None and children and \
+           children[-1].value.element == pd.RESTORE:
+            # The sub-patch's own restore is visited after it, as part of
+            # the parent canvas
+            restore = children.pop()
+
+        obj_id = 0
+        for child in children:
+            if child.value.element == pd.CONNECT:
+                self._visit(child, -1, canvas)
+                continue
+
+            self._visit(child, obj_id, canvas)
+            if not child.leaf():
+                sub_restore = self._canvas(child)
+                if sub_restore is not None:
+                    self._visit(sub_restore, obj_id, canvas)
+            obj_id += 1
+
+        for rule in self._dispatch.get(CANVAS_END, ()):
+            rule.visit(canvas, obj_id, canvas)
+        return restore
+
+
+def usage():
+    print """
+Usage: %s [OPTION]... FILE...
+Checks Pd patch files for problems.
+
+Options:
+-i, --include DIR   Search DIR for abstractions and externals. Can be given
+                    more than once.
+-r, --rules R,...   The rules to run (default all: %s)
+-h, --help          Prints this help
+""" % (sys.argv[0], ','.join([r.name for r in RULES]))
+
+if __name__ == '__main__':
+    import pdincludes
+    try:
+        options, args = getopt.getopt(sys.argv[1:], 'i:r:h',
+                                      ['include=', 'rules=', 'help'])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(2)
+
+    (dirs, rules) = ([], RULES)
+    for opt, arg in options:
+        if opt in ('-i', '--include'):
+            dirs.append(arg)
+        elif opt in ('-r', '--rules'):
+            names = arg.split(',')
+            rules = [r for r in RULES if r.name in names]
+            if len(rules) != len(names):
+                print 'Unknown rule in "%s"' % arg
+                usage()
+                sys.exit(2)
+        elif opt in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+
+    if not args:
+        usage()
+        sys.exit(2)
+
+    inc = pdincludes.PdIncludes(dirs)
+    linter = PdLinter(rules)
+    found = False
+    for filename in args:
+        for message in linter.lint(pd.PdFile(filename, inc).patch, filename):
+            print message
+            found = True
+    sys.exit(found and 1 or 0)
@@ -12,8 +12,14 @@ import traceback
 import getopt
 import pd
 import pdplatform
-import pdconfig
 import pdincludes
+import pdlibs
+import pdelf
+import pdscan
+
+# pdlist is run very often (e.g. from version control hooks) so start up time
+# matters. pdconfig (and ConfigParser) is only imported when the pd install
+# dir is not given on the command line, and pdprofile only when profiling.
 
 (VANILLA, EXTENDED, MISSING, TREE, DEPEND) = range(1, 6)
 
@@ -23,14 +29,20 @@ class PdOpts(object):
     def __init__(self, argv):
         self.argv = argv
         options, self.args = getopt.getopt(argv[1:],
-                'vemtdi:p:nhx', ['vanilla', 'extended', 'missing', 'tree',
-                                'depend', 'include=', 'pd=', 'nonames',
-                                'help', 'examples'])
+                'vemtdi:l:p:nkhx', ['vanilla', 'extended', 'missing', 'tree',
+                                'depend', 'include=', 'lib=', 'pd=',
+                                'nonames', 'keep-going',
+                                'help', 'examples', 'profile',
+                                'cprofile='])
 
         self.action = None
         self.include_dirs = []
+        self.libs = []
         self.pd_root = None
         self.print_names = True
+        self.keep_going = False
+        self.profile = False
+        self.cprofile_file = None
 
         for opt,arg in options:
             if opt in ('-v', '--vanilla'):
@@ -55,10 +67,18 @@ class PdOpts(object):
                 self.action = DEPEND
             elif opt in ('-i', '--include'):
                 self.include_dirs.append(os.path.realpath(arg))
+            elif opt in ('-l', '--lib'):
+                self.libs.append(arg)
             elif opt in ('-p', '--pd'):
                 self.pd_root = os.path.realpath(arg)
             elif opt in ('-n', '--nonames'):
                 self.print_names = False
+            elif opt in ('-k', '--keep-going'):
+                self.keep_going = True
+            elif opt == '--profile':
+                self.profile = True
+            elif opt == '--cprofile':
+                self.cprofile_file = arg
             elif opt in ('-h', '--help'):
                 self.usage()
             elif opt in ('-x', '--examples'):
@@ -68,6 +88,8 @@ class PdOpts(object):
             raise getopt.GetoptError('No options given.')
         elif self.action in (VANILLA, EXTENDED) and self.include_dirs:
             raise getopt.GetoptError('-i is not valid with -v or -e')
+        elif self.action == VANILLA and self.libs:
+            raise getopt.GetoptError('-l is not valid with -v')
 
     @staticmethod
     def usage(argv0 = None):
@@ -92,12 +114,25 @@ Options:
 -i, --include     Add a directory to the list of directories that will be
                   searched when objects are found in the patch file which are
                   not known to PD vanilla.
+-l, --lib         Look up objects in the object definition pack for this
+                  library, as if the library was loaded in Pd. Objects given
+                  as library/object are always looked up in the pack for
+                  that library, if there is one. Packs are found in:
+                  %s
 -p, --pd          Override the pd install dir value from the user's prefs
                   file (%s).
 -n, --nonames     Don't output filenames when multiple files are given.
+-k, --keep-going  Read as much as possible of patch files with errors in
+                  them, leaving out the lines in error, and print each
+                  error found after the output for the file.
+    --profile     Print the time spent in each phase of reading, parsing and
+                  output, with object counts, bytes read and include lookup
+                  hit rates, for each file and in total.
+    --cprofile=F  Run under cProfile and dump the stats to file F for use with
+                  the pstats module.
 -h, --help        Prints this help
 -x, --examples    Print some examples.
-""" % (os.path.basename(argv0), pdplatform.pref_file)
+""" % (os.path.basename(argv0), pdlibs.pack_dir(), pdplatform.pref_file)
 
     def examples(self):
         print """
@@ -123,12 +158,36 @@ if __name__ == '__main__':
         PdOpts.usage()
         sys.exit(1)
 
+    if opts.cprofile_file:
+        import cProfile
+        cprof = cProfile.Profile()
+        cprof.enable()
+
+    if opts.profile:
+        import pdprofile
+        prof = pdprofile.PdProfile()
+    else:
+        prof = None
+
     if not opts.pd_root:
+        import pdconfig
         cfg = pdconfig.PdConfigParser(pdplatform.pref_file)
         opts.pd_root = cfg.get('pd_root')
     opts.include_dirs.append(os.path.join(opts.pd_root, 'extra'))
 
-    inc = pdincludes.PdIncludes(opts.include_dirs)
+    libs = pdlibs.PdLibraries([pdlibs.pack_dir()], opts.libs)
+    # The objects provided by compiled externals are cached between runs
+    symbols = pdelf.PdSymbolCache(os.path.join(pdplatform.pref_dir,
+                                               'symbols.cache'))
+
+    if prof:
+        with prof.phase('populate'):
+            inc = pdincludes.PdIncludes(opts.include_dirs, libraries = libs,
+                                        symbols = symbols,
+                                        pd_root = opts.pd_root)
+    else:
+        inc = pdincludes.PdIncludes(opts.include_dirs, libraries = libs,
+                                    symbols = symbols, pd_root = opts.pd_root)
     exit_codes = []
 
     if not opts.print_names:
@@ -136,11 +195,24 @@ if __name__ == '__main__':
             summry_output = set()
 
     for fname in opts.args:
+        f = None
         try:
+            if prof:
+                prof.begin(fname)
+
             if opts.print_names:
                 print '%s' % fname,
 
-            f = pd.PdFile(fname, inc)
+            if opts.action == TREE:
+                f = pd.PdFile(fname, inc, profile = prof,
+                              tolerant = opts.keep_going)
+            else:
+                # The other actions only need the objects the patch depends
+                # on, which a quick scan finds without parsing every line
+                f = pdscan.PdScanFile(fname, inc, profile = prof,
+                                      tolerant = opts.keep_going)
+            if prof:
+                output_start = pdprofile.timer()
             if opts.action == TREE:
                 if opts.print_names:
                     print
@@ -204,6 +276,10 @@ if __name__ == '__main__':
 
                 exit_codes.append(0)
 
+            for diag in f.patch.diagnostics:
+                print '%s:%s' % (fname, diag)
+            exit_codes.append(bool(f.patch.diagnostics))
+
         except Exception, ex:
             if opts.print_names:
                 print
@@ -212,10 +288,26 @@ if __name__ == '__main__':
             exit_codes.append(1)
             #traceback.print_exc(ex)
 
+        if prof:
+            if f is not None:
+                prof.add_time('output', pdprofile.timer() - output_start)
+            prof.end()
+
     if not opts.print_names and opts.action in (DEPEND, MISSING):
         out = list(summry_output)
         out.sort()
         print '\n'.join(out)
 
+    if os.path.isdir(pdplatform.pref_dir):
+        symbols.save()
+
+    if prof:
+        print
+        print prof.report()
+
+    if opts.cprofile_file:
+        cprof.disable()
+        cprof.dump_stats(opts.cprofile_file)
+
     # Exit with 0 for success or 1 for error
     sys.exit(any(exit_codes))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+""" Tests for pdload.py """
+
+import os
+import shutil
+import tempfile
+import threading
+import pd
+import pdgen
+import pdload
+import pdtest
+from pdexceptions import *
+
+NUM_FILES = 10
+
+class BlockingExecutor(object):
+    """Runs each function submitted once "release" is set."""
+
+    class Future(object):
+        def __init__(self, value):
+            self.value = value
+        def result(self):
+            return self.value
+
+    def __init__(self):
+        (self.started, self.release) = (threading.Event(), threading.Event())
+
+    def submit(self, fn, *args):
+        self.started.set()
+        self.release.wait()
+        return self.Future(fn(*args))
+
+def make_files(d):
+    filenames = []
+    for i in range(NUM_FILES):
+        filename = os.path.join(d, 'p%d.pd' % i)
+        pdgen.write(filename, pdgen.generate(50 + i * 10, depth = 1, seed = i))
+        filenames.append(filename)
+    return filenames
+
+@pdtest.passfail
+def testLoadMany(filenames):
+    loaded = dict(pdload.load_many(filenames, workers = 3))
+    if sorted(loaded) != sorted(filenames):
+        raise pdtest.Unexpected('files', sorted(filenames), sorted(loaded))
+
+    for filename in filenames:
+        expected = str(pd.PdFile(filename).patch)
+        got = str(loaded[filename].patch)
+        if got != expected:
+            raise pdtest.Unexpected(filename, expected, got)
+
+@pdtest.passfail
+def testError(filenames):
+    missing = filenames[0] + '.missing'
+    try:
+        for (filename, f) in pdload.load_many([missing] + filenames[1:]):
+            pass
+    except IOError:
+        pass
+    else:
+        raise pdtest.Unexpected('error', 'IOError', 'none')
+
+@pdtest.passfail
+def testCancel(filenames):
+    executor = BlockingExecutor()
+    loader = pdload.PdLoader(workers = 1, executor = executor)
+    try:
+        loads = [loader.load(f) for f in filenames]
+        executor.started.wait()
+        # The first load is running, the rest are waiting for it
+        cancelled = [load.cancel() for load in loads]
+        if cancelled != [False] + [True] * (NUM_FILES - 1):
+            raise pdtest.Unexpected('cancel', [False] + [True] * 9, cancelled)
+
+        try:
+            loads[1].result()
+        except PdCancelled:
+            pass
+        else:
+            raise pdtest.Unexpected('result', 'PdCancelled', 'a result')
+
+        try:
+            loads[0].result(timeout = 0.01)
+        except PdTimeout:
+            pass
+        else:
+            raise pdtest.Unexpected('result', 'PdTimeout', 'a result')
+
+        executor.release.set()
+        if not isinstance(loads[0].result(), pd.PdFile):
+            raise pdtest.Unexpected('result', 'PdFile', loads[0].result())
+    finally:
+        executor.release.set()
+        loader.close()
+
+def test():
+    d = tempfile.mkdtemp()
+    try:
+        filenames = make_files(d)
+        testLoadMany(filenames)
+        testError(filenames)
+        testCancel(filenames)
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == '__main__':
+    test()
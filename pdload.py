@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+""" Loads many Pd patch files concurrently, without blocking the caller.
+
+    PdLoader: a pool of loader threads with a bounded number of loads in
+              progress
+    PdLoad: a handle for a single load, which can be waited on or cancelled
+    load_many(): loads a list of files, yielding each as it completes
+
+Each file is read by a loader thread and then parsed, either in the same
+thread or by an executor given to the PdLoader (any object with a
+submit(fn, *args) method returning an object with a result() method, such as
+a futures.ThreadPoolExecutor). The results are the same pd.PdFile objects
+that loading the files one at a time gives:
+
+    loader = pdload.PdLoader(workers = 8, includes = inc)
+    try:
+        for load in loader.load_many(filenames):
+            print load.filename, len(load.result().patch)
+    finally:
+        loader.close()
+
+Note that parsing is done in python, so with threads it is the reads which
+run concurrently; an executor using processes is needed to parse
+concurrently."""
+
+import sys
+import threading
+import Queue
+import pd
+from pdexceptions import *
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+WORKERS = 4
+
+(PENDING, RUNNING, DONE, CANCELLED) = range(4)
+
+
+class PdLoad(object):
+    """The pending result of loading a single file. Made by PdLoader.load(),
+       not directly."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._state = PENDING
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._cond = threading.Condition()
+
+    def cancel(self):
+        """Cancels the load if it hasn't started. Returns True if the load
+           is cancelled."""
+
+        with self._cond:
+            if self._state != PENDING:
+                return self._state == CANCELLED
+            self._state = CANCELLED
+            self._cond.notify_all()
+            callbacks = self._take_callbacks()
+        for fn in callbacks:
+            fn(self)
+        return True
+
+    def cancelled(self):
+        return self._state == CANCELLED
+
+    def done(self):
+        """Returns True if the load has completed, failed or was
+           cancelled."""
+
+        return self._state in (DONE, CANCELLED)
+
+    def result(self, timeout = None):
+        """Waits for the load to complete and returns the pd.PdFile. Raises
+           the exception raised by the load if it failed, PdCancelled if it
+           was cancelled, or PdTimeout if "timeout" seconds pass first."""
+
+        with self._cond:
+            if not self.done():
+                self._cond.wait(timeout)
+            if self._state == CANCELLED:
+                raise PdCancelled(self.filename)
+            if self._state != DONE:
+                raise PdTimeout(self.filename, timeout)
+            if self._exc_info:
+                raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+            return self._result
+
+    def add_done_callback(self, fn):
+        """Calls "fn" with this PdLoad when it's done. If it's already done
+           "fn" is called straight away."""
+
+        with self._cond:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _start(self):
+        # Returns False if the load was cancelled before it started
+        with self._cond:
+            if self._state == CANCELLED:
+                return False
+            self._state = RUNNING
+            return True
+
+    def _finish(self, result, exc_info = None):
+        with self._cond:
+            (self._result, self._exc_info) = (result, exc_info)
+            self._state = DONE
+            self._cond.notify_all()
+            callbacks = self._take_callbacks()
+        for fn in callbacks:
+            fn(self)
+
+    def _take_callbacks(self):
+        # Called with the lock held. The callbacks are run after it's
+        # released.
+        (callbacks, self._callbacks) = (self._callbacks, [])
+        return callbacks
+
+    def __repr__(self):
+        states = ['pending', 'running', 'done', 'cancelled']
+        return '<PdLoad %s %s>' % (self.filename, states[self._state])
+
+
+class PdLoader(object):
+    """Loads patch files in a pool of threads. At most "workers" files are
+       loaded at once; more can be queued with load().
+
+       "includes" is passed to each pd.PdFile. If "executor" is given the
+       parsing of each file is submitted to it, after the file is read."""
+
+    def __init__(self, workers = WORKERS, includes = None, executor = None):
+        if workers < 1:
+            raise ValueError('"workers" must be at least 1')
+        self.includes = includes
+        self.executor = executor
+        self._queue = Queue.Queue()
+        self._closed = False
+        self._threads = []
+        for i in range(workers):
+            t = threading.Thread(target = self._work,
+                                 name = 'PdLoader-%d' % i)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def load(self, filename):
+        """Queues "filename" to be loaded and returns a PdLoad for it."""
+
+        if self._closed:
+            raise RuntimeError('PdLoader is closed')
+        load = PdLoad(filename)
+        self._queue.put(load)
+        return load
+
+    def load_many(self, filenames):
+        """Loads all of "filenames", yielding a PdLoad for each as it
+           completes. If the caller stops early, by closing the generator or
+           breaking out of a for loop, the loads not yet started are
+           cancelled."""
+
+        done = Queue.Queue()
+        loads = [self.load(f) for f in filenames]
+        for load in loads:
+            load.add_done_callback(done.put)
+
+        try:
+            for i in range(len(loads)):
+                yield done.get()
+        finally:
+            for load in loads:
+                load.cancel()
+
+    def _work(self):
+        while True:
+            load = self._queue.get()
+            if load is None:
+                break
+            if not load._start():
+                continue
+            try:
+                lines = pd.read_lines(load.filename)
+                if self.executor is None:
+                    result = _parse(load.filename, self.includes, lines)
+                else:
+                    result = self.executor.submit(_parse, load.filename,
+                                                  self.includes,
+                                                  lines).result()
+            except Exception:
+                load._finish(None, sys.exc_info())
+            else:
+                load._finish(result)
+
+    def close(self, cancel = False):
+        """Stops the loader threads once the queued loads are done, or with
+           "cancel" cancels the loads not yet started. Waits for the threads
+           to finish."""
+
+        if self._closed:
+            return
+        self._closed = True
+
+        if cancel:
+            while True:
+                try:
+                    load = self._queue.get_nowait()
+                except Queue.Empty:
+                    break
+                load.cancel()
+
+        for t in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close(cancel = exc_type is not None)
+
+
+def _parse(filename, includes, lines):
+    # A module level function, so it can be used with a process executor
+    return pd.PdFile(filename, includes, lines = lines)
+
+def load_many(filenames, includes = None, workers = WORKERS,
+              executor = None):
+    """Loads all of "filenames" with "workers" loads at once. Yields
+       (filename, pd.PdFile) tuples in the order the loads complete. Raises
+       the exception from the first load that fails, and cancels the rest."""
+
+    with PdLoader(workers, includes, executor) as loader:
+        for load in loader.load_many(filenames):
+            yield (load.filename, load.result())
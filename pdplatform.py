@@ -1,10 +1,10 @@
 
-import platform
 import os
+import sys
 
-# TODO What does the mac return?
-
-home = os.environ['HOME']
+# Use expanduser rather than os.environ['HOME'] so that importing this module
+# doesn't fail when HOME isn't set (e.g. when run from git hooks or cron).
+home = os.path.expanduser('~')
 
 (UNIX, WIN, MAC, UNKNOWN) = range(4)
 home_dirs = { UNIX: os.path.join(home, '.pypd'),
@@ -12,19 +12,22 @@ home_dirs = { UNIX: os.path.join(home, '.pypd'),
               MAC:  os.path.join(home, 'Library', 'Preferences', 'PyPD') }
 
 # Platform values don't change so we setup some global constants on import
-#     gPlatform, gPrefDir, gPrefFile
+#     platform, pref_dir, pref_file
+#
+# We use sys.platform rather than platform.system() from the platform module.
+# platform.system() runs "uname -p" in a sub-process on most unix systems,
+# which is far too slow to do every time a utility starts up.
 
-_plat = platform.system().lower()
-# would be nice to have a dict that looks up keys with .startswith
-# instead of this.
+_plat = sys.platform
 if _plat.startswith('linux') or _plat.startswith('cygwin'):
     platform = UNIX
-elif _plat.startswith('windows'):
+elif _plat.startswith('win'):
     platform = WIN
-elif _plat.startswith('mac'):
+elif _plat.startswith('darwin'):
     platform = MAC
 else:
     platform = UNKNOWN
 
-pref_dir = home_dirs[platform]
+# Any other unix-like system gets the unix location
+pref_dir = home_dirs.get(platform, home_dirs[UNIX])
 pref_file = os.path.join(pref_dir, 'prefs')
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+""" Tests for pdprofile.py """
+
+import os
+import shutil
+import tempfile
+import threading
+import pd
+import pdelement
+import pdincludes
+import pdprofile
+import pdtest
+from pdexceptions import *
+
+PATCH_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 10 10 osc~ 440;
+#X obj 10 40 myabs;
+#X obj 10 70 nothere;
+#X obj 10 100 nothere;
+#X msg 10 130 bang;
+"""
+
+def make_tree(d):
+    os.mkdir(os.path.join(d, 'abs'))
+    open(os.path.join(d, 'abs', 'myabs.pd'), 'w').close()
+    path = os.path.join(d, 'main.pd')
+    with open(path, 'w') as f:
+        f.write(PATCH_TEXT)
+    return path
+
+@pdtest.passfail
+def testPhases():
+    prof = pdprofile.PdProfile()
+    with prof.phase('outer'):
+        with prof.phase('inner'):
+            sum(range(1000))
+    times = prof.total.times
+    if prof.total._phases != ['inner', 'outer'] or \
+       times['inner'] > times['outer']:
+        raise pdtest.Unexpected('phases', ['inner', 'outer'],
+                                prof.total._phases)
+
+    # Only what's recorded between begin() and end() is given to the file
+    prof.begin('one')
+    prof.count('x', 2)
+    prof.end()
+    prof.count('x')
+    if (prof.files[0].counts['x'], prof.total.counts['x']) != (2, 3):
+        raise pdtest.Unexpected('counts', (2, 3), (prof.files[0].counts['x'],
+                                                   prof.total.counts['x']))
+
+@pdtest.passfail
+def testCounts(d):
+    path = os.path.join(d, 'main.pd')
+    inc = pdincludes.PdIncludes([os.path.join(d, 'abs')])
+    prof = pdprofile.PdProfile()
+    pd.PdFile(path, inc, profile = prof)
+
+    stats = prof.files[0]
+    expected = {'files': 1, 'bytes': len(PATCH_TEXT), 'objects': 6,
+                'includes.hit': 1, 'includes.miss': 2}
+    if stats.counts != expected:
+        raise pdtest.Unexpected('counts', expected, stats.counts)
+    phases = ['read', 'lookup', 'includes', 'parse', 'tree', 'declares']
+    if stats._phases != phases:
+        raise pdtest.Unexpected('phases', phases, stats._phases)
+    if stats.times['lookup'] + stats.times['includes'] > stats.times['parse']:
+        raise pdtest.Unexpected('parse', 'lookups within the parse',
+                                stats.times)
+    if 'includes hit' not in str(stats):
+        raise pdtest.Unexpected('report', 'includes hit', str(stats))
+
+class _LoadingIncludes(pdincludes.PdIncludes):
+    # Loads "path" in another thread, without a profile, during each lookup
+    def __init__(self, dirs, path):
+        pdincludes.PdIncludes.__init__(self, dirs)
+        self.path = path
+
+    def get(self, key):
+        t = threading.Thread(target = pd.PdFile,
+                             args = (self.path, pdincludes.PdIncludes([])))
+        t.start()
+        t.join()
+        return pdincludes.PdIncludes.get(self, key)
+
+@pdtest.passfail
+def testThreads(d):
+    # Patches loaded by other threads without the profile aren't recorded,
+    # even while a profiled patch is being loaded
+    path = os.path.join(d, 'main.pd')
+    inc = _LoadingIncludes([os.path.join(d, 'abs')], path)
+    prof = pdprofile.PdProfile()
+    pd.PdFile(path, inc, profile = prof)
+    got = (prof.total.counts['includes.hit'],
+           prof.total.counts['includes.miss'])
+    if got != (1, 2):
+        raise pdtest.Unexpected('counts', (1, 2), got)
+
+@pdtest.passfail
+def testException(d):
+    # Nothing is replaced while profiling, so nothing needs putting back
+    (element_get, includes_get) = (pdelement.get, pdincludes.PdIncludes.get)
+    prof = pdprofile.PdProfile()
+    try:
+        pd.PdPatch(['#X obj 10 10 f;\n'], profile = prof)
+        raise pdtest.Unexpected('invalid', 'InvalidPdLine', 'no exception')
+    except InvalidPdLine:
+        pass
+    if pdelement.get is not element_get or \
+       pdincludes.PdIncludes.get != includes_get:
+        raise pdtest.Unexpected('restored', 'the same functions',
+                                'replaced functions')
+
+def test():
+    d = tempfile.mkdtemp()
+    try:
+        make_tree(d)
+        testPhases()
+        testCounts(d)
+        testThreads(d)
+        testException(d)
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+""" Lightweight instrumentation for finding out where the time goes when
+reading and parsing Pd patch files.
+
+    PdProfile: collects per-phase wall time and counters for each file and
+               in aggregate.
+
+A PdProfile is passed to PdFile or PdPatch with the "profile" keyword.
+Nothing is recorded, and nothing costs anything, when it is not given:
+
+    prof = pdprofile.PdProfile()
+    f = pd.PdFile('test1.pd', includes, profile = prof)
+    print prof.report()
+
+The phases recorded by the library are:
+    read        reading the file from disk
+    parse       tokenizing lines and creating each PdObject. This includes
+                the time spent in the two phases below.
+    lookup      pdelement.get() schema lookups
+    includes    PdIncludes.get() lookups for non-vanilla objects, counted
+                as "includes.hit" and "includes.miss"
+    tree        building the PdPatch tree from the parsed objects
+    declares    resolving objects with the search path and libraries given
+                by declare and import
+
+The lookups are timed by each PdObject made with the profile, so only the
+patches loaded with a profile are recorded in it, whichever threads are
+loading other patches at the same time. A PdProfile should only be used by
+one thread at a time.
+
+Callers may record their own phases (e.g. pdlist records "populate" and
+"output") and counters with phase() and count(). Counters named "X.hit" and
+"X.miss" are reported as a hit rate for X."""
+
+import timeit
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+# Best available wall clock for the platform
+timer = timeit.default_timer
+
+HIT = '.hit'
+MISS = '.miss'
+
+
+class PdStats(object):
+    """Phase times and counters for a single file, or for the aggregate of
+       all files."""
+
+    def __init__(self, name):
+        self.name = name
+        self.times = {}
+        self.counts = {}
+        # Phases and counters are reported in the order they are first seen
+        self._phases = []
+        self._counters = []
+
+    def add_time(self, phase, secs):
+        if phase not in self.times:
+            self.times[phase] = 0.0
+            self._phases.append(phase)
+        self.times[phase] += secs
+
+    def add_count(self, counter, n):
+        if counter not in self.counts:
+            self.counts[counter] = 0
+            self._counters.append(counter)
+        self.counts[counter] += n
+
+    def __str__(self):
+        lines = [self.name]
+        for phase in self._phases:
+            lines.append('    %-12s%10.6fs' % (phase, self.times[phase]))
+
+        rates = []
+        for counter in self._counters:
+            lines.append('    %-12s%10d' % (counter, self.counts[counter]))
+            if counter.endswith(HIT):
+                rates.append(counter[:-len(HIT)])
+
+        for key in rates:
+            hits = self.counts.get(key + HIT, 0)
+            total = hits + self.counts.get(key + MISS, 0)
+            if total:
+                lines.append('    %-12s%9.1f%%' % (key + ' hit',
+                                                   100.0 * hits / total))
+        return '\n'.join(lines)
+
+
+class _PdPhase(object):
+    """Context manager returned by PdProfile.phase()."""
+
+    def __init__(self, profile, phase):
+        (self.profile, self.phase, self.start) = (profile, phase, None)
+
+    def __enter__(self):
+        self.start = timer()
+        return self
+
+    def __exit__(self, ex_type, ex_value, tb):
+        self.profile.add_time(self.phase, timer() - self.start)
+        # let exceptions propagate up
+        return False
+
+
+class PdProfile(object):
+    """Collects phase timings and counters. Each file is recorded separately
+       between calls to begin() and end(), and everything is also added to
+       an aggregate total. Times and counts recorded outside begin()/end()
+       only go to the total."""
+
+    def __init__(self):
+        self.files = []
+        self.total = PdStats('total')
+        self._cur = None
+
+    def begin(self, name):
+        """Start recording for the file "name"."""
+        self._cur = PdStats(name)
+        self.files.append(self._cur)
+        self.count('files')
+
+    def end(self):
+        self._cur = None
+
+    def recording(self):
+        """Returns True between calls to begin() and end()."""
+        return self._cur is not None
+
+    def add_time(self, phase, secs):
+        if self._cur is not None:
+            self._cur.add_time(phase, secs)
+        self.total.add_time(phase, secs)
+
+    def count(self, counter, n = 1):
+        if self._cur is not None:
+            self._cur.add_count(counter, n)
+        self.total.add_count(counter, n)
+
+    def phase(self, phase):
+        """Returns a context manager which records the time spent inside the
+           "with" block against "phase"."""
+        return _PdPhase(self, phase)
+
+    def report(self, per_file = True):
+        """Returns a printable report of each file (unless "per_file" is
+           False) followed by the aggregate totals."""
+
+        if per_file:
+            stats = self.files + [self.total]
+        else:
+            stats = [self.total]
+        return '\n\n'.join([str(s) for s in stats])
+
+    def __str__(self):
+        return self.report()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+""" Tests for pdscan.py """
+
+import os
+import shutil
+import tempfile
+import pd
+import pdincludes
+import pdscan
+import pdtest
+from pdexceptions import *
+
+MAIN_TEXT = """#N canvas 0 0 450 300 10;
+#X declare -path abs;
+#X obj 10 10 osc~ 440;
+#X obj 10 40 voice;
+#N canvas 0 0 450 300 sub 0;
+#X obj 10 10 voice;
+#X obj 10 40 missing 1 2;
+#X msg 10 70 set \\; other
+1 \\; done;
+#X restore 10 70 pd sub;
+#X obj 10 100 missing;
+#X weird 1 2;
+#X connect 0 0 1 0;
+#A 0 1 2 3;
+#X obj 10 130 f"""
+
+def make_tree(root):
+    os.mkdir(os.path.join(root, 'abs'))
+    with open(os.path.join(root, 'abs', 'voice.pd'), 'w') as f:
+        f.write('#N canvas 0 0 450 300 10;\n')
+
+def summary(patch):
+    # What pdlist prints for -v, -m and -d
+    return (sorted(set([n.value.name() for (n, i, l) in \
+                        patch.select(vanilla = False)])),
+            sorted(set([n.value.name() for (n, i, l) in \
+                        patch.select(known = False)])),
+            sorted(set([d for (n, i, l) in patch for d in n.value.include])))
+
+@pdtest.passfail
+def testRecords():
+    # The lines are those the parser makes, ending at the unescaped ";" of
+    # the last line although there's no newline after it
+    got = [(MAIN_TEXT.count('\n', 0, pos), text) \
+           for (pos, text) in pdscan._records(MAIN_TEXT + ';')]
+    expected = [(o.line_num, o.text) for o in \
+                pd.PdObject.factory((MAIN_TEXT + ';').splitlines(True), None)]
+    if got != expected:
+        raise pdtest.Unexpected('Records', expected, got)
+
+@pdtest.passfail
+def testSameAsParsed(root):
+    inc = pdincludes.PdIncludes([])
+    filename = os.path.join(root, 'main.pd')
+    with open(filename, 'w') as f:
+        f.write(MAIN_TEXT + ';\n')
+
+    scanned = pdscan.PdScanFile(filename, inc)
+    expected = summary(pd.PdFile(filename, inc).patch)
+    got = summary(scanned.patch)
+    if got != expected:
+        raise pdtest.Unexpected('Summary', expected, got)
+    # The abstraction is only found through the declared path
+    if got[2] != [os.path.join(root, 'abs')]:
+        raise pdtest.Unexpected('Includes', [os.path.join(root, 'abs')],
+                                got[2])
+
+    # Only the first object of each type which isn't vanilla is kept
+    got = [n.value.line_num for (n, i, l) in scanned.patch]
+    expected = [0, 1, 3, 6, 11]
+    if got != expected:
+        raise pdtest.Unexpected('Objects', expected, got)
+
+@pdtest.passfail
+def testInvalid():
+    for (text, ex) in (('#X obj 10 10 f;\n', InvalidPdLine),
+                       ('#N struct s float x;\n', PdInvalidPatch),
+                       ('#N canvas 0 0 450 300 10;\n#X restore 1 1 pd;\n' \
+                        '#X obj 10 10 f;\n', PdInvalidPatch),
+                       ('#N canvas 0 0 450 300 10;\n#Q obj 1 1 f;\n',
+                        ValueError)):
+        try:
+            pdscan.scan(text)
+        except ex:
+            continue
+        raise pdtest.Unexpected('Scanning %r' % text, ex.__name__,
+                                'no exception')
+
+@pdtest.passfail
+def testTolerant():
+    # The same errors are found as when the whole patch is parsed
+    text = '#X obj 1 1 f;\n' + MAIN_TEXT.replace('#X restore', '#Q restore')
+    scanned = pdscan.scan(text, tolerant = True)
+    parsed = pd.PdPatch(text.splitlines(True), tolerant = True)
+    got = [(d.line_num, d.kind, d.text) for d in scanned.diagnostics]
+    expected = [(d.line_num, d.kind, d.text) for d in parsed.diagnostics]
+    if got != expected or len(got) != 4:
+        raise pdtest.Unexpected('Diagnostics', expected, got)
+    if summary(scanned) != summary(parsed):
+        raise pdtest.Unexpected('Summary', summary(parsed), summary(scanned))
+
+def test():
+    d = tempfile.mkdtemp()
+    try:
+        make_tree(d)
+        testRecords()
+        testSameAsParsed(d)
+        testInvalid()
+        testTolerant()
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == '__main__':
+    test()
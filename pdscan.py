@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+""" A quick scan of a Pd patch file for the objects it depends on.
+
+    scan(): returns a PdPatch of the objects a patch needs from outside
+    PdScanFile: a PdFile whose patch is made by scan()
+
+Listing the objects a patch needs which aren't vanilla, or the directories
+of the abstractions it uses, only needs the type of each object, the
+declares and the nesting of the canvases. scan() splits the text of the
+patch into Pd lines and looks only at the first few words of each, so no
+PdObject is made for most lines. A PdObject is made for the first object of
+each type, and for each declare, and those which aren't vanilla are kept.
+As every object of a type is found in the same place, the result is the same
+as parsing the whole patch:
+
+    patch = pdscan.PdScanFile('main.pd', includes).patch
+    for (node, obj_id, level) in patch.select(known = False):
+        print node.value.name()
+
+The patch returned only holds the top level canvas, the declares and the
+first object of each type which isn't vanilla, all in the top level canvas,
+so it's only useful for finding dependencies. Object ids and sub-patches
+aren't kept."""
+
+import os
+import sys
+import pd
+from pdexceptions import *
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+# The end of each Pd line
+LINE_END = ';\n'
+# Connections are most of the lines of most patches, and never needed
+CONNECT_LINE = '%s %s ' % (pd.XCHUNK, pd.CONNECT)
+
+
+def _join(text):
+    # Joins the lines of "text" as PdObject.factory() does, dropping blank
+    # lines and adding a space between lines where there isn't one
+    joined = ''
+    for line in text.split('\n'):
+        if line and not line.isspace():
+            if joined and joined[-1] != ' ':
+                joined += ' '
+            joined += line
+    return joined
+
+def _records(data, tail = None):
+    """Yields (offset, text) for each Pd line of "data", the text of a patch
+       file, without its ';'. The lines are the same as those
+       PdObject.factory() makes. "offset" is where the line starts in
+       "data". If a list is given as "tail", the (offset, text) of any text
+       left at the end without a ';' is added to it."""
+
+    pieces = data.split(LINE_END)
+    last = pieces.pop()
+    (pos, start, pending) = (0, 0, None)
+    for piece in pieces:
+        if pending is None:
+            start = pos
+        else:
+            piece = pending + LINE_END + piece
+            pending = None
+        pos = start + len(piece) + len(LINE_END)
+
+        # Most lines are on a single line of the file and end the Pd line
+        if '\n' not in piece and piece and piece[-1] != '\\':
+            yield (start, piece)
+            continue
+
+        text = _join(piece + ';')
+        if len(text) < 2 or text[-2] == '\\':
+            # An escaped ';', so the Pd line goes on
+            pending = piece
+            continue
+        yield (start + len(piece) - len(piece.lstrip()), text[:-1])
+
+    # The last line of the file may end with ';' but no newline
+    if pending is None:
+        start = pos
+    else:
+        last = pending + LINE_END + last
+    text = _join(last)
+    start += len(last) - len(last.lstrip())
+    if len(text) > 1 and text[-1] == ';' and text[-2] != '\\':
+        yield (start, text[:-1])
+    elif text and tail is not None:
+        tail.append((start, text))
+
+def scan(data, includes = None, dirname = None, tolerant = False):
+    """Returns a PdPatch of the top level canvas of "data", the text of a
+       patch file, its declares and the first object of each type which
+       isn't vanilla, found as they would be if the whole patch was parsed.
+       See PdPatch() for "includes", "dirname" and "tolerant". Raises the
+       same exceptions as PdPatch() for patches which can't be parsed, and
+       with "tolerant" the patch has the same diagnostics."""
+
+    # The objects kept, and the (chunk, element, type) of each object seen
+    (canvas, objects, seen) = (None, [], set())
+    # The keys of the lines which can't be parsed, and the offsets and text
+    # of the open sub-patches, with "tolerant"
+    (bad, errors, tail, canvases) = (set(), [], [], [])
+    # The line number of the last line looked at, and its offset
+    (last, line_num) = (0, 0)
+    depth = 0
+
+    def line(pos):
+        return line_num + data.count('\n', last, pos)
+
+    if not tolerant:
+        tail = None
+    for (pos, text) in _records(data, tail):
+        if depth == 0 and canvas is not None:
+            raise PdInvalidPatch('Found objects after the end of the top ' \
+                                 'level canvas')
+
+        if canvas is not None and text.startswith(CONNECT_LINE):
+            continue
+        words = text.split(' ', 5)
+        if canvas is not None and words[0] == pd.ACHUNK:
+            # Array data is always vanilla
+            continue
+        element = None
+        if len(words) > 1:
+            element = words[1]
+        if element == pd.OBJ:
+            typ = len(words) > 4 and words[4] or None
+            key = (words[0], element, typ)
+            declare = typ in pd.DECLARE_ELEMENTS
+        else:
+            key = (words[0], element)
+            declare = element in pd.DECLARE_ELEMENTS
+
+        obj = None
+        if key not in seen or declare or canvas is None or key in bad:
+            # Objects before the top level canvas aren't kept
+            if canvas is not None:
+                seen.add(key)
+            (line_num, last) = (line(pos), pos)
+            try:
+                obj = pd.PdObject(text, line_num, includes)
+            except ValueError, ex:
+                if not tolerant:
+                    raise
+                bad.add(key)
+                errors.append(pd.PdDiagnostic(line_num, pd.BAD_LINE, text,
+                                              str(ex)))
+                continue
+
+        if canvas is None:
+            # Only structs can come before the top level canvas
+            if obj.element == pd.CANVAS:
+                (canvas, depth) = (obj, 1)
+            elif obj.element == pd.STRUCT:
+                pass
+            elif tolerant:
+                errors.append(pd.PdDiagnostic(obj.line_num, pd.BEFORE_CANVAS,
+                                              obj.text, 'Only structs can ' \
+                                              'come before the first canvas'))
+            else:
+                raise InvalidPdLine(obj.text, obj.line_num)
+            continue
+
+        if element == pd.CANVAS:
+            depth += 1
+            if tolerant:
+                canvases.append((pos, text))
+        elif element == pd.RESTORE and len(words) > 4 and words[4]:
+            # As in PdPatch, restores without a name don't end a canvas
+            if depth == 1 and tolerant:
+                (line_num, last) = (line(pos), pos)
+                errors.append(pd.PdDiagnostic(line_num, pd.EXTRA_RESTORE,
+                                              text, 'Restore with no ' \
+                                              'sub-patch to end'))
+                continue
+            depth -= 1
+            if tolerant:
+                canvases.pop()
+
+        if obj is not None and canvas is not obj and \
+           (declare or not obj.vanilla):
+            objects.append(obj)
+
+    if canvas is None:
+        raise PdInvalidPatch('No starting canvas definition found')
+    # The same diagnostics as PdPatch, in the same order
+    for (pos, text) in tail or ():
+        (line_num, last) = (line(pos), pos)
+        errors.append(pd.PdDiagnostic(line_num, pd.UNTERMINATED, text,
+                                      'No ";" at the end of the line'))
+    for (pos, text) in reversed(canvases):
+        errors.append(pd.PdDiagnostic(data.count('\n', 0, pos),
+                                      pd.UNCLOSED_CANVAS, text,
+                                      'Sub-patch has no restore'))
+
+    patch = pd.PdPatch.from_objects([canvas] + objects, includes, dirname)
+    patch.diagnostics = errors
+    return patch
+
+
+class PdScanFile(pd.PdFile):
+    """A PdFile whose patch is made by scan(), so it only holds the objects
+       the patch depends on. See PdFile for the arguments."""
+
+    def __init__(self, filename, includes = None, profile = None,
+                 tolerant = False):
+        self.filename = filename
+        self.includes = includes
+        self.lines = None
+        dirname = os.path.dirname(os.path.abspath(filename))
+
+        own_record = profile is not None and not profile.recording()
+        if own_record:
+            profile.begin(filename)
+        try:
+            if profile is None:
+                self.patch = scan(self._read_data(), includes, dirname,
+                                  tolerant)
+            else:
+                with profile.phase('read'):
+                    data = self._read_data()
+                profile.count('bytes', len(data))
+                with profile.phase('parse'):
+                    self.patch = scan(data, includes, dirname, tolerant)
+        finally:
+            if own_record:
+                profile.end()
+
+    def _read_data(self):
+        fd = open(self.filename, 'U')
+        try:
+            return fd.read()
+        finally:
+            fd.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print 'Usage: %s FILE' % sys.argv[0]
+        print 'Lists the objects which aren\'t vanilla in the Pd patch FILE.'
+        sys.exit(2)
+
+    patch = PdScanFile(sys.argv[1]).patch
+    for (node, obj_id, level) in patch.select(vanilla = False):
+        print node.value.name()
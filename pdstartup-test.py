@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+""" Start up checks for pdlist. pdlist is run from version control hooks many
+times a day, so importing it must stay cheap. These tests check that the
+expensive modules aren't imported and that the time to import pdlist stays
+within budget."""
+
+import os
+import sys
+import subprocess
+import timeit
+import pdtest
+
+# Modules which must not be imported just by importing pdlist
+#   platform        platform.system() runs "uname -p" in a sub-process
+#   ConfigParser    only needed when the pd install dir isn't given
+#   pdconfig
+#   pdprofile       only needed with --profile
+#   pdtest          test helper
+HEAVY_MODULES = ['platform', 'ConfigParser', 'pdconfig', 'pdprofile', 'pdtest']
+
+# Budget in seconds for importing pdlist, over and above starting python
+STARTUP_BUDGET = 0.05
+RUNS = 11
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def run(code):
+    """Run "code" in a fresh interpreter and return its output."""
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd = HERE,
+                            stdout = subprocess.PIPE)
+    return proc.communicate()[0]
+
+def median_time(code):
+    times = []
+    for i in range(RUNS):
+        start = timeit.default_timer()
+        run(code)
+        times.append(timeit.default_timer() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+@pdtest.passfail
+def testImports():
+    out = run('import sys, pdlist; print " ".join(sys.modules.keys())')
+    loaded = set(out.split())
+    for name in HEAVY_MODULES:
+        if name in loaded:
+            raise pdtest.Unexpected(name, 'not imported', 'imported')
+
+@pdtest.passfail
+def testBudget():
+    base = median_time('pass')
+    cost = median_time('import pdlist') - base
+    print 'import pdlist: %.1fms (budget %.1fms)' % (cost * 1000,
+                                                     STARTUP_BUDGET * 1000)
+    if cost > STARTUP_BUDGET:
+        raise pdtest.Unexpected('import pdlist', '<= %.3fs' % STARTUP_BUDGET,
+                                '%.3fs' % cost)
+
+def test():
+    testImports()
+    testBudget()
+
+if __name__ == '__main__':
+    test()
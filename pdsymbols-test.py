@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+""" Tests for pdsymbols.py """
+
+import os
+import shutil
+import tempfile
+import pd
+import pdincludes
+import pdsymbols
+import pdtest
+
+MAIN_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 10 10 s tempo;
+#X obj 10 40 voice;
+#X obj 10 70 voice;
+#X obj 10 100 r \\$0-local;
+#X msg 100 10 \\; \\$0-local 1 \\; volume 0.5;
+#X obj 100 40 tabread missing;
+#X obj 100 70 catch~ bus;
+#X floatatom 100 100 5 0 0 0 - - level;
+#X obj 100 130 v shared;
+"""
+
+VOICE_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 10 10 receive tempo;
+#X obj 10 40 throw~ bus;
+#N canvas 0 0 450 300 sub 0;
+#X obj 10 10 s \\$0-local;
+#X obj 10 40 tgl 15 0 empty gate 0 17 7 0 10 -262144 -1 -1 0 1;
+#X restore 10 70 pd sub;
+#X obj 10 100 r \\$0-local;
+#X obj 10 130 value shared;
+"""
+
+def make_tree(root):
+    for (name, text) in (('main.pd', MAIN_TEXT), ('voice.pd', VOICE_TEXT)):
+        with open(os.path.join(root, name), 'w') as f:
+            f.write(text)
+
+def where(syms):
+    return [(os.path.basename(s.filename), s.obj.line_num) for s in syms]
+
+@pdtest.passfail
+def testLookup(root):
+    inc = pdincludes.PdIncludes([root])
+    symbols = pdsymbols.PdSymbols.load(os.path.join(root, 'main.pd'), inc)
+    voice = os.path.join(root, 'voice.pd')
+
+    # The abstraction is loaded once however many times it's used
+    for (got, expected) in \
+        ((where(symbols.senders('tempo')), [('main.pd', 1)]),
+         (where(symbols.receivers('tempo')), [('voice.pd', 1)]),
+         (where(symbols.senders('bus', pdsymbols.BUS)), [('voice.pd', 2)]),
+         (where(symbols.receivers('bus', pdsymbols.BUS)), [('main.pd', 7)]),
+         (where(symbols.senders('bus')), []),
+         # The sub-patch shares the $0 of its patch file
+         (where(symbols.senders('$0-local', filename = voice)),
+          [('voice.pd', 4)]),
+         (where(symbols.receivers('\\$0-local', filename = voice)),
+          [('voice.pd', 7)]),
+         # Without the file it's a different symbol
+         (where(symbols.senders('$0-local')), []),
+         # Each value object both sets and gets the variable
+         (where(symbols.senders('shared', pdsymbols.VALUE)),
+          [('main.pd', 9), ('voice.pd', 8)]),
+         (where(symbols.receivers('shared', pdsymbols.VALUE)),
+          [('main.pd', 9), ('voice.pd', 8)])):
+        if got != expected:
+            raise pdtest.Unexpected('Symbols', expected, got)
+
+@pdtest.passfail
+def testUnmatched(root):
+    symbols = pdsymbols.PdSymbols.load(os.path.join(root, 'main.pd'),
+                                       pdincludes.PdIncludes([root]))
+    got = [(s.namespace, s.name) for s in symbols.orphaned_sends()]
+    expected = [(pdsymbols.MESSAGE, 'volume'), (pdsymbols.TABLE, 'missing'),
+                (pdsymbols.MESSAGE, 'level')]
+    if got != expected:
+        raise pdtest.Unexpected('Orphaned sends', expected, got)
+
+    # The "empty" send of the toggle isn't a symbol
+    got = [(s.namespace, s.name) for s in symbols.unmatched_receives()]
+    expected = [(pdsymbols.MESSAGE, 'gate')]
+    if got != expected:
+        raise pdtest.Unexpected('Unmatched receives', expected, got)
+
+@pdtest.passfail
+def testFoundWhenParsed():
+    # Only objects which may use symbols are kept by the patch
+    patch = pd.PdPatch(MAIN_TEXT.splitlines(True))
+    got = [o.line_num for o in patch._symbols]
+    expected = [1, 4, 5, 6, 7, 8, 9]
+    if got != expected:
+        raise pdtest.Unexpected('Symbol objects', expected, got)
+
+def test():
+    d = tempfile.mkdtemp()
+    try:
+        make_tree(d)
+        testLookup(d)
+        testUnmatched(d)
+        testFoundWhenParsed()
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == '__main__':
+    test()
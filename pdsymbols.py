@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+""" An index of the symbols Pd patches send to and receive from.
+
+    PdSymbols: the senders and receivers of each symbol in a set of patches
+    PdSymbol: a single use of a symbol by an object
+
+Objects which send or receive are found as each patch is parsed, using the
+symbol attributes in pdelement.SYMBOL_OBJECTS, so building the index doesn't
+need another pass over the patches. The index covers a patch and all the
+abstractions it uses, and lookups are a single dict lookup:
+
+    symbols = pdsymbols.PdSymbols.load('main.pd', includes)
+    for sym in symbols.senders('tempo'):
+        print sym
+    for sym in symbols.orphaned_sends():
+        print 'Nothing receives', sym
+
+Each name space is separate (see pdelement), so [send~ x] doesn't send to
+[receive x]. The variables shared by [value] objects are a name space too,
+in which each [value x] is both a sender and a receiver of "x". Names using
+"$0" are local to the patch file they're in, as each patch and its
+sub-patches share one $0; every instance of an abstraction shares the same
+entries. Other dollar args depend on how abstractions are created, so
+they're kept as they're written.
+
+The index is a snapshot of the patches when they're added. Objects changed
+afterwards aren't updated in it."""
+
+import sys
+import getopt
+import pd
+import pdelement
+from pdelement import MESSAGE, SIGNAL, BUS, TABLE, DELAY, VALUE, SEND, \
+                      RECEIVE
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+NAMESPACES = (MESSAGE, SIGNAL, BUS, TABLE, DELAY, VALUE)
+
+# The names GUI objects and atoms use for no symbol
+NO_SYMBOL = (None, '', '-', 'empty')
+
+# The escaped ';' which starts each message a message box sends to a symbol
+MSG_SEMI = '\\;'
+
+LOCAL = '$0'
+
+
+class PdSymbol(object):
+    """The use of the symbol "name" in the name space "namespace" by the
+       PdObject "obj", in the patch file "filename". "role" is SEND or
+       RECEIVE and "scope" is "filename" for names local to the file (using
+       $0), otherwise None."""
+
+    def __init__(self, namespace, role, name, scope, filename, obj):
+        (self.namespace, self.role, self.name) = (namespace, role, name)
+        (self.scope, self.filename, self.obj) = (scope, filename, obj)
+
+    def key(self):
+        return (self.namespace, self.name, self.scope)
+
+    def __str__(self):
+        where = self.filename or '<patch>'
+        if self.obj.line_num is not None:
+            # Line numbers are counted from zero
+            where = '%s:%d' % (where, self.obj.line_num + 1)
+        return '%s: %s %s %s (%s)' % (where, self.namespace, self.role,
+                                      self.name, self.obj.name())
+
+    def __repr__(self):
+        return '<PdSymbol %s>' % str(self)
+
+
+def unescape(name):
+    """Returns the symbol "name" as Pd sees it, without the '\\' before
+       dollar signs in the patch text."""
+
+    return name.replace('\\$', '$')
+
+def _uses(obj):
+    """Yields (name space, role, name) for each symbol used by "obj"."""
+
+    element = obj.element
+    if element == pd.OBJ:
+        attrs = pdelement.SYMBOL_OBJECTS.get(obj.attrs.get('type'), ())
+    elif element == 'msg':
+        # A message box sends to the first word after each "\;"
+        words = [obj.attrs.get('text')] + obj.extra_params
+        for i in range(len(words) - 1):
+            if words[i] == MSG_SEMI:
+                yield (MESSAGE, SEND, words[i + 1])
+        return
+    else:
+        attrs = pdelement.SYMBOL_ELEMENTS.get(element, ())
+
+    for (namespace, role, attr) in attrs:
+        yield (namespace, role, obj.attrs.get(attr))
+
+
+class PdSymbols(object):
+    """The senders and receivers of the symbols used by a set of patches.
+       "files" is an optional dict of filenames to PdFiles to add, such as
+       the dict returned by pd.load_recursive()."""
+
+    def __init__(self, files = None):
+        # (name space, name, scope) to a ([senders], [receivers]) tuple
+        self._index = {}
+        if files:
+            for filename in sorted(files):
+                self.add(files[filename].patch, filename)
+
+    @classmethod
+    def load(cls, filename, includes = None, interner = None):
+        """Returns the PdSymbols of the patch "filename" and every
+           abstraction it uses."""
+
+        return cls(pd.load_recursive(filename, includes,
+                                     interner = interner))
+
+    def add(self, patch, filename = None):
+        """Adds the symbols used by the PdPatch "patch", loaded from
+           "filename"."""
+
+        index = self._index
+        for obj in patch._symbols:
+            for (namespace, role, name) in _uses(obj):
+                if name in NO_SYMBOL:
+                    continue
+                name = unescape(name)
+                scope = None
+                if LOCAL in name:
+                    scope = filename
+                sym = PdSymbol(namespace, role, name, scope, filename, obj)
+                entry = index.get(sym.key())
+                if entry is None:
+                    entry = index[sym.key()] = ([], [])
+                entry[role == RECEIVE].append(sym)
+
+    def _get(self, name, namespace, filename):
+        name = unescape(name)
+        scope = None
+        if LOCAL in name:
+            scope = filename
+        return self._index.get((namespace, name, scope), ([], []))
+
+    def senders(self, name, namespace = MESSAGE, filename = None):
+        """Returns the PdSymbols of the objects which send to "name".
+           "filename" is the patch file names using $0 are local to."""
+
+        return list(self._get(name, namespace, filename)[0])
+
+    def receivers(self, name, namespace = MESSAGE, filename = None):
+        """Returns the PdSymbols of the objects which receive from "name".
+           "filename" is the patch file names using $0 are local to."""
+
+        return list(self._get(name, namespace, filename)[1])
+
+    def names(self, namespace = None):
+        """Returns the sorted (name space, name, scope) keys of the symbols
+           used, optionally only those in "namespace"."""
+
+        return sorted([k for k in self._index \
+                       if namespace is None or k[0] == namespace])
+
+    def orphaned_sends(self, namespace = None):
+        """Returns the PdSymbols of the senders of symbols which nothing
+           receives, e.g. tabread objects using a table that doesn't
+           exist."""
+
+        return self._unmatched(0, namespace)
+
+    def unmatched_receives(self, namespace = None):
+        """Returns the PdSymbols of the receivers of symbols which nothing
+           sends to."""
+
+        return self._unmatched(1, namespace)
+
+    def _unmatched(self, role, namespace):
+        found = []
+        for (key, entry) in self._index.iteritems():
+            if not entry[1 - role] and \
+               (namespace is None or key[0] == namespace):
+                found.extend(entry[role])
+        found.sort(key = lambda s: (s.filename, s.obj.line_num))
+        return found
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, name):
+        # Whether "name" is used in the message name space
+        return (MESSAGE, unescape(name), None) in self._index
+
+
+def usage():
+    print """
+Usage: %s [OPTION]... FILE
+Lists the sends with no receivers and receives with no senders in the Pd
+patch FILE and the abstractions it uses.
+
+Options:
+-i, --include DIR   Search DIR for abstractions and externals. Can be given
+                    more than once.
+-n, --name NAME     Lists the senders and receivers of NAME instead
+-h, --help          Prints this help
+""" % sys.argv[0]
+
+if __name__ == '__main__':
+    import pdincludes
+    try:
+        options, args = getopt.getopt(sys.argv[1:], 'i:n:h',
+                                      ['include=', 'name=', 'help'])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(2)
+
+    (dirs, name) = ([], None)
+    for opt, arg in options:
+        if opt in ('-i', '--include'):
+            dirs.append(arg)
+        elif opt in ('-n', '--name'):
+            name = arg
+        elif opt in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+
+    if len(args) != 1:
+        usage()
+        sys.exit(2)
+
+    symbols = PdSymbols.load(args[0], pdincludes.PdIncludes(dirs))
+    if name is not None:
+        for namespace in NAMESPACES:
+            for sym in symbols.senders(name, namespace) + \
+                       symbols.receivers(name, namespace):
+                print sym
+    else:
+        for sym in symbols.orphaned_sends() + symbols.unmatched_receives():
+            print sym
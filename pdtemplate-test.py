@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+""" Tests for pdtemplate.py """
+
+import pd
+import pdtemplate
+import pdtest
+
+TEMPLATE_TEXT = """#N canvas 0 0 450 300 10;
+#X obj 10 10 osc~ @{freq};
+#N canvas 0 0 450 300 sub 0;
+#X obj 10 10 @{kind} 1 2;
+#X msg 10 40 set @{freq} @{level};
+#X restore 10 40 pd sub;
+#X obj 10 70 dac~;
+#X connect 0 0 2 0;
+"""
+
+def template():
+    return pdtemplate.PdTemplate(pd.PdPatch(TEMPLATE_TEXT.splitlines(True)))
+
+@pdtest.passfail
+def testParams():
+    got = template().params()
+    if got != ['freq', 'kind', 'level']:
+        raise pdtest.Unexpected('params', ['freq', 'kind', 'level'], got)
+
+@pdtest.passfail
+def testRender():
+    t = template()
+    values = {'freq': 440, 'kind': 'mine', 'level': '0.5'}
+    p = t.render(values)
+    text = TEMPLATE_TEXT.replace('@{freq}', '440').replace('@{kind}', 'mine')
+    text = text.replace('@{level}', '0.5')
+    expected = pd.PdPatch(text.splitlines(True))
+    if str(p) != text or p != expected:
+        raise pdtest.Unexpected('render', text, str(p))
+
+    # The objects with parameters are parsed again
+    got = [obj.name() for obj in p._externals]
+    if got != ['mine']:
+        raise pdtest.Unexpected('externals', ['mine'], got)
+    # The rest share their attributes with the template
+    (obj, template_obj) = (p.root()[-2].value, t.patch.root()[-2].value)
+    if obj.attrs is not template_obj.attrs:
+        raise pdtest.Unexpected('shared attrs', True, False)
+    if str(t.patch) != TEMPLATE_TEXT:
+        raise pdtest.Unexpected('template', TEMPLATE_TEXT, str(t.patch))
+
+    # Keyword arguments override the dict
+    p = t.render(values, freq = '220')
+    if str(p).count(' 220') != 2:
+        raise pdtest.Unexpected('freq', 2, str(p).count(' 220'))
+
+@pdtest.passfail
+def testErrors():
+    try:
+        template().render(freq = '440')
+        raise pdtest.Unexpected('missing', 'KeyError', 'no exception')
+    except KeyError:
+        pass
+
+    text = TEMPLATE_TEXT + '#X declare -path @{dir};\n'
+    try:
+        pdtemplate.PdTemplate(pd.PdPatch(text.splitlines(True)))
+        raise pdtest.Unexpected('declare', 'ValueError', 'no exception')
+    except ValueError:
+        pass
+
+def test():
+    testParams()
+    testRender()
+    testErrors()
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+""" Making variants of a Pd patch by filling in parameters.
+
+    PdTemplate: a patch whose objects have parameters, such as "@{freq}",
+                which are filled in to make each variant
+
+Many variants of a patch can be made from a template which is only parsed
+once:
+
+    t = pdtemplate.PdTemplate(pd.PdFile('voice.pd', includes).patch)
+    for freq in ('220', '440', '880'):
+        patch = t.render(freq = freq)
+
+A parameter is a name of letters, digits and "_" between "@{" and "}". It
+can be any part of the text of an object, including its type or position.
+Each variant is a clone of the template's patch (see PdPatch.clone()) in
+which only the objects with parameters are parsed again, with their values
+filled in, so making one costs much less than parsing the patch."""
+
+import re
+import sys
+import pd
+
+__author__ = "Louis A. Dunne"
+__copyright__ = "Copyright 2011, Louis A. Dunne"
+__credits__ = ["Louis A. Dunne"]
+__license__ = "GPL"
+__version__ = "0.2"
+__maintainer__ = "Louis A. Dunne"
+__status__ = "Alpha"
+
+# A parameter, with its name in the group
+PARAM = re.compile(r'@\{(\w+)\}')
+PARAM_START = '@{'
+
+
+class PdTemplate(object):
+    """A PdPatch whose objects have parameters, which render() fills in.
+       The patch mustn't be changed while the template is used. Parameters
+       in struct definitions aren't filled in. Parameters in declares
+       raise ValueError, as changing a declare would change where every
+       object is found."""
+
+    def __init__(self, patch):
+        self.patch = patch
+        # The objects with parameters, and their text
+        self._objects = []
+        names = set()
+        for (node, level) in patch.root():
+            text = str(node.value)
+            if PARAM_START not in text:
+                continue
+            found = PARAM.findall(text)
+            if not found:
+                continue
+            if node.value.is_declare():
+                raise ValueError('Parameters can\'t be used in declares: ' \
+                                 '"%s"' % text)
+            names.update(found)
+            self._objects.append((node.value, text))
+        self._names = sorted(names)
+
+    def params(self):
+        """Returns the sorted names of the parameters of the template."""
+
+        return list(self._names)
+
+    def render(self, values = None, **kwargs):
+        """Returns a new PdPatch made from the template with each parameter
+           replaced by its value, from the dict "values" or the keyword
+           arguments. Values are converted with str() and put in the text as
+           they are, so any ';', ',' or '$' in them must be escaped as in a
+           patch file. Raises KeyError for a parameter without a value."""
+
+        if values is None:
+            values = kwargs
+        elif kwargs:
+            values = dict(values)
+            values.update(kwargs)
+
+        def value(match):
+            return str(values[match.group(1)])
+
+        includes = self.patch.includes
+        replace = {}
+        for (obj, text) in self._objects:
+            replace[obj] = pd.PdObject(PARAM.sub(value, text), obj.line_num,
+                                       includes)
+        return self.patch.clone(replace)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print 'Usage: %s FILE [NAME=VALUE]...' % sys.argv[0]
+        print 'Prints the Pd patch FILE with each parameter @{NAME} ' \
+              'replaced by VALUE.'
+        sys.exit(2)
+
+    t = PdTemplate(pd.PdFile(sys.argv[1]).patch)
+    values = dict([arg.split('=', 1) for arg in sys.argv[2:]])
+    try:
+        sys.stdout.write(str(t.render(values)))
+    except KeyError, ex:
+        print >> sys.stderr, 'No value given for %s' % ex
+        sys.exit(1)
@@ -5,7 +5,7 @@ though does not have any actual dependency on the rest of the Pd code. There's
 no need for this code to understand anything about Pd."""
 
 import collections
-import pdtest
+import hashlib
 
 # TODO
 #
@@ -18,8 +18,16 @@ class SimpleTree(object):
     node classes and uses a single class for both. All nodes in the tree are
     instances of Simpletree."""
 
+    # There's one of these for every object in a patch
+    __slots__ = ('parent', 'value', '_children', '_digest')
+
+    # See freeze()
+    frozen = False
+
     def __init__(self, value = None, parent = None):
         (self.parent, self.value, self._children) = (parent, value, [])
+        # The digest of this node and the nodes below it, see digest()
+        self._digest = None
 
     def __len__(self):
         return len(self._children)
@@ -33,22 +41,78 @@ class SimpleTree(object):
 
     def add(self, value):
         tree = SimpleTree(value, parent = self)
+        self._changed()
         self._children.append(tree)
         return tree
 
     def addBranch(self, tree):
         tree.parent = self
+        self._changed()
         self._children.append(tree)
 
     def insert(self, i, value):
         tree = SimpleTree(value, parent = self)
+        self._changed()
         self._children.insert(i, tree)
         return tree
 
     def insertBranch(self, i, tree):
         tree.parent = self
+        self._changed()
         self._children.insert(i, tree)
 
+    def remove(self, i):
+        """Removes the child at index "i" and returns it."""
+
+        self._changed()
+        tree = self._children.pop(i)
+        tree.parent = None
+        return tree
+
+    def digest(self, fn = str):
+        """Returns a SHA-1 digest (as a string of bytes) of the values of
+           this node and all the nodes below it, in order. "fn" returns the
+           string used for each value. The digests of nodes with children
+           are kept until the node, or a node below it, is changed, so
+           finding the digest again is O(1). The same "fn" must be used for
+           every call, since the digests are kept whichever is used.
+
+           Changing a node's value in place isn't seen by the tree, so
+           invalidate() must be called on the node when that happens."""
+
+        if self._digest is not None:
+            return self._digest
+
+        h = hashlib.sha1('V%d:%s' % (len(self._children), fn(self.value)))
+        for child in self._children:
+            if child._children:
+                # Child digests are a fixed size
+                h.update('B' + child.digest(fn))
+            else:
+                # Leaf digests aren't kept, the leaf values are hashed here
+                text = fn(child.value)
+                h.update('L%d:%s' % (len(text), text))
+        self._digest = h.digest()
+        return self._digest
+
+    def _changed(self):
+        # Called before a child is added. If a node has no digest neither
+        # has any node above it, so there's nothing to do, unless it's a
+        # leaf whose value is part of its parent's digest. This keeps
+        # building a tree cheap.
+        if self._digest is not None or not self._children:
+            self.invalidate()
+
+    def invalidate(self):
+        """Drops the digests of this node and the nodes above it. Call this
+           when the value of the node changes."""
+
+        self._digest = None
+        node = self.parent
+        while node is not None and node._digest is not None:
+            node._digest = None
+            node = node.parent
+
     def leaf(self):
         return self._children == []
 
@@ -83,3 +147,103 @@ class SimpleTree(object):
         for (node, level) in self:
             fn(node, level)
 
+    def copy(self, fn = None, parent = None):
+        """Returns a copy of this node and the nodes below it, made of
+           SimpleTree nodes whatever the class of the nodes copied. The
+           value of each new node is fn(value, node), where "node" is the new
+           node, or the same value if "fn" isn't given. "fn" is called for
+           each node in the order they're iterated. The digests are kept, so
+           "fn" must return values with the same content."""
+
+        tree = SimpleTree(None, parent)
+        if fn is None:
+            tree.value = self.value
+        else:
+            tree.value = fn(self.value, tree)
+        tree._digest = self._digest
+        children = tree._children
+        for child in self._children:
+            if child._children:
+                children.append(child.copy(fn, tree))
+            else:
+                leaf = SimpleTree(None, tree)
+                if fn is None:
+                    leaf.value = child.value
+                else:
+                    leaf.value = fn(child.value, leaf)
+                children.append(leaf)
+        return tree
+
+    def freeze(self, fn = str):
+        """Makes this node and every node below it a FrozenTree, which
+           can't be changed, after loading any LazyTree nodes and working out
+           the digests with "fn". A frozen tree is only read, so it can be
+           used by many threads at once."""
+
+        self.digest(fn)
+        for (node, level) in self:
+            if isinstance(node, LazyTree):
+                node.__class__ = _FrozenLazyTree
+            else:
+                node.__class__ = FrozenTree
+
+
+# The slot holding a node's children, used by LazyTree below
+_CHILDREN = SimpleTree._children
+
+
+class LazyTree(SimpleTree):
+    """A node whose children aren't added until they're first used. Then
+    "load" is called with the node, and adds them as usual. Anything which
+    looks at the children, including iterating over the tree or taking its
+    digest, loads them. A LazyTree is never a leaf."""
+
+    __slots__ = ('_load',)
+
+    def __init__(self, value, load, parent = None):
+        (self.parent, self.value, self._digest) = (parent, value, None)
+        self._load = load
+
+    def _get_children(self):
+        try:
+            return _CHILDREN.__get__(self, LazyTree)
+        except AttributeError:
+            # Children are added to an empty list, and the loader is only
+            # called once
+            _CHILDREN.__set__(self, [])
+            (load, self._load) = (self._load, None)
+            load(self)
+            return _CHILDREN.__get__(self, LazyTree)
+
+    def _set_children(self, children):
+        _CHILDREN.__set__(self, children)
+
+    _children = property(_get_children, _set_children)
+
+    def loaded(self):
+        """Returns True if the children have been loaded."""
+
+        return self._load is None
+
+    def leaf(self):
+        return self.loaded() and SimpleTree.leaf(self)
+
+
+class FrozenTree(SimpleTree):
+    """A node of a tree which has been frozen, see SimpleTree.freeze().
+       Anything which would change the tree raises TypeError."""
+
+    # The same slots as SimpleTree, so nodes can be changed to this class
+    __slots__ = ()
+
+    frozen = True
+
+    def _frozen(self, *args):
+        raise TypeError('The tree is frozen and can\'t be changed')
+
+    add = addBranch = insert = insertBranch = remove = invalidate = _frozen
+
+
+class _FrozenLazyTree(FrozenTree, LazyTree):
+    # A frozen LazyTree, whose children have all been loaded
+    __slots__ = ()